@@ -0,0 +1,147 @@
+"""Measures how long a large paste blocks the code input.
+
+Usage: QT_QPA_PLATFORM=offscreen python benchmark_paste.py [--lines N]
+
+Pastes `--lines` lines of Python (20000 by default) into a code input
+with the highlighter and the collaborative editor attached like in the
+home window, then types one character into it. Every turn of the event
+loop is timed until the worker's tokens are applied, a turn longer than
+16 ms drops a frame at 60 Hz.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+import qasync
+from collab import CollaborativeEditor
+from PyQt5 import QtCore, QtGui, QtWidgets
+from views.highlighter import Highlighter
+
+FRAME = 0.016
+SOURCE = '''\
+def solve(numbers: list[int], target: int) -> tuple[int, int]:
+    """Finds the two numbers adding up to the target."""
+    seen = {}
+    for index, number in enumerate(numbers):
+        if target - number in seen:
+            return seen[target - number], index
+        seen[number] = index
+    raise ValueError(f"no two numbers add up to {target}")
+
+'''
+
+
+class Sink:
+    """Drops the edits the collaborative editor sends."""
+
+    async def send(self, message):
+        """Drops a message."""
+
+
+class Frames:
+    """Times every turn of the event loop."""
+
+    def __init__(self):
+        self.durations: List[float] = []
+        self._last = time.perf_counter()
+        self._timer = QtCore.QTimer()
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self.tick)
+
+    def tick(self):
+        """Records the time since the previous turn."""
+        now = time.perf_counter()
+        self.durations.append(now - self._last)
+        self._last = now
+
+    def start(self):
+        """Starts timing from now."""
+        self.durations = []
+        self._last = time.perf_counter()
+        self._timer.start()
+
+    def stop(self):
+        """Stops timing."""
+        self._timer.stop()
+
+
+async def settle(highlighter: Highlighter):
+    """Waits until the worker's tokens of the current text are applied."""
+    while highlighter._tokenizing or highlighter._queue:
+        await asyncio.sleep(0.001)
+
+
+async def measure(name: str, highlighter: Highlighter, frames: Frames, edit: Callable[[], None]):
+    """Times an edit and the frames until it is highlighted."""
+    queued = 0
+    on_tokenized = highlighter.on_tokenized
+
+    def count(future: asyncio.Future):
+        nonlocal queued
+        on_tokenized(future)
+        queued += len(highlighter._queue)
+
+    highlighter.on_tokenized = count
+    started = time.perf_counter()
+    frames.start()
+    edit()
+    edited = time.perf_counter()
+    await settle(highlighter)
+    frames.stop()
+    del highlighter.on_tokenized
+
+    durations = frames.durations or [0.0]
+    highlighted = time.perf_counter() - started
+    print(
+        f"{name}: edit {(edited - started) * 1000:.1f}ms, highlighted after {highlighted * 1000:.0f}ms,"
+        f" {queued} blocks rehighlighted with the worker's tokens"
+    )
+    print(
+        f"    {len(durations)} frames, {sum(duration > FRAME for duration in durations)} over 16ms,"
+        f" p50={statistics.median(durations) * 1000:.1f}ms"
+        f" p99={sorted(durations)[int(len(durations) * 0.99)] * 1000:.1f}ms max={max(durations) * 1000:.1f}ms"
+    )
+
+
+async def run(lines: int):
+    """Pastes into a code input and types into it."""
+    editor = QtWidgets.QTextEdit()
+    editor.resize(800, 600)
+    editor.show()
+    highlighter = Highlighter(editor)
+    collaboration = CollaborativeEditor(editor, Sink())
+    collaboration.level = 1
+    frames = Frames()
+    await settle(highlighter)
+
+    text = (SOURCE * (lines // SOURCE.count("\n") + 1)).split("\n")[:lines]
+    cursor = QtGui.QTextCursor(editor.document())
+    await measure(f"paste {lines} lines", highlighter, frames, lambda: cursor.insertText("\n".join(text)))
+
+    cursor.setPosition(len(SOURCE) * 3 + 8)
+    await measure("type one character", highlighter, frames, lambda: cursor.insertText("x"))
+
+    Highlighter.executor().shutdown()
+
+
+def main():
+    """Runs the benchmark in a Qt event loop."""
+    parser = argparse.ArgumentParser(description="Measures how long a large paste blocks the code input.")
+    parser.add_argument("--lines", type=int, default=20_000, help="Lines pasted.")
+    arguments = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    with loop:
+        loop.run_until_complete(run(arguments.lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+if TYPE_CHECKING:
+    from connection import WebsocketConnection
+
+# fmt: off
+__all__ = (
+    'Sequence',
+    'CollaborativeEditor',
+)
+# fmt: on
+
+Position = Tuple[Tuple[int, int], ...]
+
+BASE = 2**32
+BOUNDARY = 2**10
+
+
+def allocate(left: Position, right: Position, site: int, count: int = 1) -> Position:
+    """Allocates position identifiers between two others.
+
+    Positions are sequences of `(digit, site)` pairs compared
+    lexicographically, so any two distinct positions can always
+    fit new ones between them by going one level deeper.
+
+    :param left: The position before the new ones, `()` for the start.
+    :param right: The position after the new ones.
+    :param site: The site id of the replica allocating the positions.
+    :param count: The amount of positions, see `expand`.
+    :return: The first of `count` positions strictly between `left` and `right`.
+    """
+    position = []
+    bounded = True
+    depth = 0
+    while True:
+        low = left[depth] if depth < len(left) else (0, 0)
+        high = right[depth] if bounded and depth < len(right) else (BASE, 0)
+
+        if high[0] - low[0] > count:
+            digit = random.randint(low[0] + 1, min(high[0] - count, low[0] + BOUNDARY))
+            position.append((digit, site))
+            return tuple(position)
+
+        position.append(low)
+        bounded = bounded and low == high
+        depth += 1
+
+
+def expand(position: Position, count: int) -> List[Position]:
+    """Gets the positions of a run of characters inserted together.
+
+    The characters of a run take consecutive digits at the last
+    level of the position of the first one, so a paste is sent
+    as one operation instead of one per character.
+
+    :param position: The position of the first character.
+    :param count: The length of the run.
+    """
+    *prefix, (digit, site) = position
+    return [(*prefix, (digit + offset, site)) for offset in range(count)]
+
+
+def encode(position: Position) -> List[List[int]]:
+    """Encodes a position to be sent as JSON."""
+    return [list(pair) for pair in position]
+
+
+def decode(raw: List[List[int]]) -> Position:
+    """Decodes a position received as JSON."""
+    return tuple((digit, site) for digit, site in raw)
+
+
+class Sequence:
+    """A replicated character sequence (Logoot).
+
+    Every character has a unique, ordered position identifier,
+    so concurrent inserts and deletes from different replicas
+    commute and all replicas converge on the same text.
+
+    :param site: The site id of this replica.
+    """
+
+    END: Position = ((BASE, 0),)
+
+    def __init__(self, site: int):
+        self.site = site
+        self.positions: List[Position] = []
+        self.chars: List[str] = []
+
+    @property
+    def text(self) -> str:
+        """The text of the sequence."""
+        return "".join(self.chars)
+
+    def seed(self, text: str) -> List[List[Any]]:
+        """Replaces the sequence with `text`.
+
+        The positions carry the site id like any other insert, the
+        server keeps the first seed of a room and resynchronises
+        the replicas that seeded it concurrently.
+
+        :param text: The text to seed.
+        :return: The insert operations of the seed.
+        """
+        self.positions = []
+        self.chars = []
+        return self.insert(0, text)
+
+    def load(self, document: List[List[Any]]):
+        """Replaces the sequence with a snapshot.
+
+        :param document: Ordered `[position, char]` pairs.
+        """
+        self.positions = [decode(position) for position, _ in document]
+        self.chars = [char for _, char in document]
+
+    def insert(self, index: int, text: str) -> List[List[Any]]:
+        """Inserts text locally.
+
+        :param index: The index to insert at.
+        :param text: The text to insert.
+        :return: The insert operation to send.
+        """
+        if not text:
+            return []
+
+        left = self.positions[index - 1] if index else ()
+        right = self.positions[index] if index < len(self.positions) else self.END
+        position = allocate(left, right, self.site, len(text))
+
+        self.positions[index:index] = expand(position, len(text))
+        self.chars[index:index] = text
+        return [["i", encode(position), text]]
+
+    def delete(self, index: int, count: int) -> List[List[Any]]:
+        """Deletes text locally.
+
+        :param index: The index of the first character to delete.
+        :param count: The amount of characters to delete.
+        :return: The delete operations to send.
+        """
+        ops = [["d", encode(position)] for position in self.positions[index:index + count]]
+        del self.positions[index:index + count]
+        del self.chars[index:index + count]
+        return ops
+
+    def apply_insert(self, position: Position, text: str) -> List[Tuple[int, str]]:
+        """Applies a remote insert.
+
+        :return: The `(index, text)` runs inserted, none if it was already applied.
+        """
+        positions = expand(position, len(text))
+        index = bisect_left(self.positions, positions[0])
+        if index == len(self.positions) or self.positions[index] > positions[-1]:
+            # Nothing was inserted inside the run, as with most pastes.
+            self.positions[index:index] = positions
+            self.chars[index:index] = text
+            return [(index, text)]
+
+        runs: List[Tuple[int, str]] = []
+        for position, char in zip(positions, text):
+            index = bisect_left(self.positions, position)
+            if index < len(self.positions) and self.positions[index] == position:
+                continue
+            self.positions.insert(index, position)
+            self.chars.insert(index, char)
+            if runs and runs[-1][0] + len(runs[-1][1]) == index:
+                runs[-1] = (runs[-1][0], runs[-1][1] + char)
+            else:
+                runs.append((index, char))
+        return runs
+
+    def apply_delete(self, position: Position) -> Optional[int]:
+        """Applies a remote delete.
+
+        :return: The index deleted or None if it was already deleted.
+        """
+        index = bisect_left(self.positions, position)
+        if index == len(self.positions) or self.positions[index] != position:
+            return None
+        del self.positions[index]
+        del self.chars[index]
+        return index
+
+
+class CollaborativeEditor(QtCore.QObject):
+    """Synchronises a code input with everyone on the same level.
+
+    Local edits are turned into insert/delete operations on a
+    `Sequence` and sent in one batch per frame, so the bandwidth
+    used is proportional to the size of the edit.
+
+    :param code_input: The code input to synchronise.
+    :param connection: The websocket connection to send edits with.
+    :attr FRAME_INTERVAL: Milliseconds between two sent batches.
+    """
+
+    FRAME_INTERVAL = 16
+
+    def __init__(self, code_input: QtWidgets.QTextEdit, connection: WebsocketConnection):
+        super().__init__(code_input)
+        self.document = code_input.document()
+        self.connection = connection
+
+        self.sequence = Sequence(random.randint(1, 2**31))
+        self.level: Optional[int] = None
+        self.joining: Optional[int] = None
+        self.resyncing = False
+        self.pending: List[List[Any]] = []
+        self._applying = False
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.FRAME_INTERVAL)
+        self._timer.timeout.connect(self.flush)
+
+        self.document.contentsChange.connect(self.on_contents_change)
+
+    def leave(self):
+        """Stops synchronising before the code input is replaced."""
+        self.flush()
+        self.level = None
+        self.joining = None
+        self.resyncing = False
+
+    def join(self, level: int):
+        """Requests the shared code input of a level.
+
+        Local edits are not synchronised until the snapshot arrives.
+
+        :param level: The level opened.
+        """
+        self.joining = level
+        self._send({"op": 2, "data": {"level": level}})
+
+    def resync(self, data):
+        """Requests the snapshot of the level room again.
+
+        The server dropped some of our edits, so the code input
+        is replaced with the room's, discarding the edits made
+        until the snapshot arrives.
+
+        :param data: The level and why the edits were dropped.
+        """
+        if data["level"] != self.level:
+            return
+
+        self._timer.stop()
+        self.pending.clear()
+        self.level = None
+        self.resyncing = True
+        self.join(data["level"])
+
+    def load_snapshot(self, data):
+        """Replaces the code input with the snapshot of the level room.
+
+        Seeds the room if nobody has opened the level yet.
+
+        :param data: The level and its ordered `[position, char]` pairs.
+        """
+        if data["level"] != self.joining:
+            return
+        self.level, self.joining = self.joining, None
+        resyncing, self.resyncing = self.resyncing, False
+
+        if not data["document"] and not resyncing:
+            ops = self.sequence.seed(self.document.toPlainText())
+            if ops:
+                self._send({"op": 1, "data": {"level": self.level, "ops": ops, "seed": True}})
+            return
+
+        self.sequence.load(data["document"])
+        self._applying = True
+        try:
+            self.document.setPlainText(self.sequence.text)
+        finally:
+            self._applying = False
+
+    def apply_remote(self, data):
+        """Applies edits made by another user.
+
+        :param data: The level and the batch of operations.
+        """
+        if data["level"] != self.level:
+            return
+
+        cursor = QtGui.QTextCursor(self.document)
+        self._applying = True
+        try:
+            for op in data["ops"]:
+                if op[0] == "i":
+                    for index, text in self.sequence.apply_insert(decode(op[1]), op[2]):
+                        cursor.setPosition(index)
+                        cursor.insertText(text)
+                else:
+                    index = self.sequence.apply_delete(decode(op[1]))
+                    if index is not None:
+                        cursor.setPosition(index)
+                        cursor.deleteChar()
+        finally:
+            self._applying = False
+
+    def on_contents_change(self, position: int, removed: int, added: int):
+        """Turns a local change of the document into operations.
+
+        Qt reports formatting changes and whole-document replacements
+        as removing and re-adding text, so only the part that actually
+        differs from the sequence is turned into operations.
+        """
+        if self._applying or self.level is None:
+            return
+
+        old = "".join(self.sequence.chars[position:position + removed])
+
+        cursor = QtGui.QTextCursor(self.document)
+        cursor.setPosition(position)
+        cursor.setPosition(
+            min(position + added, self.document.characterCount() - 1),
+            QtGui.QTextCursor.KeepAnchor,
+        )
+        new = cursor.selectedText().replace("\u2029", "\n")
+        if old == new:
+            return
+
+        prefix = 0
+        while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        while (
+            suffix < min(len(old), len(new)) - prefix
+            and old[len(old) - suffix - 1] == new[len(new) - suffix - 1]
+        ):
+            suffix += 1
+
+        start = position + prefix
+        self.pending.extend(self.sequence.delete(start, len(old) - prefix - suffix))
+        self.pending.extend(self.sequence.insert(start, new[prefix:len(new) - suffix]))
+
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """Sends the operations batched during the current frame."""
+        self._timer.stop()
+        if not self.pending or self.level is None:
+            return
+
+        ops, self.pending = self.pending, []
+        self._send({"op": 1, "data": {"level": self.level, "ops": ops}})
+
+    def _send(self, message):
+        asyncio.ensure_future(self.connection.send(message))
@@ -5,6 +5,7 @@ from dataclasses import dataclass
 from typing import TYPE_CHECKING, Any, Dict
 
 from aiohttp import ClientSession, ClientWebSocketResponse, WSMsgType
+from tracing import tracer
 
 if TYPE_CHECKING:
     from views import home
@@ -22,29 +23,42 @@ class WebsocketConnection:
     """Dataclass to hold information about the WebSocket connection.
 
     :param username: The username of the user.
+    :param token: The token authenticating the user.
     :param session: The session used to make requests.
     :param websocket: The websocket handler.
     """
 
     username: str
+    token: str
     session: ClientSession
     websocket: WebsocketHandler
 
     def __init__(
-        self, *, username: str, session: ClientSession, websocket: WebsocketHandler
+        self,
+        *,
+        username: str,
+        token: str,
+        session: ClientSession,
+        websocket: WebsocketHandler,
     ) -> None:
         self.username = username
+        self.token = token
         self.session = session
         self.websocket = websocket
 
     async def send(self, message: Dict[Any, Any]) -> None:
         """Sends a message though the WebSocket connection.
 
-        Shorthand for calling `self.connection.websocket.socket.send_json`
+        Shorthand for calling `self.connection.websocket.socket.send_json`.
+        Starts a trace unless one is current, and passes its
+        context to the server in the message envelope.
 
         :param message: The message to send.
         """
-        await self.websocket.socket.send_json(message)
+        with tracer.span("client.send", op=message.get("op")) as span:
+            if span is not None:
+                message = {**message, "trace": span.context}
+            await self.websocket.socket.send_json(message)
 
 
 class WebsocketHandler:
@@ -53,9 +67,26 @@ class WebsocketHandler:
     :param websocket: The raw websocket connection.
     :attr MESSAGE: The message opcode indiciating a user
                 sent a message in the chatbox.
+    :attr EDIT: The opcode indicating a user on the same level
+                edited the shared code input.
+    :attr SNAPSHOT: The opcode carrying the shared code input
+                of the level that was opened.
+    :attr OUTPUT: The opcode carrying a chunk of output
+                of the running code.
+    :attr EXIT: The opcode indicating the code finished running.
+    :attr DIRECT_MESSAGE: The opcode carrying a message sent
+                directly to or by the user.
+    :attr RESYNC: The opcode indicating the server dropped edits
+                of the user to the shared code input.
     """
 
     MESSAGE = 0
+    EDIT = 1
+    SNAPSHOT = 2
+    OUTPUT = 4
+    EXIT = 5
+    DIRECT_MESSAGE = 7
+    RESYNC = 8
 
     def __init__(
         self,
@@ -83,8 +114,21 @@ class WebsocketHandler:
         """
         op = data.get("op")
 
-        if op == self.MESSAGE:
-            home_window.append_message(**data["data"])
+        with tracer.continue_trace(data.get("trace"), "client.receive", op=op):
+            if op == self.MESSAGE:
+                home_window.append_message(data["data"]["message"], data["data"].get("author"))
+            elif op == self.EDIT:
+                home_window.widgets.collaboration.apply_remote(data["data"])
+            elif op == self.SNAPSHOT:
+                home_window.widgets.collaboration.load_snapshot(data["data"])
+            elif op == self.OUTPUT:
+                home_window.receive_output(data["data"])
+            elif op == self.EXIT:
+                home_window.finish_run(data["data"])
+            elif op == self.DIRECT_MESSAGE:
+                home_window.receive_direct_message(data["data"])
+            elif op == self.RESYNC:
+                home_window.resync(data["data"])
 
     async def listen(self, home_window: home.Window):
         """Listens to incoming websocket messages.
@@ -25,6 +25,12 @@ ALL_THEMES = [
     "yellow",
 ]
 
+# The maximum amount of code output characters kept in the code output.
+OUTPUT_LIMIT = 100_000
+
+# Chat messages starting with this and a username are only sent to that user.
+DIRECT_MESSAGE_PREFIX = "/w "
+
 
 # REGEX
 
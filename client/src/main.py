@@ -1,6 +1,9 @@
 import asyncio
+import logging
+import os
 import sys
 
+import profiling
 import qasync
 from aiohttp import ClientSession, ClientTimeout
 from views import login
@@ -13,14 +16,43 @@ async def main():
         timeout=ClientTimeout(total=10),
     )
 
+    profiler = profiling.get_profiler()
+    if profiler is not None:
+        profiler.start()
+
     login_window = login.Window(session)
     login_window.show()
 
     await asyncio.Future()
 
 
+def trace_path():
+    """Gets the profiling trace path from the CLI or environment.
+
+    Profiling is enabled with `--profile[=path]` or by setting
+    the `CJ9_PROFILE` environment variable to the trace path.
+
+    :return: The trace path or None if profiling is disabled.
+    """
+    for argument in sys.argv[1:]:
+        if argument == "--profile":
+            return profiling.DEFAULT_TRACE_PATH
+        if argument.startswith("--profile="):
+            return argument.split("=", 1)[1]
+    return os.environ.get(profiling.PROFILE_ENV) or None
+
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    path = trace_path()
+    if path is not None:
+        profiler = profiling.enable(path)
+        app = profiling.ProfiledApplication(sys.argv)
+
     try:
         qasync.run(main())
     except asyncio.CancelledError:
         sys.exit(0)
+    finally:
+        if path is not None:
+            profiler.write()
@@ -0,0 +1,69 @@
+from typing import Optional
+
+# fmt: off
+__all__ = (
+    'Problem',
+    'check',
+)
+# fmt: on
+
+
+class Problem:
+    """A reason code cannot run, found without running it.
+
+    Lines and columns start at 1, like in Python's tracebacks.
+
+    :param kind: The exception name, e.g. `IndentationError`.
+    :param message: What is wrong.
+    :param line: The line of the problem.
+    :param column: The column the problem starts at.
+    :param end_line: The line the problem ends on.
+    :param end_column: The column after the problem, None to mark until the end of the line.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        message: str,
+        *,
+        line: int,
+        column: int,
+        end_line: Optional[int] = None,
+        end_column: Optional[int] = None,
+    ):
+        self.kind = kind
+        self.message = message
+        self.line = line
+        self.column = column
+        self.end_line = end_line or line
+        self.end_column = end_column
+
+    def __str__(self) -> str:
+        return f"{self.kind}: {self.message} (line {self.line})"
+
+
+def check(code: str) -> Optional[Problem]:
+    """Compiles code without running it.
+
+    Besides syntax errors this finds the errors only the compiler
+    reports, like `return` outside of a function.
+
+    :param code: The code to check.
+    :return: The first problem, None if the code compiles.
+    """
+    try:
+        compile(code, "code.py", "exec", dont_inherit=True)
+    except SyntaxError as error:
+        end_column = getattr(error, "end_offset", None)
+        return Problem(
+            type(error).__name__,
+            error.msg,
+            line=error.lineno or 1,
+            column=error.offset or 1,
+            end_line=getattr(error, "end_lineno", None),
+            end_column=end_column if end_column and end_column > 0 else None,
+        )
+    except ValueError as error:
+        # Raised for source containing null bytes.
+        return Problem(type(error).__name__, str(error), line=1, column=1)
+    return None
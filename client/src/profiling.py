@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from PyQt5 import QtCore, QtWidgets
+from qasync import asyncSlot as _asyncSlot
+
+# fmt: off
+__all__ = (
+    'Profiler',
+    'ProfiledApplication',
+    'PROFILE_ENV',
+    'enable',
+    'get_profiler',
+    'async_slot',
+    'timed',
+)
+# fmt: on
+
+log = logging.getLogger(__name__)
+
+PROFILE_ENV = "CJ9_PROFILE"
+DEFAULT_TRACE_PATH = "client-trace.json"
+
+_profiler: Optional[Profiler] = None
+
+
+def _now_us() -> float:
+    """The current monotonic time in microseconds."""
+    return time.perf_counter() * 1_000_000
+
+
+class Profiler:
+    """Collects timings of the client's event loop and Qt handlers.
+
+    Spans are kept in memory in the Chrome trace event format and
+    written out by `write`, so the resulting file can be opened in
+    `chrome://tracing` or Perfetto.
+
+    :param path: The path the trace file is written to.
+    :param lag_interval: Seconds between two event loop lag samples.
+    :param max_events: The maximum amount of trace events kept in memory.
+    :param slowest: The amount of slowest frames to report.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_TRACE_PATH,
+        *,
+        lag_interval: float = 0.05,
+        max_events: int = 200_000,
+        slowest: int = 20,
+    ):
+        self.path = path
+        self.lag_interval = lag_interval
+        self.slowest = slowest
+
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self.counts: Counter[str] = Counter()
+        self.durations: Dict[str, float] = defaultdict(float)
+        self.slowest_frames: List[Tuple[float, str, float]] = []
+
+        self._pid = os.getpid()
+        self._lag_task: Optional[asyncio.Task] = None
+
+    def record(self, name: str, start: float, duration: float, *, category: str):
+        """Records a finished span.
+
+        :param name: The name of the span.
+        :param start: The start of the span in microseconds.
+        :param duration: The duration of the span in microseconds.
+        :param category: The category shown in the trace viewer.
+        """
+        self.counts[name] += 1
+        self.durations[name] += duration
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start,
+                "dur": duration,
+                "pid": self._pid,
+                "tid": threading.get_ident(),
+            }
+        )
+
+        frame = (duration, name, start)
+        if len(self.slowest_frames) < self.slowest:
+            heapq.heappush(self.slowest_frames, frame)
+        elif frame > self.slowest_frames[0]:
+            heapq.heapreplace(self.slowest_frames, frame)
+
+    def start(self):
+        """Starts sampling the event loop lag."""
+        if self._lag_task is None:
+            self._lag_task = asyncio.ensure_future(self._sample_lag())
+
+    async def _sample_lag(self):
+        """Measures how late the event loop wakes up a sleeping task."""
+        while True:
+            expected = time.perf_counter() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag = max(time.perf_counter() - expected, 0.0) * 1_000_000
+
+            self.events.append(
+                {
+                    "name": "event loop lag",
+                    "ph": "C",
+                    "ts": _now_us(),
+                    "pid": self._pid,
+                    "args": {"lag_ms": lag / 1000},
+                }
+            )
+            if lag >= 16_000:
+                self.record("event loop stall", _now_us() - lag, lag, category="loop")
+
+    def summary(self) -> Dict[str, Any]:
+        """Summarises the recorded spans.
+
+        :return: Counts and total durations per span name
+                 along with the slowest frames.
+        """
+        return {
+            "spans": {
+                name: {"count": count, "total_ms": self.durations[name] / 1000}
+                for name, count in self.counts.most_common()
+            },
+            "slowest_frames": [
+                {"name": name, "ts": start, "dur_ms": duration / 1000}
+                for duration, name, start in sorted(self.slowest_frames, reverse=True)
+            ],
+        }
+
+    def write(self):
+        """Writes the trace file."""
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+
+        with open(self.path, "w") as file:
+            json.dump(
+                {
+                    "traceEvents": list(self.events),
+                    "displayTimeUnit": "ms",
+                    "otherData": self.summary(),
+                },
+                file,
+            )
+        log.info("Profiling trace written to %s", self.path)
+
+
+class ProfiledApplication(QtWidgets.QApplication):
+    """A `QApplication` timing every Qt event it delivers.
+
+    Has to be created before `qasync.run` so the event loop
+    picks it up as the application instance.
+    """
+
+    def notify(self, receiver: QtCore.QObject, event: QtCore.QEvent) -> bool:
+        """Delivers the event and records how long the handler took."""
+        if _profiler is None:
+            return super().notify(receiver, event)
+
+        start = _now_us()
+        try:
+            return super().notify(receiver, event)
+        finally:
+            duration = _now_us() - start
+            if duration >= 100:
+                name = f"{type(receiver).__name__}.{event.type()}"
+                if receiver.objectName():
+                    name += f" ({receiver.objectName()})"
+                _profiler.record(name, start, duration, category="qt")
+
+
+def enable(path: str = DEFAULT_TRACE_PATH) -> Profiler:
+    """Enables profiling for the rest of the program.
+
+    :param path: The path the trace file is written to.
+    :return: The enabled profiler.
+    """
+    global _profiler
+
+    _profiler = Profiler(path)
+    return _profiler
+
+
+def get_profiler() -> Optional[Profiler]:
+    """Gets the enabled profiler, if any."""
+    return _profiler
+
+
+def timed(func: Callable) -> Callable:
+    """Records the duration of every call to `func` while profiling."""
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _profiler is None:
+            return func(*args, **kwargs)
+
+        start = _now_us()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _profiler.record(name, start, _now_us() - start, category="handler")
+
+    return wrapper
+
+
+def async_slot(*slot_args, **slot_kwargs) -> Callable:
+    """`qasync.asyncSlot` recording the duration of every slot call."""
+
+    def decorator(func: Callable) -> Callable:
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return await func(*args, **kwargs)
+
+            start = _now_us()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _profiler.record(name, start, _now_us() - start, category="slot")
+
+        return _asyncSlot(*slot_args, **slot_kwargs)(wrapper)
+
+    return decorator
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+
+from aiohttp import ClientError
+
+if TYPE_CHECKING:
+    from connection import WebsocketConnection
+
+# fmt: off
+__all__ = (
+    'ProgressStore',
+    'ProgressSync',
+)
+# fmt: on
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS completed_levels (
+    username TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    completed_at REAL NOT NULL,
+    synced INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, level)
+);
+CREATE TABLE IF NOT EXISTS best_runs (
+    username TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    synced INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, level)
+);
+CREATE TABLE IF NOT EXISTS drafts (
+    username TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    code TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (username, level)
+);
+"""
+
+
+class ProgressStore:
+    """Stores the progress of a user on disk.
+
+    Completed levels are also kept in memory as a set, so progress
+    checks never touch the disk or the network.
+
+    :param username: The user the progress belongs to.
+    :param path: The path of the SQLite database.
+    """
+
+    def __init__(self, username: str, path: str = "progress.db"):
+        self.username = username
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+        self.completed: Set[int] = {
+            level
+            for level, in self.db.execute(
+                "SELECT level FROM completed_levels WHERE username=?", (username,)
+            )
+        }
+
+    def is_unlocked(self, level: int) -> bool:
+        """Whether a level was completed or is the next one to complete.
+
+        :param level: The level to check.
+        """
+        if not self.completed:
+            return False
+        return level in self.completed or level == max(self.completed) + 1
+
+    def complete(self, level: int):
+        """Marks a level as completed.
+
+        :param level: The completed level.
+        """
+        if level in self.completed:
+            return
+        self.completed.add(level)
+        with self.db:
+            self.db.execute(
+                "INSERT OR IGNORE INTO completed_levels (username, level, completed_at) VALUES (?, ?, ?)",
+                (self.username, level, time.time()),
+            )
+
+    def record_run(self, level: int, duration: float):
+        """Records a successful run, keeping the fastest one.
+
+        :param level: The level the run completed.
+        :param duration: The duration of the run in seconds.
+        """
+        with self.db:
+            self.db.execute(
+                "INSERT INTO best_runs (username, level, duration) VALUES (?, ?, ?) "
+                "ON CONFLICT (username, level) DO UPDATE SET duration=excluded.duration, synced=0 "
+                "WHERE excluded.duration < best_runs.duration",
+                (self.username, level, duration),
+            )
+
+    def best_run(self, level: int) -> Optional[float]:
+        """Gets the duration of the fastest run of a level."""
+        row = self.db.execute(
+            "SELECT duration FROM best_runs WHERE username=? AND level=?",
+            (self.username, level),
+        ).fetchone()
+        return row and row[0]
+
+    def save_draft(self, level: int, code: str):
+        """Saves the code of a level.
+
+        :param level: The level of the code.
+        :param code: The code in the code input.
+        """
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO drafts (username, level, code, updated_at) VALUES (?, ?, ?, ?)",
+                (self.username, level, code, time.time()),
+            )
+
+    def draft(self, level: int) -> Optional[str]:
+        """Gets the saved code of a level."""
+        row = self.db.execute(
+            "SELECT code FROM drafts WHERE username=? AND level=?", (self.username, level)
+        ).fetchone()
+        return row and row[0]
+
+    def unsynced(self, limit: int) -> Dict[str, List[Dict[str, Any]]]:
+        """Gets progress that was not uploaded yet.
+
+        :param limit: The maximum amount of rows per kind of progress.
+        """
+        completed = self.db.execute(
+            "SELECT level, completed_at FROM completed_levels WHERE username=? AND NOT synced LIMIT ?",
+            (self.username, limit),
+        )
+        best_runs = self.db.execute(
+            "SELECT level, duration FROM best_runs WHERE username=? AND NOT synced LIMIT ?",
+            (self.username, limit),
+        )
+        return {
+            "completed": [{"level": level, "completed_at": at} for level, at in completed],
+            "best_runs": [{"level": level, "duration": duration} for level, duration in best_runs],
+        }
+
+    def mark_synced(self, batch: Dict[str, List[Dict[str, Any]]]):
+        """Marks uploaded progress as synced.
+
+        Best runs that improved during the upload stay unsynced.
+
+        :param batch: The batch returned by `unsynced`.
+        """
+        with self.db:
+            self.db.executemany(
+                "UPDATE completed_levels SET synced=1 WHERE username=? AND level=?",
+                [(self.username, row["level"]) for row in batch["completed"]],
+            )
+            self.db.executemany(
+                "UPDATE best_runs SET synced=1 WHERE username=? AND level=? AND duration=?",
+                [(self.username, row["level"], row["duration"]) for row in batch["best_runs"]],
+            )
+
+    def merge(self, remote: Dict[str, List[Dict[str, Any]]]):
+        """Merges progress downloaded from the server.
+
+        :param remote: The completed levels and best runs of the user.
+        """
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO completed_levels (username, level, completed_at, synced) "
+                "VALUES (?, ?, ?, 1)",
+                [(self.username, row["level"], row["completed_at"]) for row in remote["completed"]],
+            )
+            self.db.executemany(
+                "INSERT INTO best_runs (username, level, duration, synced) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT (username, level) DO UPDATE SET duration=excluded.duration, synced=1 "
+                "WHERE excluded.duration <= best_runs.duration",
+                [(self.username, row["level"], row["duration"]) for row in remote["best_runs"]],
+            )
+        self.completed.update(row["level"] for row in remote["completed"])
+
+
+class ProgressSync:
+    """Uploads progress to the server in the background.
+
+    Uploads are batched and idempotent, so a batch that is sent
+    again after a failure does not change the server's state.
+
+    :param store: The progress store to sync.
+    :param connection: The connection with the session and user token.
+    :param interval: Seconds between two uploads.
+    :param batch_size: The maximum amount of rows per kind of progress per upload.
+    """
+
+    URL = "http://127.0.0.1:8080/progress"
+
+    def __init__(
+        self,
+        store: ProgressStore,
+        connection: WebsocketConnection,
+        *,
+        interval: float = 10,
+        batch_size: int = 500,
+    ):
+        self.store = store
+        self.connection = connection
+        self.interval = interval
+        self.batch_size = batch_size
+
+    async def download(self):
+        """Merges the progress stored on the server into the local store."""
+        async with self.connection.session.get(
+            self.URL, params={"token": self.connection.token}
+        ) as request:
+            response = await request.json()
+        if "error" not in response:
+            self.store.merge(response)
+
+    async def upload(self) -> bool:
+        """Uploads one batch of unsynced progress.
+
+        :return: Whether there was progress to upload.
+        """
+        batch = self.store.unsynced(self.batch_size)
+        if not batch["completed"] and not batch["best_runs"]:
+            return False
+
+        async with self.connection.session.post(
+            self.URL, json={"token": self.connection.token, **batch}
+        ) as request:
+            response = await request.json()
+        if "error" in response:
+            return False
+
+        self.store.mark_synced(batch)
+        return True
+
+    async def run(self):
+        """Keeps the server up to date with the local progress."""
+        # The session's total timeout raises asyncio.TimeoutError instead of a ClientError.
+        try:
+            await self.download()
+        except (ClientError, asyncio.TimeoutError):
+            pass
+
+        while True:
+            try:
+                while await self.upload():
+                    pass
+            except (ClientError, asyncio.TimeoutError):
+                pass
+            await asyncio.sleep(self.interval)
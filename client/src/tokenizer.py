@@ -0,0 +1,115 @@
+import builtins
+import re
+from typing import List, Optional, Pattern, Sequence, Tuple
+
+import constants
+
+# fmt: off
+__all__ = (
+    'COLOURS',
+    'Range',
+    'find_variables',
+    'tokenize',
+    'tokenize_line',
+    'variables_pattern',
+)
+# fmt: on
+
+# (start, length, syntax) of a highlighted part of a line.
+Range = Tuple[int, int, str]
+
+
+def _patterns() -> List[Tuple[str, str, Pattern]]:
+    """Compiles the highlighting rules in the order they are applied."""
+    functions = [s for s in dir(builtins) if s.islower() and not s.startswith("_")]
+    keywords = list(map(lambda m: rf"(?:(?<![^\s\n\r])|$){m}", constants.KEYWORDS))
+    logical = list(map(lambda m: rf"(?:(?<![^\s\n\r])|$){m}", constants.LOGICAL))
+
+    # fmt: off
+    rules = [
+        ("integers", "acc4a0", r"[0-9]"),
+        ("variables", "8bc3e0", r".+?(?==)"),
+        ("used_variables", "8bc3e0", None),
+        ("functions", "d2d2a3", r"(?:(?![^\(\n\r])|$)|".join(functions)),
+        ("quotes", "c78c74", r"(\"|')(.*?)(\"|')"),
+        ("keywords", "c586c0", r"(?:(?![^\s\n\r])|$)|".join(keywords)),
+        ("import", "47af9a", r"(?m)(?<=\bimport ).*"),
+        ("bool", "569cd6", r"|".join(constants.BOOLEANS)),
+        ("logical", "569cd6", r"(?:(?![^\s\n\r])|$)|".join(logical)),
+        ("class", "47af9a", r"(?m)((?<=\bclass ).*(.*?).+?(?=:))"),
+        ("def", "d2d2a3", r"(?m)(?<=\bdef ).*(.*?)\("),
+        ("brackets", "f8d101", "|".join(constants.BRACKETS)),
+        ("back_slash", "cfb379", r"\\"),
+    ]
+    # fmt: on
+    return [(name, colour, pattern and re.compile(pattern)) for name, colour, pattern in rules]
+
+
+PATTERNS = _patterns()
+COLOURS = {name: colour for name, colour, _ in PATTERNS}
+
+
+def find_variables(lines: Sequence[str]) -> List[str]:
+    """Finds the names assigned to in the code.
+
+    :param lines: The lines of the code.
+    :return: The assigned names in order of appearance.
+    """
+    variables = {}
+    for line in lines:
+        name, equals, _ = line.partition("=")
+        name = name.strip()
+        if equals and name:
+            variables[name] = None
+    return list(variables)
+
+
+def variables_pattern(variables: Sequence[str]) -> Pattern:
+    """Compiles the pattern matching uses of the assigned names."""
+    if not variables:
+        return re.compile(r"(?!)")
+    return re.compile("|".join(map(re.escape, variables)))
+
+
+def tokenize_line(line: str, used_variables: Pattern) -> List[Range]:
+    """Finds the highlighted parts of a line.
+
+    Later patterns take precedence over earlier overlapping ones.
+    The ranges are returned in order without overlapping and with
+    neighbouring ranges of the same colour merged, like Qt stores
+    the formats of a block.
+
+    :param line: The line to tokenize.
+    :param used_variables: The pattern matching assigned names.
+    """
+    names: List[Optional[str]] = [None] * len(line)
+    for name, _, pattern in PATTERNS:
+        for match in (pattern or used_variables).finditer(line):
+            start, end = match.span()
+            names[start:end] = [name] * (end - start)
+
+    ranges = []
+    start = 0
+    for end in range(1, len(line) + 1):
+        if end < len(line) and COLOURS.get(names[end]) == COLOURS.get(names[start]):
+            continue
+        if names[start] is not None:
+            ranges.append((start, end - start, names[start]))
+        start = end
+    return ranges
+
+
+def tokenize(revision: int, text: str) -> Tuple[int, List[str], List[List[Range]]]:
+    """Tokenizes a snapshot of the whole code input.
+
+    Runs in a worker process so large documents are tokenized
+    without blocking the GUI thread.
+
+    :param revision: The document revision of the snapshot.
+    :param text: The code.
+    :return: The revision, the assigned names and the ranges of every line.
+    """
+    lines = text.split("\n")
+    variables = find_variables(lines)
+    used_variables = variables_pattern(variables)
+    return revision, variables, [tokenize_line(line, used_variables) for line in lines]
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import json
+import os
+import random
+import re
+import time
+from typing import Any, Dict, Iterator, Optional
+
+# fmt: off
+__all__ = (
+    'Span',
+    'Tracer',
+    'TRACE_ENV',
+    'TRACE_SAMPLE_ENV',
+    'tracer',
+)
+# fmt: on
+
+TRACE_ENV = "CJ9_TRACE"
+TRACE_SAMPLE_ENV = "CJ9_TRACE_SAMPLE"
+# Ids are 8 random bytes in hex, received ids may be up to 16 bytes long.
+SPAN_ID = re.compile(r"[0-9a-f]{1,32}")
+
+
+def valid_context(context: Any) -> bool:
+    """Whether a trace context received from the server has a valid id and parent."""
+    if not isinstance(context, dict) or not isinstance(context.get("id"), str):
+        return False
+    parent = context.get("parent")
+    if parent is not None and not isinstance(parent, str):
+        return False
+    return all(value is None or SPAN_ID.fullmatch(value) for value in (context["id"], parent))
+
+
+class Span:
+    """A timed operation belonging to a trace.
+
+    :param trace_id: The id of the trace.
+    :param parent_id: The id of the parent span, None for a root span.
+    :param name: What the span measures.
+    :param attributes: Extra information about the operation.
+    """
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: Optional[float] = None
+
+    @property
+    def context(self) -> Dict[str, str]:
+        """The trace context passed in message envelopes."""
+        return {"id": self.trace_id, "parent": self.span_id}
+
+
+class Tracer:
+    """Starts traces and records their client side spans to a local file.
+
+    Only a sample of the traces is recorded. The server records
+    its spans of a trace only when it receives the trace's context,
+    so the sampling decision made here applies to the whole trace.
+
+    :param path: The path of the span file, None to disable tracing.
+    :param sample_rate: The fraction of traces recorded.
+    """
+
+    def __init__(self, path: Optional[str], *, sample_rate: float = 1.0):
+        self.file = open(path, "a", encoding="utf-8") if path else None
+        self.sample_rate = sample_rate
+        self.current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+            "client_span", default=None
+        )
+
+    def start(self, name: str, **attributes: Any) -> Optional[Span]:
+        """Starts a span under the current one, or a new trace if there is none.
+
+        The span is not made current, it has to be ended with `finish`.
+
+        :param name: What the span measures.
+        :param attributes: Extra information about the operation.
+        :return: The span, or None if the trace is not recorded.
+        """
+        if self.file is None:
+            return None
+        parent = self.current.get()
+        if parent is not None:
+            return Span(parent.trace_id, parent.span_id, name, attributes)
+        if random.random() >= self.sample_rate:
+            return None
+        return Span(os.urandom(8).hex(), None, name, attributes)
+
+    def finish(self, span: Optional[Span]):
+        """Ends a span and exports it, ignoring unrecorded spans."""
+        if span is None or span.end is not None:
+            return
+        span.end = time.time()
+        record = {
+            "trace": span.trace_id,
+            "span": span.span_id,
+            "parent": span.parent_id,
+            "name": span.name,
+            "service": "client",
+            "start": span.start,
+            "end": span.end,
+            "attributes": span.attributes,
+        }
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+    @contextlib.contextmanager
+    def activate(self, span: Optional[Span]) -> Iterator[Optional[Span]]:
+        """Makes a span current without ending it."""
+        if span is None:
+            yield None
+            return
+        token = self.current.set(span)
+        try:
+            yield span
+        finally:
+            self.current.reset(token)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Records a span around a block, starting a trace if there is none.
+
+        :param name: What the span measures.
+        :param attributes: Extra information about the operation.
+        """
+        span = self.start(name, **attributes)
+        with self.activate(span):
+            try:
+                yield span
+            finally:
+                self.finish(span)
+
+    @contextlib.contextmanager
+    def continue_trace(self, context: Any, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Records a span under a trace context received from the server.
+
+        :param context: The `{"id", "parent"}` context from the envelope, if any.
+        :param name: What the span measures.
+        :param attributes: Extra information about the operation.
+        """
+        if self.file is None or not valid_context(context):
+            yield None
+            return
+
+        span = Span(context["id"], context.get("parent"), name, attributes)
+        with self.activate(span):
+            try:
+                yield span
+            finally:
+                self.finish(span)
+
+
+tracer = Tracer(
+    os.environ.get(TRACE_ENV) or None,
+    sample_rate=float(os.environ.get(TRACE_SAMPLE_ENV, 1)),
+)
@@ -1,7 +1,14 @@
-import re
+from __future__ import annotations
 
-import constants
-from PyQt5 import QtGui
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import tokenizer
+from profiling import timed
+from PyQt5 import QtCore, QtGui, QtWidgets
 
 # fmt: off
 __all__ = (
@@ -11,126 +18,190 @@ __all__ = (
 
 
 class Highlighter(QtGui.QSyntaxHighlighter):
-    """Highlighter class for highlighting text."""
-
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self._mapping = {}
-        self.variables = []
+    """Highlighter class for highlighting text.
 
-        self.set_up()
+    The whole document is tokenized by a worker process. Qt asks for
+    blocks to be highlighted as they change, which is answered from
+    the ranges the worker last returned; lines that are not known yet
+    are tokenized on the GUI thread within a small time budget and
+    otherwise left for the worker's next result, which rehighlights
+    only the blocks whose ranges it changed.
 
-    def ensure_variables(self):
-        """Ensures that all variables being used are defined."""
-        code = self.document().toPlainText()
-        for variable in self.variables:
+    :param editor: The code input to highlight.
+    :attr FRAME_BUDGET: Seconds of GUI thread time spent highlighting per frame.
+    :attr LAYOUT_SPAN: The most blocks laid out again at once after highlighting.
+    """
 
-            pattern = variable + r"(\s|)="
-            matches = re.findall(pattern, code)
-            if matches:
-                return
+    FRAME_BUDGET = 0.008
+    LAYOUT_SPAN = 200
 
-            self.variables.remove(variable)
-            for block in code.splitlines():
-                for match in re.finditer(self.get_used_variables(), block):
-                    start, end = match.span()
-                    self.setFormat(
-                        start, end - start, self._mapping[self.get_used_variables]
-                    )
+    _executor: Optional[ProcessPoolExecutor] = None
 
-    def get_used_variables(self) -> str:
-        """Gets the used variables.
+    def __init__(self, editor: QtWidgets.QTextEdit):
+        super().__init__(editor)
+        self.editor = editor
+        self._formats: Dict[str, QtGui.QTextCharFormat] = {}
+        self.set_up()
 
-        :return: The used variables regex.
+        self.variables = tokenizer.variables_pattern([])
+        self._ranges: Dict[str, List[tokenizer.Range]] = {}
+        self._revision = -1
+        self._tokenizing = False
+
+        self._spent: Optional[float] = None
+
+        self._queue: List[int] = []
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self.apply_pending)
+
+        self.setDocument(editor.document())
+        self.document().contentsChange.connect(self.on_contents_change)
+        self.on_contents_change()
+
+    @classmethod
+    def executor(cls) -> ProcessPoolExecutor:
+        """The worker process shared by every highlighter."""
+        if cls._executor is None:
+            cls._executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            )
+        return cls._executor
+
+    def on_contents_change(self, *_):
+        """Sends a snapshot of the document to the worker if it changed."""
+        revision = self.document().revision()
+        if self._tokenizing or revision == self._revision:
+            return
+
+        self._tokenizing = True
+        self._revision = revision
+        future = asyncio.get_event_loop().run_in_executor(
+            self.executor(), tokenizer.tokenize, revision, self.document().toPlainText()
+        )
+        future.add_done_callback(self.on_tokenized)
+
+    def on_tokenized(self, future: asyncio.Future):
+        """Applies the worker's result unless the document changed since."""
+        self._tokenizing = False
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        revision, variables, lines = future.result()
+        if revision != self.document().revision():
+            self.on_contents_change()
+            return
+
+        self.variables = tokenizer.variables_pattern(variables)
+        text_lines = self.document().toPlainText().split("\n")
+        highlighted, self._ranges = self._ranges, dict(zip(text_lines, lines))
+
+        # Blocks are highlighted from the ranges of their text, only the
+        # ones whose ranges changed or that were skipped need another pass.
+        changed = [
+            number for number, line in enumerate(text_lines) if highlighted.get(line) != self._ranges[line]
+        ]
+        first, last = self.visible_blocks()
+        self._queue = [number for number in reversed(changed) if number > last]
+        self._queue += [number for number in reversed(changed) if number < first]
+        self._queue += [number for number in reversed(changed) if first <= number <= last]
+        if self._queue:
+            self._timer.start()
+
+    def visible_blocks(self) -> tuple[int, int]:
+        """The numbers of the first and last blocks shown in the editor."""
+        viewport = self.editor.viewport()
+        first = self.editor.cursorForPosition(QtCore.QPoint(0, 0)).blockNumber()
+        last = self.editor.cursorForPosition(
+            QtCore.QPoint(viewport.width() - 1, viewport.height() - 1)
+        ).blockNumber()
+        return first, last
+
+    def apply_pending(self):
+        """Rehighlights queued blocks, visible ones first, within the frame budget.
+
+        Qt lays out every block after a block whose formats changed
+        again, so the formats of the blocks queued in order are set
+        directly and the span they cover is laid out again once.
         """
-        return r"|".join(self.variables)
+        deadline = time.perf_counter() + self.FRAME_BUDGET
+        document = self.document()
+        while self._queue and time.perf_counter() < deadline:
+            first = block = document.findBlockByNumber(self._queue.pop())
+            if not block.isValid():
+                continue
+            self.set_formats(block)
+            while (
+                self._queue
+                and self._queue[-1] > block.blockNumber()
+                and self._queue[-1] - first.blockNumber() < self.LAYOUT_SPAN
+                and time.perf_counter() < deadline
+            ):
+                following = document.findBlockByNumber(self._queue[-1])
+                if not following.isValid():
+                    break
+                self._queue.pop()
+                block = following
+                self.set_formats(block)
+            document.markContentsDirty(first.position(), block.position() + block.length() - first.position())
+        if not self._queue:
+            self._timer.stop()
+
+    def set_formats(self, block: QtGui.QTextBlock):
+        """Sets the formats of a block from the ranges of its text.
+
+        The ranges do not overlap, so they are the formats Qt
+        would store for the block after `highlightBlock`.
+        """
+        ranges = self._ranges.get(block.text())
+        if ranges is None:
+            return
+
+        formats = []
+        for start, length, syntax in ranges:
+            format_range = QtGui.QTextLayout.FormatRange()
+            format_range.start = start
+            format_range.length = length
+            format_range.format = self._formats[syntax]
+            formats.append(format_range)
+        block.layout().setFormats(formats)
+
+    def within_budget(self) -> bool:
+        """Whether the GUI thread may still tokenize lines this frame.
+
+        The budget is reset once control returns to the event loop.
+        """
+        if self._spent is None:
+            self._spent = 0.0
+            QtCore.QTimer.singleShot(0, self.reset_budget)
+        return self._spent < self.FRAME_BUDGET
+
+    def reset_budget(self):
+        """Starts a new frame budget."""
+        self._spent = None
 
+    @timed
     def highlightBlock(self, text_block: str):
         """Called when the text block changes.
 
         :param text_block: The text block to highlight.
         """
-        for pattern, fmt in self._mapping.items():
-            if hasattr(pattern, "__call__"):
-                pattern = pattern()
-            for match in re.finditer(pattern, text_block):
-                start, end = match.span()
-                self.setFormat(start, end - start, fmt)
+        ranges = self._ranges.get(text_block)
+        if ranges is None:
+            if not self.within_budget():
+                return
 
-        for _ in re.finditer(r".+?(?==)", text_block):
-            var = text_block.split("=")[0].strip()
+            start = time.perf_counter()
+            ranges = self._ranges[text_block] = tokenizer.tokenize_line(text_block, self.variables)
+            self._spent += time.perf_counter() - start
 
-            if var not in self.variables:
-                self.variables.append(var)
-        self.ensure_variables()
+        for start, length, syntax in ranges:
+            self.setFormat(start, length, self._formats[syntax])
 
     def set_up(self):
         """Set up the highlighting."""
-        functions = [
-            s for s in globals()["__builtins__"] if s.islower() and not s.startswith("_")
-        ]
-        keywords = list(map(lambda m: rf"(?:(?<![^\s\n\r])|$){m}", constants.KEYWORDS))
-        logical = list(map(lambda m: rf"(?:(?<![^\s\n\r])|$){m}", constants.LOGICAL))
-
-        # fmt: off
-        syntax_dictionary = {
-            "integers": {
-                "colour": "acc4a0",
-                "pattern": r"[0-9]",
-            },
-            "variables": {
-                "colour": "8bc3e0",
-                "pattern": r".+?(?==)",
-            },
-            "used_variables": {
-                "colour": "8bc3e0",
-                "pattern": self.get_used_variables
-            },
-            "functions": {
-                "colour": "d2d2a3",
-                "pattern": r"(?:(?![^\(\n\r])|$)|".join(functions),
-            },
-            "quotes": {
-                "colour": "c78c74",
-                "pattern": r"(\"|')(.*?)(\"|')",
-            },
-            "keywords": {
-                "colour": "c586c0",
-                "pattern": r"(?:(?![^\s\n\r])|$)|".join(keywords),
-            },
-            "import": {
-                "colour": "47af9a",
-                "pattern": r"(?m)(?<=\bimport ).*",
-            },
-            "bool": {
-                "colour": "569cd6",
-                "pattern": r"|".join(constants.BOOLEANS)
-            },
-            "logical": {
-                "colour": "569cd6",
-                "pattern": r"(?:(?![^\s\n\r])|$)|".join(logical),
-            },
-            "class": {
-                "colour": "47af9a",
-                "pattern": r"(?m)((?<=\bclass ).*(.*?).+?(?=:))",
-            },
-            "def": {
-                "colour": "d2d2a3",
-                "pattern": r"(?m)(?<=\bdef ).*(.*?)\(",
-            },
-            "brackets": {
-                "colour": "f8d101",
-                "pattern": "|".join(constants.BRACKETS),
-            },
-            "back_slash": {
-                "colour": "cfb379",
-                "pattern": r"\\"
-            }
-        }
-        # fmt: on
-
-        for syntax in syntax_dictionary.values():
+        for syntax, colour in tokenizer.COLOURS.items():
             class_format = QtGui.QTextCharFormat()
-            class_format.setForeground(QtGui.QColor("#" + syntax["colour"]))
+            class_format.setForeground(QtGui.QColor("#" + colour))
 
-            self._mapping[syntax["pattern"]] = class_format
+            self._formats[syntax] = class_format
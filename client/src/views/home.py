@@ -1,14 +1,22 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, Dict, Union
+import asyncio
+import time
+import uuid
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
 
 import constants
+from aiohttp import ClientError
+from collab import CollaborativeEditor
+from profiling import async_slot, timed
 from PyQt5 import QtCore, QtGui, QtWidgets, uic
-from qasync import asyncSlot
 from qt_material import apply_stylesheet
+from store import ProgressStore, ProgressSync
+from tracing import Span, tracer
 
 from . import popup
 from .highlighter import Highlighter
+from .syntax import SyntaxChecker
 
 if TYPE_CHECKING:
     from ..connection import WebsocketConnection
@@ -94,8 +102,13 @@ class Widgets:
         self.chat_box_model = QtGui.QStandardItemModel()
         self.chat_box.setModel(self.chat_box_model)
 
-        self.highlighter = Highlighter()
-        self.highlighter.setDocument(self.code_input.document())
+        self.highlighter = Highlighter(self.code_input)
+        self.syntax = SyntaxChecker(self.code_input)
+
+        self.collaboration = CollaborativeEditor(self.code_input, window.connection)
+
+        self.progress = window.progress
+        self.level: Optional[Level] = None
 
     def set_level(self, level: int, /) -> Level:
         """Sets the code input text.
@@ -113,7 +126,103 @@ class Widgets:
             entry_index, QtCore.QItemSelectionModel.Select
         )
 
-        return Level(self.code_input, level=level)
+        self.collaboration.leave()
+        if self.level is not None:
+            self.progress.save_draft(self.level.level, self.code_input.toPlainText())
+
+        self.level = Level(self.code_input, level=level, draft=self.progress.draft(level))
+        self.collaboration.join(level)
+        return self.level
+
+
+class OutputStream:
+    """Appends streamed code output to the code output as plain text.
+
+    Chunks are batched and appended once per frame. Output past
+    `limit` characters is dropped and replaced with a marker.
+
+    :param code_output: The code output TextEdit to append to.
+    :param limit: The maximum amount of output characters kept.
+    :attr FRAME_INTERVAL: Milliseconds between two appends.
+    """
+
+    FRAME_INTERVAL = 16
+
+    def __init__(self, code_output: QtWidgets.QTextEdit, *, limit: int):
+        self.code_output = code_output
+        self.limit = limit
+
+        self.parts: List[str] = []
+        self.pending: List[str] = []
+        self.retained = 0
+        self.truncated = False
+
+        self._timer = QtCore.QTimer(code_output)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.FRAME_INTERVAL)
+        self._timer.timeout.connect(self.flush)
+
+    @property
+    def output(self) -> str:
+        """The output kept so far."""
+        return "".join(self.parts)
+
+    def start(self, header: str):
+        """Clears the output for a new run.
+
+        :param header: The text shown before the output.
+        """
+        self._timer.stop()
+        self.parts.clear()
+        self.pending.clear()
+        self.retained = 0
+        self.truncated = False
+        self.code_output.setPlainText(header)
+
+    def write(self, text: str):
+        """Queues output to be appended on the next frame.
+
+        :param text: The chunk of output.
+        """
+        if self.truncated:
+            return
+
+        room = self.limit - self.retained
+        if len(text) > room:
+            text = text[:room]
+            self.truncated = True
+
+        self.parts.append(text)
+        self.pending.append(text)
+        self.retained += len(text)
+        if self.truncated:
+            self.pending.append("\n[output truncated]\n")
+
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def notice(self, text: str):
+        """Queues text that is not part of the output, e.g. the exit code.
+
+        :param text: The text to append.
+        """
+        self.pending.append(text)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """Appends the queued output."""
+        self._timer.stop()
+        if not self.pending:
+            return
+
+        cursor = self.code_output.textCursor()
+        cursor.movePosition(QtGui.QTextCursor.End)
+        cursor.insertText("".join(self.pending))
+        self.pending.clear()
+
+        scroll_bar = self.code_output.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
 
 
 class Level:
@@ -122,9 +231,11 @@ class Level:
     :param code_input: The code input TextEdit to set
                         the markdown to.
     :param level: The level to represent.
+    :param draft: The code saved the last time the level
+                  was opened, used instead of the level code.
     """
 
-    def __init__(self, code_input: QtWidgets.QTextEdit, *, level: int):
+    def __init__(self, code_input: QtWidgets.QTextEdit, *, level: int, draft: Optional[str] = None):
         self.level = level
 
         level: Dict[int, Union[str, int]] = constants.LEVELS.get(level)
@@ -132,7 +243,7 @@ class Level:
         self.output: str = level["output"].strip()
         self.response_code = level["response_code"]
 
-        code: str = level["code"]
+        code: str = level["code"] if draft is None else draft
         code_input.setMarkdown(f"```py\n{code}\n```")
 
 
@@ -155,15 +266,25 @@ class Window(QtWidgets.QMainWindow):
         apply_stylesheet(self, theme="dark_purple.xml")
 
         self.connection = connection
-        self.completed_levels = []
+        self.progress = ProgressStore(connection.username)
+        self.progress_sync = ProgressSync(self.progress, connection)
 
         self.widgets = Widgets(self)
         self.level = self.widgets.set_level(1)
 
+        self.output = OutputStream(self.widgets.code_output, limit=constants.OUTPUT_LIMIT)
+        self.run_id: Optional[str] = None
+        self.run_started = 0.0
+        self.run_span: Optional[Span] = None
+
+        # Kept so the task is not garbage collected while it sleeps.
+        self.progress_task = asyncio.ensure_future(self.progress_sync.run())
+
     def next_level(self):
         """Sets the level to the next_level."""
         self.level = self.widgets.set_level(self.level.level + 1)
 
+    @timed
     def list_view_mouse_press(self, event: QtGui.QMouseEvent):
         """List view mouse press event.
 
@@ -175,9 +296,7 @@ class Window(QtWidgets.QMainWindow):
         position = self.mapFromGlobal(QtGui.QCursor.pos())
         row = self.widgets.levels_view.list_view.indexAt(position).row()
 
-        if not self.completed_levels:
-            return
-        if row in self.completed_levels + [max(self.completed_levels) + 1]:
+        if self.progress.is_unlocked(row):
             super(
                 QtWidgets.QListView, self.widgets.levels_view.list_view
             ).mousePressEvent(event)
@@ -196,6 +315,7 @@ class Window(QtWidgets.QMainWindow):
             feature_message = constants.FEATURE_MESSAGES.get(widget_name)
             self._popup = popup.Window(feature_message)
 
+    @timed
     def append_message(self, message: str, author: str = None):
         """Appends a message to the chat box.
 
@@ -207,7 +327,14 @@ class Window(QtWidgets.QMainWindow):
         if author is None:
             author = self.connection.username
 
-        message_item = QtGui.QStandardItem(f"[ {author} ] {message}")
+        self.append_chat_line(f"[ {author} ] {message}")
+
+    def append_chat_line(self, text: str):
+        """Appends a line to the chat box and selects it.
+
+        :param text: The formatted line.
+        """
+        message_item = QtGui.QStandardItem(text)
         self.widgets.chat_box_model.appendRow(message_item)
 
         entry_index = self.widgets.chat_box_model.index(
@@ -216,42 +343,136 @@ class Window(QtWidgets.QMainWindow):
         selection_model = self.widgets.chat_box.selectionModel()
         selection_model.select(entry_index, QtCore.QItemSelectionModel.Select)
 
-    @asyncSlot()
+    @async_slot()
     async def run_code(self):
         """Triggered when run code button is clicked.
 
-        Manages the execution of code and the processing
-        of the code output.
+        Starts running the code on the server, or stops
+        the code if it is still running. Code that does not
+        compile is reported at once instead of being run.
         """
-        self.widgets.code_output.setPlainText("Running code...")
-
-        async with self.connection.session.post(
-            "https://emkc.org/api/v2/piston/execute",
-            json={
-                "language": "py",
-                "version": "3.10",
-                "files": [{"content": self.widgets.code_input.toPlainText()}],
-            },
-        ) as request:
-            response: Dict[Any, Union[str, int]] = (await request.json())["run"]
-        self.widgets.code_output.setMarkdown(
-            f"```py\n$ python code.py\n{response['output']}```\nCode exited with code {response['code']}"
-        )
-        print(response["output"].strip(), self.level.output)
+        if self.run_id is not None:
+            with tracer.activate(self.run_span):
+                await self.connection.send({"op": 6, "data": {"run": self.run_id}})
+            self.end_run()
+            self.output.notice("\n[cancelled]")
+            return
+
+        code = self.widgets.code_input.toPlainText()
+        self.progress.save_draft(self.level.level, code)
+
+        # Code that does not compile would only fail on the server too.
+        problem = self.widgets.syntax.show()
+        if problem is not None:
+            self.output.start("$ python code.py\n")
+            self.output.notice(f"{problem}\n[not run, fix the underlined code first]")
+            return
+
+        self.run_id = uuid.uuid4().hex
+        self.run_started = time.perf_counter()
+        self.run_span = tracer.start("client.run", level=self.level.level)
+        self.output.start("$ python code.py\n")
+        self.widgets.run_button.setText("Stop")
+
+        try:
+            with tracer.activate(self.run_span):
+                await self.connection.send({"op": 3, "data": {"run": self.run_id, "code": code}})
+        except (ClientError, ConnectionError):
+            self.end_run()
+            self.output.notice("[not run, the server could not be reached]")
+
+    def end_run(self):
+        """Resets the run state once the code stopped running."""
+        self.run_id = None
+        tracer.finish(self.run_span)
+        self.run_span = None
+        self.widgets.run_button.setText("Run code")
+
+    def receive_output(self, data: Dict[str, Any]):
+        """Appends a chunk of output of the running code.
+
+        :param data: The run id and the chunk of output.
+        """
+        if data["run"] == self.run_id:
+            self.output.write(data["output"])
+
+    def finish_run(self, data: Dict[str, Any]):
+        """Shows the exit code and checks if the level was completed.
+
+        :param data: The run id, exit code and why the run was stopped.
+        """
+        if data["run"] != self.run_id:
+            return
+        duration = time.perf_counter() - self.run_started
+        self.end_run()
+
+        footer = f"\nCode exited with code {data['code']}"
+        if data.get("error"):
+            footer = f"\n{data['error']}"
+        elif data["timed_out"]:
+            footer += " (timed out)"
+        elif data["truncated"]:
+            footer += " (too much output)"
+        self.output.notice(footer)
+
         if (
-            response["output"].strip() == self.level.output
-            and response["code"] == self.level.response_code
+            not data["truncated"]
+            and not self.output.truncated
+            and self.output.output.strip() == self.level.output
+            and data["code"] == self.level.response_code
         ):
             self.widgets.level_complete.show()
-            self.completed_levels.append(self.level.level)
+            self.progress.complete(self.level.level)
+            self.progress.record_run(self.level.level, duration)
+
+    def receive_direct_message(self, data: Dict[str, Any]):
+        """Appends a direct message, or why it could not be delivered.
+
+        :param data: The author, recipient and message, or an error.
+        """
+        if "error" in data:
+            self.append_chat_line(f"[ ! ] {data['error']}")
+        elif data["author"] == self.connection.username:
+            self.append_chat_line(f"[ you -> {data['to']} ] {data['message']}")
+        else:
+            self.append_chat_line(f"[ {data['author']} -> you ] {data['message']}")
 
-    @asyncSlot()
+    def resync(self, data: Dict[str, Any]):
+        """Reloads the shared code input after the server dropped edits.
+
+        :param data: The level and why the edits were dropped.
+        """
+        if data["reason"] == "throttled":
+            self.append_chat_line("[ ! ] You edited the code too fast, it was reset to the shared code.")
+        self.widgets.collaboration.resync(data)
+
+    @async_slot()
     async def send_message(self):
-        """Triggered when a user presses the send button."""
+        """Triggered when a user presses the send button.
+
+        Messages starting with `/w <username>` are only sent to that user.
+        """
         message = self.widgets.message_box.text()
+        if message.startswith(constants.DIRECT_MESSAGE_PREFIX):
+            _, recipient, message = (message.split(maxsplit=2) + ["", ""])[:3]
+            if not recipient or not message:
+                return
+
+            self.append_chat_line(f"[ you -> {recipient} ] {message}")
+            self.widgets.message_box.clear()
+            await self.connection.send({"op": 7, "data": {"to": recipient, "message": message}})
+            return
+
         self.append_message(message)
 
         self.widgets.message_box.clear()
         await self.connection.send(
-            {"op": 0, "data": {"message": message, "author": self.connection.username}}
+            {
+                "op": 0,
+                "data": {
+                    "message": message,
+                    "author": self.connection.username,
+                    "level": self.level.level,
+                },
+            }
         )
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 from random import choice
+from typing import Optional
 
 from aiohttp import ClientConnectionError, ClientSession
 from connection import WebsocketConnection, WebsocketHandler
 from constants import ALL_THEMES, FEATURE_MESSAGES
+from profiling import async_slot, timed
 from PyQt5 import QtCore, QtGui, QtWidgets, uic
-from qasync import asyncClose, asyncSlot
+from qasync import asyncClose
 from qt_material import apply_stylesheet
 from qtwidgets import AnimatedToggle
 
@@ -86,6 +89,7 @@ class Window(QtWidgets.QMainWindow):
 
         self.light_mode: bool = True
         self.is_running: bool = True
+        self.listener: Optional[asyncio.Task] = None
 
         self.theme_colour: str = choice(ALL_THEMES)
         apply_stylesheet(self, theme=f"light_{self.theme_colour}.xml")
@@ -119,6 +123,7 @@ class Window(QtWidgets.QMainWindow):
         """Login form clicked."""
         self.parse_mouse_press(event, "loginform")
 
+    @timed
     def on_mouse_move(self, event):
         """Triggered when the mouse moves.
 
@@ -135,6 +140,7 @@ class Window(QtWidgets.QMainWindow):
                     theme=f"{'light' if self.light_mode else 'dark'}_{choice(ALL_THEMES)}.xml",
                 )
 
+    @timed
     def theme_toggle(self):
         """Called when the light mode toggle is clicked."""
         self.light_mode = choice([True, False, False])
@@ -153,7 +159,7 @@ class Window(QtWidgets.QMainWindow):
         if getattr(self, "popup", None):
             self.popup.close()
 
-    @asyncSlot()
+    @async_slot()
     async def on_login(self):
         """Called when the user presses the login button.
 
@@ -177,15 +183,32 @@ class Window(QtWidgets.QMainWindow):
 
         try:
             websocket = await WebsocketHandler.from_user(self.session, response["token"])
+        except ClientConnectionError:
+            self.is_running = False
+            return self.error_message.setText("ERROR: Could not connect to the server")
+
+        connection = WebsocketConnection(
+            username=response["username"],
+            token=response["token"],
+            session=self.session,
+            websocket=websocket,
+        )
 
-            connection = WebsocketConnection(
-                username=response["username"], session=self.session, websocket=websocket
-            )
+        self.destroy()
+        home_window = home.Window(connection)
+        home_window.show()
 
-            self.destroy()
-            home_window = home.Window(connection)
-            home_window.show()
+        # Listening lasts the whole session, so it runs in its own task
+        # instead of keeping this slot, and its profiling span, open.
+        self.listener = asyncio.ensure_future(self.listen(websocket, home_window))
 
+    async def listen(self, websocket: WebsocketHandler, home_window: home.Window):
+        """Passes the messages of the websocket to the home window until it disconnects.
+
+        :param websocket: The websocket of the logged in user.
+        :param home_window: The window handling the messages.
+        """
+        try:
             while True:
                 await websocket.listen(home_window)
         except ClientConnectionError:
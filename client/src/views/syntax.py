@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import precheck
+from profiling import timed
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+# fmt: off
+__all__ = (
+    'SyntaxChecker',
+)
+# fmt: on
+
+
+class SyntaxChecker(QtCore.QObject):
+    """Underlines the code that keeps the code input from compiling.
+
+    The code is checked once typing pauses. The result is kept for
+    the document revision it was computed for, so checking code
+    that did not change since is free.
+
+    :param editor: The code input to check.
+    :attr DELAY: Milliseconds without changes before the code is checked.
+    """
+
+    DELAY = 300
+
+    def __init__(self, editor: QtWidgets.QTextEdit):
+        super().__init__(editor)
+        self.editor = editor
+
+        self._revision = -1
+        self._problem: Optional[precheck.Problem] = None
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.DELAY)
+        self._timer.timeout.connect(self.show)
+
+        self._format = QtGui.QTextCharFormat()
+        self._format.setUnderlineStyle(QtGui.QTextCharFormat.WaveUnderline)
+        self._format.setUnderlineColor(QtGui.QColor("#ff5370"))
+
+        editor.document().contentsChange.connect(self.on_contents_change)
+        self._timer.start()
+
+    def on_contents_change(self, *_):
+        """Restarts the delay before the code is checked."""
+        self._timer.start()
+
+    @timed
+    def result(self) -> Optional[precheck.Problem]:
+        """The problem of the current code, None if it compiles."""
+        revision = self.editor.document().revision()
+        if revision != self._revision:
+            self._problem = precheck.check(self.editor.toPlainText())
+            self._revision = revision
+        return self._problem
+
+    def show(self) -> Optional[precheck.Problem]:
+        """Checks the code now and underlines its problem, if any.
+
+        :return: The problem, None if the code compiles.
+        """
+        self._timer.stop()
+        problem = self.result()
+        if problem is None:
+            self.editor.setExtraSelections([])
+            self.editor.setToolTip("")
+            return None
+
+        document = self.editor.document()
+        last = document.blockCount() - 1
+        start_block = document.findBlockByNumber(min(problem.line - 1, last))
+        end_block = document.findBlockByNumber(min(problem.end_line - 1, last))
+
+        cursor = QtGui.QTextCursor(start_block)
+        cursor.setPosition(start_block.position() + min(problem.column - 1, max(start_block.length() - 1, 0)))
+        if problem.end_column is None or (problem.end_line, problem.end_column) <= (problem.line, problem.column):
+            cursor.setPosition(end_block.position() + end_block.length() - 1, QtGui.QTextCursor.KeepAnchor)
+        else:
+            end = min(problem.end_column - 1, end_block.length() - 1)
+            cursor.setPosition(end_block.position() + end, QtGui.QTextCursor.KeepAnchor)
+        if not cursor.hasSelection():
+            # Errors at the end of a line, e.g. a missing bracket, mark the last character.
+            cursor.movePosition(QtGui.QTextCursor.Left, QtGui.QTextCursor.KeepAnchor)
+
+        selection = QtWidgets.QTextEdit.ExtraSelection()
+        selection.cursor = cursor
+        selection.format = self._format
+        self.editor.setExtraSelections([selection])
+        self.editor.setToolTip(str(problem))
+        return problem
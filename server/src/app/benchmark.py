@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import secrets
+import statistics
+from typing import List, Optional
+
+from .executor import Executor, ExecutorError
+
+# fmt: off
+__all__ = (
+    'BenchmarkResult',
+    'Benchmark',
+)
+# fmt: on
+
+# Runs on Piston next to the solution. Every run of the solution is a
+# child process without input or output, measured from the outside by
+# its resource usage, so the solution cannot write or change the
+# result. Every run of the solution follows a run of an empty program,
+# which is subtracted to not count the interpreter's start. The result
+# is printed after the job's nonce, which only the server and this
+# process know: it is read before any child starts, and /proc of a
+# process that is not dumpable cannot be read by its children.
+# A run is killed once the job's budget is spent, so the harness still
+# prints before Piston stops the job, and the first pair of runs sizes
+# the warmup and repeat to what is left of the budget, with a quarter
+# of a pair's time to spare for slower runs.
+HARNESS = """
+import ctypes, json, os, subprocess, sys, threading, time
+
+nonce = sys.stdin.readline().strip()
+job = json.loads(sys.stdin.readline())
+deadline = time.monotonic() + job["budget"]
+try:
+    ctypes.CDLL(None).prctl(4, 0)  # PR_SET_DUMPABLE
+except (AttributeError, OSError):
+    pass
+
+def fail(error):
+    print(nonce + json.dumps({"error": error}))
+    sys.exit(1)
+
+def run(path):
+    process = subprocess.Popen(
+        [sys.executable, path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=True,
+    )
+    timer = threading.Timer(max(deadline - time.monotonic(), 0), process.kill)
+    timer.start()
+    _, status, usage = os.wait4(process.pid, 0)
+    timer.cancel()
+    if status != 0:
+        fail("timeout" if time.monotonic() >= deadline else status)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss * 1024
+
+with open("empty.py", "w") as file:
+    file.write("")
+
+started = time.monotonic()
+run("empty.py")
+run("solution.py")
+now = time.monotonic()
+pairs = int((deadline - now) / ((now - started) * 1.25))
+warmup = max(min(job["warmup"] - 1, pairs - job["min_repeat"]), 0)
+repeat = min(job["repeat"], pairs - warmup)
+if repeat < job["min_repeat"]:
+    fail("timeout")
+
+for _ in range(warmup):
+    run("empty.py")
+    run("solution.py")
+
+result = {"cpu": [], "maxrss": [], "empty_cpu": [], "empty_maxrss": []}
+for _ in range(repeat):
+    cpu, maxrss = run("empty.py")
+    result["empty_cpu"].append(cpu)
+    result["empty_maxrss"].append(maxrss)
+    cpu, maxrss = run("solution.py")
+    result["cpu"].append(cpu)
+    result["maxrss"].append(maxrss)
+print(nonce + json.dumps(result))
+"""
+
+
+class BenchmarkResult:
+    """Stable measurements of a solution.
+
+    :param time: The median CPU time of a run in seconds, without the interpreter's start.
+    :param time_spread: The interquartile range of the CPU times relative to the median.
+    :param memory: The median peak resident set size of a run in bytes, above an empty program's.
+    """
+
+    def __init__(self, *, time: float, time_spread: float, memory: float):
+        self.time = time
+        self.time_spread = time_spread
+        self.memory = memory
+
+
+def interquartile_range(values: List[float]) -> float:
+    """The interquartile range of the values, 0 for less than 4 values."""
+    if len(values) < 4:
+        return 0.0
+    quartiles = statistics.quantiles(values, n=4)
+    return quartiles[2] - quartiles[0]
+
+
+def relative_spread(values: List[float]) -> float:
+    """The interquartile range of the values relative to their median."""
+    median = statistics.median(values)
+    if median <= 0:
+        return float("inf")
+    return interquartile_range(values) / median
+
+
+class Benchmark:
+    """Measures solutions precisely enough to rank them.
+
+    Solutions never run on the game server: every worker is a Piston
+    job running the harness, which runs the solution in a fresh process
+    per run after untimed warmup runs. Workers run one after another to
+    not compete for the CPU, and benchmarks wait for each other, not for
+    the players' runs. Slow solutions get fewer warmup and timed runs,
+    so that the runs fit into the timeout.
+
+    :param executor: The executor sending the jobs to Piston.
+    :param workers: The amount of Piston jobs.
+    :param warmup: The maximum amount of untimed runs per worker, at least 1.
+    :param repeat: The maximum amount of timed runs per worker.
+    :param min_repeat: The amount of timed runs per worker below which
+                       a solution is too slow to be benchmarked.
+    :param max_spread: The largest relative spread of CPU times accepted.
+    :param max_concurrent: The maximum amount of benchmarks at once.
+    :param timeout: Seconds a worker may take, the executor's timeout by default.
+                    Piston stops the whole job when it is over.
+    :attr BUDGET: The share of the timeout the harness spends on runs,
+                  the rest is left for its own start and output.
+    """
+
+    BUDGET = 0.8
+
+    def __init__(
+        self,
+        executor: Executor,
+        *,
+        workers: int = 3,
+        warmup: int = 2,
+        repeat: int = 7,
+        min_repeat: int = 3,
+        max_spread: float = 0.2,
+        max_concurrent: int = 1,
+        timeout: Optional[float] = None,
+    ):
+        self.executor = executor
+        self.workers = workers
+        self.warmup = warmup
+        self.repeat = repeat
+        self.min_repeat = min_repeat
+        self.max_spread = max_spread
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.timeout = timeout or executor.timeout
+
+    async def _measure(self, code: str) -> Optional[dict]:
+        """Runs one worker on Piston, None if the code failed or the result is not the harness'."""
+        nonce = secrets.token_hex(16)
+        job = {
+            "warmup": self.warmup,
+            "repeat": self.repeat,
+            "min_repeat": self.min_repeat,
+            "budget": self.timeout * self.BUDGET,
+        }
+        try:
+            run = await self.executor.execute(
+                [{"name": "harness.py", "content": HARNESS}, {"name": "solution.py", "content": code}],
+                stdin=f"{nonce}\n{json.dumps(job)}\n",
+                timeout=self.timeout,
+            )
+        except ExecutorError:
+            return None
+
+        if run.get("code") != 0:
+            return None
+        for line in reversed((run.get("stdout") or "").splitlines()):
+            if line.startswith(nonce):
+                try:
+                    return json.loads(line[len(nonce):])
+                except ValueError:
+                    return None
+        return None
+
+    async def run(self, code: str) -> Optional[BenchmarkResult]:
+        """Benchmarks a solution.
+
+        A solution's time is the median of every run's CPU time minus
+        the preceding empty run's. It is rejected when that is not above
+        the spread of the empty runs alone, the start of the interpreter
+        would then decide the ranking.
+
+        :param code: The solution.
+        :return: The measurements, or None if the code failed, was too
+                 slow or the measurements were too noisy to be trusted.
+        """
+        measurements = []
+        async with self.semaphore:
+            for _ in range(self.workers):
+                measurement = await self._measure(code)
+                if measurement is None:
+                    return None
+                measurements.append(measurement)
+
+        net = [
+            time - empty
+            for measurement in measurements
+            for time, empty in zip(measurement["cpu"], measurement["empty_cpu"])
+        ]
+        empty_cpu = [time for measurement in measurements for time in measurement["empty_cpu"]]
+        median = statistics.median(net)
+        if median <= interquartile_range(empty_cpu):
+            return None
+        spread = relative_spread(net)
+        if spread > self.max_spread:
+            return None
+
+        maxrss = [size for measurement in measurements for size in measurement["maxrss"]]
+        empty_maxrss = [size for measurement in measurements for size in measurement["empty_maxrss"]]
+        return BenchmarkResult(
+            time=median,
+            time_spread=spread,
+            memory=max(statistics.median(maxrss) - statistics.median(empty_maxrss), 0.0),
+        )
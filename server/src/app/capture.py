@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional
+
+# fmt: off
+__all__ = (
+    'TrafficCapture',
+    'read_capture',
+)
+# fmt: on
+
+# The sequence number of the inbound frame being handled, set while
+# parsing it so the frames sent in response can refer back to it.
+current_cause: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "current_cause", default=None
+)
+
+CONNECT = "c"
+DISCONNECT = "x"
+INBOUND = "i"
+OUTBOUND = "o"
+# Fields of a frame's data holding a username, and fields of server messages that may mention it.
+USERNAME_FIELDS = ("author", "to")
+TEXT_FIELDS = ("error",)
+
+
+class TrafficCapture:
+    """Records websocket traffic to an append-only file.
+
+    Every line is a compact JSON array of
+    `[time, seq, connection, kind, cause, payload]` where `time` is
+    relative to the start of the capture, `connection` is a small
+    integer standing in for the connection id and `cause` is the
+    sequence number of the inbound frame an outbound frame answers.
+    Usernames are replaced with salted hashes, also where a server
+    message mentions them. The file is flushed every `flush_interval`
+    seconds, so a crash loses little of the capture.
+
+    :param path: The path of the capture file.
+    :param flush_interval: The most seconds records stay buffered.
+    """
+
+    def __init__(self, path: str, *, flush_interval: float = 1.0):
+        self.file = open(path, "a", encoding="utf-8")
+        self.salt = os.urandom(16)
+        self.started = time.monotonic()
+        self.flush_interval = flush_interval
+        self.flushed = self.started
+
+        self.seq = 0
+        self.connections: Dict[uuid.UUID, int] = {}
+        self.connection_count = 0
+
+    def anonymize(self, username: str) -> str:
+        """Replaces a username with a stable pseudonym for this capture."""
+        return "user-" + hashlib.blake2b(username.encode(), key=self.salt, digest_size=4).hexdigest()
+
+    def _scrub(self, payload: Any) -> Any:
+        data = payload.get("data") if isinstance(payload, dict) else None
+        if not isinstance(data, dict):
+            return payload
+        usernames = {field: data[field] for field in USERNAME_FIELDS if isinstance(data.get(field), str)}
+        if not usernames:
+            return payload
+
+        scrubbed = {**data, **{field: self.anonymize(username) for field, username in usernames.items()}}
+        for field in TEXT_FIELDS:
+            text = data.get(field)
+            if isinstance(text, str):
+                for username in filter(None, usernames.values()):
+                    text = text.replace(username, self.anonymize(username))
+                scrubbed[field] = text
+        return {**payload, "data": scrubbed}
+
+    def _write(self, connection_id: uuid.UUID, kind: str, cause: Optional[int], payload: Any) -> int:
+        self.seq += 1
+        number = self.connections.get(connection_id)
+        if number is None:
+            number = self.connections[connection_id] = self.connection_count
+            self.connection_count += 1
+        now = time.monotonic()
+        line = [round(now - self.started, 6), self.seq, number, kind, cause, payload]
+        self.file.write(json.dumps(line, separators=(",", ":")) + "\n")
+        if now - self.flushed >= self.flush_interval:
+            self.file.flush()
+            self.flushed = now
+        return self.seq
+
+    def connect(self, connection_id: uuid.UUID, username: str):
+        """Records a new connection."""
+        self._write(connection_id, CONNECT, None, {"username": self.anonymize(username)})
+
+    def disconnect(self, connection_id: uuid.UUID):
+        """Records a closed connection."""
+        self._write(connection_id, DISCONNECT, None, None)
+        self.connections.pop(connection_id, None)
+
+    def inbound(self, connection_id: uuid.UUID, payload: Any) -> int:
+        """Records a frame received from a client.
+
+        :return: The sequence number of the frame, to be set as `current_cause`.
+        """
+        return self._write(connection_id, INBOUND, None, self._scrub(payload))
+
+    def outbound(self, connection_id: uuid.UUID, payload: Any):
+        """Records a frame sent to a client, caused by `current_cause`."""
+        self._write(connection_id, OUTBOUND, current_cause.get(), self._scrub(payload))
+
+    def close(self):
+        """Flushes and closes the capture file."""
+        self.file.close()
+
+
+def read_capture(path: str) -> Iterator[List[Any]]:
+    """Reads the records of a capture file in order."""
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
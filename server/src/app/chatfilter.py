@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+# fmt: off
+__all__ = (
+    'ACTIONS',
+    'Automaton',
+    'ChatFilter',
+    'FilterResult',
+    'parse_word_list',
+)
+# fmt: on
+
+log = logging.getLogger(__name__)
+
+FLAG = "flag"
+MASK = "mask"
+DROP = "drop"
+# Ordered by severity, the most severe action of the matches is taken.
+ACTIONS = (FLAG, MASK, DROP)
+
+
+def parse_word_list(lines: Iterable[str]) -> List[Tuple[str, str]]:
+    """Reads the terms of a word list.
+
+    Every line is an action followed by a term, e.g. `mask darn`.
+    Blank lines and lines starting with `#` are ignored.
+
+    :param lines: The lines of the word list.
+    :return: The term and action of every entry.
+    :raises ValueError: A line has an unknown action.
+    """
+    terms = []
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        action, _, term = line.partition(" ")
+        if action not in ACTIONS or not term.strip():
+            raise ValueError(f"line {number}: expected one of {', '.join(ACTIONS)} followed by a term")
+        terms.append((term.strip(), action))
+    return terms
+
+
+def fold(text: str) -> str:
+    """Lowercases text without changing its length, so match positions stay valid."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(char if len(char.lower()) != 1 else char.lower() for char in text)
+
+
+class Automaton:
+    """An Aho-Corasick automaton finding every term in one pass over a text.
+
+    :param terms: The term and action of every entry, matched case-insensitively.
+    """
+
+    def __init__(self, terms: Iterable[Tuple[str, str]]):
+        # Every node has transitions, a failure link, the term ending at it
+        # as (length, action) and a link to the next node on its failure
+        # chain that ends a term, so matches are reported without walking
+        # the whole chain.
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Optional[Tuple[int, str]]] = [None]
+        self.output_link: List[int] = [0]
+        self.size = 0
+
+        for term, action in terms:
+            term = fold(term)
+            node = 0
+            for char in term:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = self.goto[node][char] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                    self.output_link.append(0)
+                node = next_node
+            current = self.output[node]
+            if current is None or ACTIONS.index(action) > ACTIONS.index(current[1]):
+                self.output[node] = (len(term), action)
+            self.size += 1
+
+        queue: Deque[int] = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output_link[child] = (
+                    self.fail[child]
+                    if self.output[self.fail[child]] is not None
+                    else self.output_link[self.fail[child]]
+                )
+
+    def matches(self, text: str, *, whole_words: bool = False) -> List[Tuple[int, int, str]]:
+        """Finds every occurrence of a term.
+
+        :param text: The text to scan.
+        :param whole_words: Only find terms not surrounded by letters or digits.
+        :return: The start, end and action of every occurrence.
+        """
+        goto, fail, output, output_link = self.goto, self.fail, self.output, self.output_link
+        found = []
+        node = 0
+        for end, char in enumerate(fold(text), start=1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            if whole_words and end < len(text) and text[end].isalnum():
+                continue
+            match = node if output[node] is not None else output_link[node]
+            while match:
+                length, action = output[match]
+                start = end - length
+                if not (whole_words and start and text[start - 1].isalnum()):
+                    found.append((start, end, action))
+                match = output_link[match]
+        return found
+
+
+class FilterResult:
+    """The outcome of filtering a chat message.
+
+    :param action: The most severe action of the matched terms, None if nothing matched.
+    :param text: The message with the terms to mask replaced by `*`.
+    :param terms: The matched terms as they were written.
+    """
+
+    def __init__(self, action: Optional[str], text: str, terms: List[str]):
+        self.action = action
+        self.text = text
+        self.terms = terms
+
+    @property
+    def dropped(self) -> bool:
+        """Whether the message must not be delivered."""
+        return self.action == DROP
+
+    @property
+    def flagged(self) -> bool:
+        """Whether the message matched a term to flag or mask."""
+        return self.action is not None
+
+
+class ChatFilter:
+    """Filters chat messages against a word list.
+
+    The word list is reloaded when its file changes. A new automaton
+    is built on a worker thread and then swapped in with one
+    assignment, so messages are always checked against a complete list.
+    Only whole words match, so terms are not found inside longer words.
+
+    :param path: The path of the word list, None to not filter.
+    :param max_flagged: The amount of recently flagged messages kept.
+    """
+
+    def __init__(self, path: Optional[str], *, max_flagged: int = 1000):
+        self.path = path
+        self.automaton = Automaton(())
+        self.mtime: Optional[float] = None
+        self.flagged: Deque[Dict[str, object]] = deque(maxlen=max_flagged)
+
+    def load(self) -> bool:
+        """Rebuilds the automaton if the word list changed.
+
+        Blocks while building, run it in a thread from async code.
+
+        :return: Whether a new word list was loaded.
+        """
+        if self.path is None:
+            return False
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self.mtime:
+            return False
+        with open(self.path, encoding="utf-8") as file:
+            automaton = Automaton(parse_word_list(file))
+        self.automaton, self.mtime = automaton, mtime
+        return True
+
+    async def watch(self, interval: float = 2):
+        """Reloads the word list whenever it changes, until cancelled.
+
+        :param interval: Seconds between two checks of the file.
+        """
+        while True:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.load)
+            except (OSError, ValueError) as error:
+                # Keep filtering with the previous list until the file is fixed.
+                log.warning("Could not load the chat word list: %s", error)
+            await asyncio.sleep(interval)
+
+    def check(self, text: str) -> FilterResult:
+        """Finds the terms in a message and applies their actions.
+
+        :param text: The message.
+        """
+        matches = self.automaton.matches(text, whole_words=True)
+        if not matches:
+            return FilterResult(None, text, [])
+
+        action = max((action for _, _, action in matches), key=ACTIONS.index)
+        masked = list(text)
+        for start, end, match_action in matches:
+            if match_action != FLAG:
+                masked[start:end] = "*" * (end - start)
+        return FilterResult(action, "".join(masked), [text[start:end] for start, end, _ in matches])
+
+    def record(self, author: str, level: Optional[int], text: str, result: FilterResult):
+        """Keeps a flagged message for review.
+
+        :param author: The username of the author.
+        :param level: The level the author was on.
+        :param text: The message as it was sent.
+        :param result: The result of checking it.
+        """
+        self.flagged.append(
+            {"author": author, "level": level, "content": text, "action": result.action, "terms": result.terms}
+        )
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# fmt: off
+__all__ = (
+    'Room',
+)
+# fmt: on
+
+Position = Tuple[Tuple[int, int], ...]
+
+
+def parse_position(raw: Any) -> Optional[Position]:
+    """Parses a position identifier received from a client.
+
+    :param raw: A list of `[digit, site]` pairs.
+    :return: The position as a tuple or None if it is malformed.
+    """
+    if not isinstance(raw, list) or not raw or len(raw) > Room.MAX_DEPTH:
+        return None
+    position = []
+    for pair in raw:
+        if (
+            not isinstance(pair, list)
+            or len(pair) != 2
+            or not all(isinstance(part, int) for part in pair)
+        ):
+            return None
+        position.append((pair[0], pair[1]))
+    return tuple(position)
+
+
+def expand(position: Position, count: int) -> List[Position]:
+    """Gets the positions of a run of characters inserted together.
+
+    The characters of a run take consecutive digits at the
+    last level of the position of the first one.
+
+    :param position: The position of the first character.
+    :param count: The length of the run.
+    """
+    *prefix, (digit, site) = position
+    return [(*prefix, (digit + offset, site)) for offset in range(count)]
+
+
+class Room:
+    """Represents the shared code input of a level.
+
+    The document is stored as a mapping of position identifiers to
+    characters. Positions are totally ordered, so inserts and deletes
+    commute and every operation is folded into the state on receipt,
+    keeping the room compacted without tombstones or an operation log.
+
+    :attr MAX_LENGTH: The maximum amount of characters in a document.
+    :attr MAX_DEPTH: The maximum length of a position identifier.
+    """
+
+    MAX_LENGTH = 200_000
+    MAX_DEPTH = 32
+
+    def __init__(self):
+        self.members: Set[uuid.UUID] = set()
+        self.document: Dict[Position, str] = {}
+        self._snapshot: Optional[List[List[Any]]] = None
+
+    def apply(self, ops: List[List[Any]], *, seed: bool = False) -> Tuple[List[List[Any]], bool]:
+        """Applies a batch of operations to the document.
+
+        Inserts that would overwrite another character or grow the
+        document past `MAX_LENGTH` are rejected, as is a seed of a room
+        someone else seeded first, so the sender can be resynchronised
+        instead of silently diverging from the room.
+
+        :param ops: `["i", position, text]` and `["d", position]` operations.
+        :param seed: Whether the batch seeds an empty room.
+        :return: The operations that were valid and applied
+                 and whether any operation was rejected.
+        """
+        if seed and self.document:
+            return [], True
+
+        applied = []
+        rejected = False
+        for op in ops:
+            if not isinstance(op, list) or len(op) < 2:
+                continue
+
+            position = parse_position(op[1])
+            if position is None:
+                continue
+
+            if op[0] == "i" and len(op) == 3:
+                text = op[2]
+                if not isinstance(text, str) or not text:
+                    continue
+                positions = expand(position, len(text))
+                existing = [self.document.get(position) for position in positions]
+                if existing == list(text):
+                    # Already applied, e.g. two replicas sent the same operation.
+                    continue
+                if any(existing) or len(self.document) + len(text) > self.MAX_LENGTH:
+                    rejected = True
+                    continue
+                self.document.update(zip(positions, text))
+            elif op[0] == "d" and len(op) == 2:
+                if self.document.pop(position, None) is None:
+                    continue
+            else:
+                continue
+            applied.append(op)
+
+        if applied:
+            self._snapshot = None
+        return applied, rejected
+
+    def snapshot(self) -> List[List[Any]]:
+        """Gets the document as a list of `[position, char]` in order."""
+        if self._snapshot is None:
+            self._snapshot = [
+                [[list(pair) for pair in position], char]
+                for position, char in sorted(self.document.items())
+            ]
+        return self._snapshot
@@ -1,8 +1,56 @@
+import os
+from typing import List, Optional
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+# Accounts, levels and progress, rarely written.
+SQLITE_DATABASE_PATH = "./sql_app.db"
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{SQLITE_DATABASE_PATH}"
+
+# Submitted solutions and their similarity index, written on every submission.
+SOLUTIONS_DATABASE_PATH = "./solutions.db"
+SOLUTIONS_DATABASE_URL = f"sqlite:///{SOLUTIONS_DATABASE_PATH}"
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+solutions_engine = create_engine(SOLUTIONS_DATABASE_URL, connect_args={"check_same_thread": False})
 
 Base = declarative_base()
+
+
+class ShardRouter:
+    """Picks the database file of sharded data.
+
+    Chat messages are partitioned by level, so every shard has its
+    own SQLite write lock and writer. Messages sent outside of a
+    level go to the first shard. Changing the amount of shards
+    does not move stored messages, searches of a level then miss
+    the messages stored before.
+
+    :param directory: The directory of the shard files.
+    :param chat_shards: The amount of chat shards.
+    :attr chat_engines: Engines of every chat shard, e.g. to migrate them.
+    """
+
+    def __init__(self, directory: str = ".", *, chat_shards: int = 4):
+        self.chat_paths: List[str] = [
+            os.path.join(directory, f"chat_{shard}.db") for shard in range(max(chat_shards, 1))
+        ]
+        self.chat_engines: List[Engine] = [create_engine(f"sqlite:///{path}") for path in self.chat_paths]
+
+    def chat_shard(self, level: Optional[int]) -> int:
+        """The number of the chat shard of a level."""
+        return 0 if level is None else level % len(self.chat_paths)
+
+    def chat_path(self, level: Optional[int]) -> str:
+        """The database file of the chat shard of a level."""
+        return self.chat_paths[self.chat_shard(level)]
+
+    def dispose(self):
+        """Closes the pooled connections of the chat engines."""
+        for engine in self.chat_engines:
+            engine.dispose()
+
+
+router = ShardRouter(chat_shards=int(os.environ.get("CJ9_CHAT_SHARDS", 4)))
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import signal
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+from .tracing import Tracer
+
+# fmt: off
+__all__ = (
+    'Executor',
+    'ExecutorError',
+    'PUBLIC_PISTON_URL',
+    'RunResult',
+)
+# fmt: on
+
+log = logging.getLogger(__name__)
+
+# Has no websocket API, output arrives in one piece once the run finished.
+PUBLIC_PISTON_URL = "https://emkc.org/api/v2/piston"
+
+
+class ExecutorError(Exception):
+    """Piston could not run the code."""
+
+
+class RunResult:
+    """The result of running code.
+
+    :param code: The exit code, negative if killed by a signal.
+    :param truncated: Whether the output went over the limit and the run was stopped.
+    :param timed_out: Whether the run was stopped by the timeout.
+    :param error: Why the code could not be run, None if it ran.
+    """
+
+    def __init__(
+        self, code: int, *, truncated: bool = False, timed_out: bool = False, error: Optional[str] = None
+    ):
+        self.code = code
+        self.truncated = truncated
+        self.timed_out = timed_out
+        self.error = error
+
+
+def exit_code(code: Optional[int], signal_name: Optional[str]) -> int:
+    """Gets the exit code of a Piston stage, negative if it was killed by a signal."""
+    if code is not None:
+        return code
+    try:
+        return -signal.Signals[signal_name].value
+    except KeyError:
+        return -1
+
+
+class Executor:
+    """Runs user code on Piston and streams its output.
+
+    Code never runs on the game server. Piston runs every job in its
+    own sandbox without network access, on a throwaway filesystem and
+    with its own time, memory and process limits. Output is streamed
+    through Piston's websocket API, which the public instance used by
+    default does not expose. Without it output does NOT stream, clients
+    get all of it once the run finished; set `CJ9_PISTON_URL` to a
+    self-hosted Piston for streaming.
+
+    :param url: The base URL of the Piston API.
+    :param max_concurrent: The maximum amount of runs at once.
+    :param timeout: Seconds a run may take.
+    :param max_output: The maximum amount of output characters per run.
+    :param tracer: Records the time runs spend queued, connecting and running.
+    """
+
+    LANGUAGE = "python"
+    VERSION = "3.10"
+    # Seconds added to the timeout for the round trips to Piston.
+    GRACE = 5
+
+    def __init__(
+        self,
+        url: str = PUBLIC_PISTON_URL,
+        *,
+        max_concurrent: int = 4,
+        timeout: float = 3,
+        max_output: int = 1_000_000,
+        tracer: Optional[Tracer] = None,
+    ):
+        self.url = url.rstrip("/")
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.timeout = timeout
+        self.max_output = max_output
+        self.tracer = tracer or Tracer(None, service="executor")
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._streaming = True
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The HTTP session used for Piston, created on first use."""
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        """Closes the HTTP session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def job(
+        self, files: List[Dict[str, str]], *, stdin: str = "", timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Builds a Piston job running the first of the files.
+
+        :param files: The name and content of every file.
+        :param stdin: The input of the program.
+        :param timeout: Seconds the program may run, the executor's timeout by default.
+        """
+        return {
+            "language": self.LANGUAGE,
+            "version": self.VERSION,
+            "files": files,
+            "stdin": stdin,
+            "run_timeout": int((timeout or self.timeout) * 1000),
+        }
+
+    async def execute(
+        self, files: List[Dict[str, str]], *, stdin: str = "", timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Runs a job on Piston and waits for its result.
+
+        :param files: The name and content of every file, the first one is run.
+        :param stdin: The input of the program.
+        :param timeout: Seconds the program may run, the executor's timeout by default.
+        :return: The `stdout`, `stderr`, `output`, `code` and `signal` of the run.
+        :raises ExecutorError: Piston could not be reached or refused the job.
+        """
+        job = self.job(files, stdin=stdin, timeout=timeout)
+        try:
+            async with self.session.post(
+                f"{self.url}/execute",
+                json=job,
+                timeout=aiohttp.ClientTimeout(total=(timeout or self.timeout) + self.GRACE),
+            ) as request:
+                response = await request.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as error:
+            raise ExecutorError(f"Could not reach the code runner: {error or type(error).__name__}") from error
+
+        if not isinstance(response, dict) or "run" not in response:
+            message = response.get("message") if isinstance(response, dict) else None
+            raise ExecutorError(f"The code runner refused the code: {message or response}")
+        return response["run"]
+
+    async def run(self, code: str, on_output: Callable[[str], Awaitable[None]]) -> RunResult:
+        """Runs code, passing its output to `on_output` as it is printed.
+
+        Cancelling the task running this kills the run on Piston.
+
+        :param code: The code to run.
+        :param on_output: Called with every chunk of output.
+        """
+        with self.tracer.span("executor.queue"):
+            await self.semaphore.acquire()
+        try:
+            with self.tracer.span("executor.run") as span:
+                try:
+                    if self._streaming:
+                        result = await self._stream(code, on_output)
+                    else:
+                        result = await self._run_once(code, on_output)
+                except ExecutorError as error:
+                    result = RunResult(-1, error=str(error))
+                if span is not None:
+                    span.attributes.update(code=result.code, timed_out=result.timed_out, streamed=self._streaming)
+                return result
+        finally:
+            self.semaphore.release()
+
+    async def _stream(self, code: str, on_output: Callable[[str], Awaitable[None]]) -> RunResult:
+        """Runs code through Piston's websocket API."""
+        try:
+            with self.tracer.span("executor.connect"):
+                socket = await asyncio.wait_for(self.session.ws_connect(f"{self.url}/connect"), self.GRACE)
+        except aiohttp.WSServerHandshakeError:
+            # Remembered, so later runs do not try to connect again.
+            self._streaming = False
+            log.warning("%s has no websocket API, output is sent once runs finished instead of streamed", self.url)
+            return await self._run_once(code, on_output)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            raise ExecutorError(f"Could not reach the code runner: {error or type(error).__name__}") from error
+
+        started = time.monotonic()
+        received = 0
+        finished = False
+        try:
+            await socket.send_json({"type": "init", **self.job([{"name": "code.py", "content": code}])})
+            while True:
+                try:
+                    message = await socket.receive(timeout=self.timeout + self.GRACE)
+                except asyncio.TimeoutError:
+                    return RunResult(-signal.SIGKILL, timed_out=True)
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    raise ExecutorError("The code runner closed the connection")
+
+                try:
+                    event = json.loads(message.data)
+                except ValueError:
+                    raise ExecutorError("The code runner sent an invalid message") from None
+                if event.get("type") == "data":
+                    text = event.get("data", "")
+                    allowed = self.max_output - received
+                    if len(text) > allowed:
+                        await on_output(text[:allowed])
+                        return RunResult(-signal.SIGKILL, truncated=True)
+                    received += len(text)
+                    await on_output(text)
+                elif event.get("type") == "exit" and event.get("stage") == "run":
+                    finished = True
+                    result = exit_code(event.get("code"), event.get("signal"))
+                    timed_out = result == -signal.SIGKILL and time.monotonic() - started >= self.timeout
+                    return RunResult(result, timed_out=timed_out)
+                elif event.get("type") == "error":
+                    raise ExecutorError(f"The code runner refused the code: {event.get('message')}")
+        finally:
+            if not finished and not socket.closed:
+                with contextlib.suppress(aiohttp.ClientError, ConnectionError, RuntimeError):
+                    await socket.send_json({"type": "signal", "signal": "SIGKILL"})
+            await socket.close()
+
+    async def _run_once(self, code: str, on_output: Callable[[str], Awaitable[None]]) -> RunResult:
+        """Runs code through Piston's HTTP API, passing all output at once."""
+        run = await self.execute([{"name": "code.py", "content": code}])
+        output = run.get("output") or ""
+        truncated = len(output) > self.max_output
+        if output:
+            await on_output(output[:self.max_output])
+        result = exit_code(run.get("code"), run.get("signal"))
+        # Without the stream there is no elapsed time, Piston kills runs going over the timeout.
+        timed_out = result == -signal.SIGKILL and not truncated
+        return RunResult(result, truncated=truncated, timed_out=timed_out)
@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import os
+import re
+import sys
+import time
+from typing import Callable, Dict, Iterable, List
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+
+from . import models, similarity
+from .database import ShardRouter
+from .search import SEARCH_QUERY
+
+# fmt: off
+__all__ = (
+    'CHAT',
+    'HOT_QUERIES',
+    'MAIN',
+    'SOLUTIONS',
+    'QueryPlanError',
+    'check_query_plans',
+    'import_unsharded',
+    'migrate',
+)
+# fmt: on
+
+# The schemas of the database files, see `app.database`.
+MAIN = "main"
+SOLUTIONS = "solutions"
+CHAT = "chat"
+
+MIGRATIONS: Dict[str, List[Callable[[Connection], None]]] = {MAIN: [], SOLUTIONS: [], CHAT: []}
+
+# Queries run on every request or websocket handshake, with sample parameters.
+HOT_QUERIES: Dict[str, Dict[str, tuple[str, Dict[str, object]]]] = {
+    MAIN: {
+        "user by token": ("SELECT * FROM users WHERE token=:token", {"token": ""}),
+        "login": (
+            "SELECT * FROM users WHERE username=:username AND password=:password",
+            {"username": "", "password": ""},
+        ),
+        "progress by user": (
+            "SELECT level, completed_at, best_time FROM progress WHERE user_id=:user_id",
+            {"user_id": 0},
+        ),
+    },
+    SOLUTIONS: {
+        "solutions by user": ("SELECT * FROM solutions WHERE user_id=:user_id", {"user_id": 0}),
+    },
+    CHAT: {
+        "search": (SEARCH_QUERY.format(filters=""), {"query": '"hello"', "limit": 20, "candidates": 1000}),
+        "search by author": (
+            SEARCH_QUERY.format(filters="AND messages.author = :author "),
+            {"query": '"hello"', "limit": 20, "candidates": 1000, "author": ""},
+        ),
+        "search by level": (
+            SEARCH_QUERY.format(filters="AND messages.level = :level "),
+            {"query": '"hello"', "limit": 20, "candidates": 1000, "level": 0},
+        ),
+    },
+}
+
+# A virtual table is read through its own index, e.g. FTS5's MATCH, if the plan names one.
+VIRTUAL_TABLE_INDEX = re.compile(r"SCAN \S+ VIRTUAL TABLE INDEX \d+:\S+")
+
+
+class QueryPlanError(Exception):
+    """Raised when a hot query is planned as a full table scan."""
+
+
+def migration(*schemas: str) -> Callable[[Callable[[Connection], None]], Callable[[Connection], None]]:
+    """Registers a migration of the given schemas. Migrations run in the order they are defined."""
+
+    def decorator(func: Callable[[Connection], None]) -> Callable[[Connection], None]:
+        for schema in schemas:
+            MIGRATIONS[schema].append(func)
+        return func
+
+    return decorator
+
+
+def add_column(connection: Connection, table: str, definition: str):
+    """Adds a column to a table unless it already exists.
+
+    Tables created by a later baseline, e.g. of a new database
+    file, may already have the column.
+
+    :param table: The name of the table.
+    :param definition: The column definition, starting with its name.
+    """
+    name = definition.split()[0]
+    columns = connection.execute(text(f"PRAGMA table_info({table})")).fetchall()
+    if name not in {column[1] for column in columns}:
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {definition}"))
+
+
+def execute_all(connection: Connection, statements: Iterable[str]):
+    """Runs DDL statements in order.
+
+    Migrations spell out their tables instead of creating them from
+    `app.models`, so a migration keeps creating the same schema when
+    the models change and later migrations still apply to it.
+    """
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+@migration(MAIN)
+def baseline(connection: Connection):
+    """Creates the tables that existed before versioned migrations."""
+    execute_all(
+        connection,
+        (
+            "CREATE TABLE IF NOT EXISTS users ("
+            "id INTEGER NOT NULL, token VARCHAR, username VARCHAR, password VARCHAR NOT NULL, "
+            "is_active BOOLEAN, PRIMARY KEY (id))",
+            "CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+            "CREATE TABLE IF NOT EXISTS codes ("
+            "id INTEGER NOT NULL, title VARCHAR, bugged_code VARCHAR, documentation VARCHAR, "
+            "tests VARCHAR, PRIMARY KEY (id))",
+            "CREATE INDEX IF NOT EXISTS ix_codes_id ON codes (id)",
+            "CREATE INDEX IF NOT EXISTS ix_codes_title ON codes (title)",
+            "CREATE TABLE IF NOT EXISTS solutions ("
+            "id INTEGER NOT NULL, solution VARCHAR, documentation VARCHAR, tests VARCHAR, "
+            "time FLOAT, memory FLOAT, user_id INTEGER, PRIMARY KEY (id), "
+            "FOREIGN KEY(user_id) REFERENCES users (id))",
+            "CREATE INDEX IF NOT EXISTS ix_solutions_id ON solutions (id)",
+            "CREATE TABLE IF NOT EXISTS progress ("
+            "id INTEGER NOT NULL, user_id INTEGER NOT NULL, level INTEGER NOT NULL, "
+            "completed_at FLOAT, best_time FLOAT, PRIMARY KEY (id), UNIQUE (user_id, level), "
+            "FOREIGN KEY(user_id) REFERENCES users (id))",
+            "CREATE INDEX IF NOT EXISTS ix_progress_id ON progress (id)",
+        ),
+    )
+
+
+@migration(MAIN)
+def hot_path_indexes(connection: Connection):
+    """Indexes the columns the token and solution lookups filter on."""
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_users_token ON users (token)"))
+    connection.execute(
+        text("CREATE INDEX IF NOT EXISTS ix_solutions_user_id ON solutions (user_id)")
+    )
+
+
+@migration(MAIN, CHAT)
+def message_search(connection: Connection):
+    """Creates the chat messages and their FTS5 full text index."""
+    execute_all(
+        connection,
+        (
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER NOT NULL, author VARCHAR NOT NULL, level INTEGER, content VARCHAR NOT NULL, "
+            "created_at FLOAT NOT NULL, PRIMARY KEY (id))",
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts "
+            "USING fts5(content, content='messages', content_rowid='id')",
+            "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+            "INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content); "
+            "END",
+        ),
+    )
+
+
+@migration(MAIN)
+def solution_similarity(connection: Connection):
+    """Adds the benchmark and similarity scores of solutions and the similarity index."""
+    add_column(connection, "solutions", "time FLOAT")
+    add_column(connection, "solutions", "memory FLOAT")
+    add_column(connection, "solutions", "similarity FLOAT")
+    add_column(connection, "solutions", "duplicate_of INTEGER")
+    execute_all(connection, similarity.SCHEMA)
+
+
+@migration(SOLUTIONS)
+def solutions_baseline(connection: Connection):
+    """Creates the solutions and their similarity index."""
+    execute_all(
+        connection,
+        (
+            "CREATE TABLE IF NOT EXISTS solutions ("
+            "id INTEGER NOT NULL, solution VARCHAR, documentation VARCHAR, tests VARCHAR, "
+            "time FLOAT, memory FLOAT, similarity FLOAT, duplicate_of INTEGER, user_id INTEGER, "
+            "PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))",
+            "CREATE INDEX IF NOT EXISTS ix_solutions_id ON solutions (id)",
+            "CREATE INDEX IF NOT EXISTS ix_solutions_user_id ON solutions (user_id)",
+            *similarity.SCHEMA,
+        ),
+    )
+
+
+@migration(MAIN)
+def unsharded_imports(connection: Connection):
+    """Records what `import_unsharded` copied out of the main database."""
+    connection.execute(
+        text("CREATE TABLE IF NOT EXISTS unsharded_imports (name VARCHAR NOT NULL PRIMARY KEY, imported_at FLOAT)")
+    )
+
+
+def migrate(engine: Engine, schema: str = MAIN) -> int:
+    """Runs every migration newer than the database's schema version.
+
+    :param engine: The engine of the database to migrate.
+    :param schema: Which of the database files it is.
+    :return: The schema version after migrating.
+    """
+    with engine.begin() as connection:
+        version = connection.execute(text("PRAGMA user_version")).scalar()
+
+    for number, func in enumerate(MIGRATIONS[schema][version:], start=version + 1):
+        with engine.begin() as connection:
+            func(connection)
+            connection.execute(text(f"PRAGMA user_version = {number}"))
+    return len(MIGRATIONS[schema])
+
+
+def _is_empty(connection: Connection, table: str) -> bool:
+    return connection.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM {table})")).scalar()
+
+
+def _is_imported(connection: Connection, name: str) -> bool:
+    return connection.execute(
+        text("SELECT EXISTS (SELECT 1 FROM legacy.unsharded_imports WHERE name = :name)"), {"name": name}
+    ).scalar()
+
+
+def _mark_imported(connection: Connection, name: str):
+    connection.execute(
+        text("INSERT OR IGNORE INTO legacy.unsharded_imports (name, imported_at) VALUES (:name, :now)"),
+        {"name": name, "now": time.time()},
+    )
+
+
+def import_unsharded(path: str, solutions_engine: Engine, router: ShardRouter):
+    """Copies the solutions and chat messages of the main database into their shards.
+
+    Before sharding they were stored in the main database, where
+    they are kept. The main database, which must be migrated first,
+    records every finished import, so this is safe to run on every
+    start and changing the amount of chat shards later does not copy
+    the messages again. Shards that already have messages, e.g. of an
+    interrupted import, are skipped.
+
+    :param path: The path of the main database.
+    :param solutions_engine: The engine of the solutions database.
+    :param router: Picks the chat shard of the messages.
+    """
+    if not os.path.exists(path):
+        return
+
+    columns = ", ".join(column.name for column in models.Solution.__table__.columns)
+    with solutions_engine.connect() as connection:
+        connection.execute(text("ATTACH DATABASE :path AS legacy"), {"path": path})
+        with connection.begin():
+            if not _is_imported(connection, "solutions"):
+                if _is_empty(connection, "main.solutions"):
+                    connection.execute(
+                        text(f"INSERT INTO main.solutions ({columns}) SELECT {columns} FROM legacy.solutions")
+                    )
+                    for table in ("solution_signatures", "solution_bands"):
+                        connection.execute(
+                            text(f"INSERT OR IGNORE INTO main.{table} SELECT * FROM legacy.{table}")
+                        )
+                _mark_imported(connection, "solutions")
+        connection.execute(text("DETACH DATABASE legacy"))
+
+    for shard, engine in enumerate(router.chat_engines):
+        with engine.connect() as connection:
+            connection.execute(text("ATTACH DATABASE :path AS legacy"), {"path": path})
+            with connection.begin():
+                imported = _is_imported(connection, "messages")
+                if not imported and _is_empty(connection, "main.messages"):
+                    connection.execute(
+                        text(
+                            "INSERT INTO main.messages (author, level, content, created_at) "
+                            "SELECT author, level, content, created_at FROM legacy.messages "
+                            "WHERE COALESCE(level, 0) % :count = :shard ORDER BY id"
+                        ),
+                        {"count": len(router.chat_paths), "shard": shard},
+                    )
+                # Marked with the last shard, an interrupted import continues with the shards still empty.
+                if not imported and shard == len(router.chat_paths) - 1:
+                    _mark_imported(connection, "messages")
+            connection.execute(text("DETACH DATABASE legacy"))
+        if imported:
+            break
+
+
+def check_query_plans(engine: Engine, schema: str = MAIN):
+    """Checks that no hot query is planned as a full table scan.
+
+    Run `python -m app.migrations --check` to migrate a scratch
+    database and check it, e.g. in CI.
+
+    :param engine: The engine of a migrated database.
+    :param schema: Which of the database files it is.
+    :raises QueryPlanError: A hot query scans a table.
+    """
+    with engine.connect() as connection:
+        for name, (query, values) in HOT_QUERIES[schema].items():
+            plan = connection.execute(text(f"EXPLAIN QUERY PLAN {query}"), values).fetchall()
+            scans = [
+                row[-1] for row in plan if row[-1].startswith("SCAN") and not VIRTUAL_TABLE_INDEX.fullmatch(row[-1])
+            ]
+            if scans:
+                raise QueryPlanError(f"{name!r} scans instead of using an index: {', '.join(scans)}")
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        for schema in MIGRATIONS:
+            scratch = create_engine("sqlite://")
+            migrate(scratch, schema)
+            check_query_plans(scratch, schema)
+        print(f"{sum(map(len, HOT_QUERIES.values()))} hot queries use indexes")
@@ -1,4 +1,6 @@
-from sqlalchemy import Boolean, Column, Float, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean, Column, Float, ForeignKey, Integer, String, UniqueConstraint
+)
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -19,7 +21,7 @@ class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
-    token = Column(String)
+    token = Column(String, index=True)
     username = Column(String, index=True, unique=True)
     password = Column(String, nullable=False)
     is_active = Column(Boolean(), default=True)
@@ -48,7 +50,22 @@ class Code(Base):
     tests = Column(String)
 
 
-class Solution(Base):  # noqa: D101
+class Solution(Base):
+    """Table representing a solution submitted by a user.
+
+    Attributes
+    ----------
+    id: The solution id.
+    solution: The code of the solution.
+    documentation: The documentation of the solution.
+    tests: The unittest for the solution.
+    time: The median CPU time of a run in seconds, set once benchmarked.
+    memory: The median peak of Python allocations in bytes, set once benchmarked.
+    similarity: The estimated similarity to the most similar solution of another user.
+    duplicate_of: The id of that solution if the similarity flags this one as a near-duplicate.
+    user_id: The id of the user who submitted the solution.
+    """
+
     __tablename__ = "solutions"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -57,5 +74,52 @@ class Solution(Base):  # noqa: D101
     tests = Column(String)
     time = Column(Float, nullable=True)
     memory = Column(Float, nullable=True)
+    similarity = Column(Float, nullable=True)
+    duplicate_of = Column(Integer, nullable=True)
+
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+
+
+class Progress(Base):
+    """Table representing the progress of a user on a level.
+
+    Attributes
+    ----------
+    user_id: The id of the user.
+    level: The level.
+    completed_at: When the level was first completed, as a unix timestamp.
+    best_time: The duration of the fastest successful run in seconds.
+    """
+
+    __tablename__ = "progress"
+    __table_args__ = (UniqueConstraint("user_id", "level"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    level = Column(Integer, nullable=False)
+    completed_at = Column(Float, nullable=True)
+    best_time = Column(Float, nullable=True)
+
+
+class Message(Base):
+    """Table representing a chat message.
+
+    Messages are indexed for full text search by the
+    `messages_fts` table, see `app.search`.
+
+    Attributes
+    ----------
+    id: The message id.
+    author: The username of the author.
+    level: The level the author was on.
+    content: The message.
+    created_at: When the message was sent, as a unix timestamp.
+    """
+
+    __tablename__ = "messages"
 
-    user_id = Column(Integer, ForeignKey("users.id"))
+    id = Column(Integer, primary_key=True)
+    author = Column(String, nullable=False)
+    level = Column(Integer, nullable=True)
+    content = Column(String, nullable=False)
+    created_at = Column(Float, nullable=False)
@@ -0,0 +1,165 @@
+"""Creates many user accounts at once.
+
+Usage: python -m app.provisioning USERS_CSV [--report REPORT_CSV] [--chunk-size N]
+
+The CSV file has a `username` and a `password` column. The report
+lists the result and the issued token of every row.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import logging
+import sys
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.engine import Engine
+
+from . import models
+
+# fmt: off
+__all__ = (
+    'CREATED',
+    'DUPLICATE',
+    'EXISTS',
+    'INVALID',
+    'ProvisionResult',
+    'provision_users',
+)
+# fmt: on
+
+log = logging.getLogger(__name__)
+
+CREATED = "created"
+DUPLICATE = "duplicate"
+EXISTS = "exists"
+INVALID = "invalid"
+
+# SQLite allows 999 bound parameters per statement in older versions.
+MAX_CHUNK_SIZE = 900
+
+
+class ProvisionResult:
+    """The result of provisioning one row.
+
+    :param row: The index of the row in the input.
+    :param username: The username of the row.
+    :param status: `created`, `exists` if the username was already taken,
+                   `duplicate` if an earlier row has the same username
+                   or `invalid` if the username or password is empty.
+    :param token: The token issued to the user, only set if created.
+    """
+
+    def __init__(self, row: int, username: str, status: str, token: Optional[str] = None):
+        self.row = row
+        self.username = username
+        self.status = status
+        self.token = token
+
+    def dict(self) -> Dict[str, object]:
+        """The result as a report entry."""
+        return {"row": self.row, "username": self.username, "status": self.status, "token": self.token}
+
+
+def provision_users(
+    engine: Engine, users: Iterable[tuple[str, str]], *, chunk_size: int = 500
+) -> List[ProvisionResult]:
+    """Creates user accounts, skipping taken usernames.
+
+    Every chunk of rows is checked against the existing users with
+    one query and inserted with one statement in its own transaction,
+    so a failure only loses the current chunk. This blocks, run it in
+    a thread from async code.
+
+    :param engine: The engine of the database.
+    :param users: The username and password of every user.
+    :param chunk_size: The amount of rows per transaction.
+    :return: The result of every row, in input order.
+    """
+    chunk_size = min(max(chunk_size, 1), MAX_CHUNK_SIZE)
+    results: List[ProvisionResult] = []
+    pending: List[ProvisionResult] = []
+    passwords: Dict[str, str] = {}
+
+    for row, (username, password) in enumerate(users):
+        username = (username or "").strip()
+        if not username or not password:
+            results.append(ProvisionResult(row, username, INVALID))
+        elif username in passwords:
+            results.append(ProvisionResult(row, username, DUPLICATE))
+        else:
+            passwords[username] = password
+            result = ProvisionResult(row, username, CREATED, str(uuid.uuid4()))
+            results.append(result)
+            pending.append(result)
+
+    table = models.User.__table__
+    insert = table.insert().prefix_with("OR IGNORE")
+    issued = select(table.c.username, table.c.token).where(
+        table.c.username.in_(bindparam("usernames", expanding=True))
+    )
+
+    for start in range(0, len(pending), chunk_size):
+        chunk = {result.username: result for result in pending[start:start + chunk_size]}
+        with engine.begin() as connection:
+            existing = connection.execute(issued, {"usernames": list(chunk)}).fetchall()
+            for username, _ in existing:
+                chunk.pop(username).status = EXISTS
+            if not chunk:
+                continue
+
+            connection.execute(
+                insert,
+                [
+                    {"username": username, "password": passwords[username], "token": result.token}
+                    for username, result in chunk.items()
+                ],
+            )
+            # A user registered between the check and the insert was ignored,
+            # its token then differs from the issued one.
+            for username, token in connection.execute(issued, {"usernames": list(chunk)}):
+                if token != chunk[username].token:
+                    chunk[username].status = EXISTS
+
+    for result in results:
+        if result.status != CREATED:
+            result.token = None
+    return results
+
+
+def main():
+    """Provisions the users of a CSV file and writes the report."""
+    from .database import engine
+    from .migrations import migrate
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Creates the user accounts of a CSV file.")
+    parser.add_argument("users", help="CSV file with a username and a password column.")
+    parser.add_argument("--report", help="Where to write the report, stdout if omitted.")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Rows inserted per transaction.")
+    arguments = parser.parse_args()
+
+    with open(arguments.users, newline="", encoding="utf-8") as file:
+        rows = [(row.get("username"), row.get("password")) for row in csv.DictReader(file)]
+
+    migrate(engine)
+    results = provision_users(engine, rows, chunk_size=arguments.chunk_size)
+
+    report = open(arguments.report, "w", newline="", encoding="utf-8") if arguments.report else sys.stdout
+    try:
+        writer = csv.DictWriter(report, fieldnames=["row", "username", "status", "token"])
+        writer.writeheader()
+        writer.writerows(result.dict() for result in results)
+    finally:
+        if report is not sys.stdout:
+            report.close()
+
+    created = sum(result.status == CREATED for result in results)
+    log.info("%d of %d users created", created, len(results))
+
+
+if __name__ == "__main__":
+    main()
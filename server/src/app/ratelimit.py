@@ -0,0 +1,41 @@
+import time
+
+# fmt: off
+__all__ = (
+    'TokenBucket',
+)
+# fmt: on
+
+
+class TokenBucket:
+    """Token bucket limiting how often an action can happen.
+
+    The bucket holds at most `capacity` tokens and is refilled with
+    `rate` tokens per second. Every action consumes one token.
+
+    :param rate: The amount of tokens added per second.
+    :param capacity: The maximum amount of tokens, i.e. the burst size.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self, tokens: float = 1) -> bool:
+        """Consumes tokens from the bucket.
+
+        :param tokens: The amount of tokens to consume.
+        :return: Whether there were enough tokens.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
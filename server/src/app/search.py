@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from .tracing import Tracer
+
+if TYPE_CHECKING:
+    from .database import ShardRouter
+
+# fmt: off
+__all__ = (
+    'MessageIndex',
+    'SearchTimeout',
+)
+# fmt: on
+
+log = logging.getLogger(__name__)
+
+# bm25 is only computed for the newest `:candidates` matches, FTS5 reads
+# those from the end of the index without scoring every match of a common word.
+SEARCH_QUERY = """
+SELECT messages.id, messages.author, messages.level, messages.content, messages.created_at,
+       snippet(messages_fts, 0, '[', ']', '...', 16) AS snippet,
+       bm25(messages_fts) AS score
+FROM messages_fts
+JOIN messages ON messages.id = messages_fts.rowid
+WHERE messages_fts MATCH :query {filters}
+AND messages_fts.rowid >= (
+    SELECT min(rowid) FROM (
+        SELECT messages_fts.rowid FROM messages_fts
+        JOIN messages ON messages.id = messages_fts.rowid
+        WHERE messages_fts MATCH :query {filters}
+        ORDER BY messages_fts.rowid DESC
+        LIMIT :candidates
+    )
+)
+ORDER BY score
+LIMIT :limit
+"""
+
+
+class SearchTimeout(Exception):
+    """Raised when a search takes longer than its deadline."""
+
+
+def to_match_query(text: str) -> Optional[str]:
+    """Turns user input into an FTS5 query matching every word.
+
+    Words are quoted so FTS5 operators in the input are searched
+    for literally instead of being interpreted.
+
+    :param text: The search input.
+    :return: The FTS5 query or None if there is nothing to search.
+    """
+    words = text.split()
+    if not words:
+        return None
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+class MessageIndex:
+    """Persists chat messages and searches them with SQLite FTS5.
+
+    Messages are stored in the chat shard of their level. Every shard
+    has a queue filled by the event loop and a background thread
+    writing it in batched transactions, so persisting a message never
+    blocks the broadcast path and shards do not wait for each other's
+    write lock. A batch that cannot be written is logged and dropped,
+    and the writer reconnects and keeps going.
+
+    :param router: Picks the shard of a level.
+    :param batch_size: The maximum amount of messages per transaction.
+    :param flush_interval: Seconds to wait for a batch to fill up.
+    :param tracer: Records the transactions writing traced messages.
+    :param timeout: Seconds a search may read the shards for.
+    :attr MAX_RESULTS: The deepest result a search reaches, every shard
+                       sorts up to this many matches per search.
+    :attr MAX_CANDIDATES: The amount of newest matches every shard ranks.
+    """
+
+    MAX_RESULTS = 1000
+    MAX_CANDIDATES = 10_000
+
+    def __init__(
+        self,
+        router: ShardRouter,
+        *,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        tracer: Optional[Tracer] = None,
+        timeout: float = 1.0,
+    ):
+        self.router = router
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.tracer = tracer or Tracer(None, service="search")
+        self.timeout = timeout
+
+        self.queues: List[queue.Queue] = [queue.Queue() for _ in router.chat_paths]
+        self._threads: List[threading.Thread] = []
+        self._readers = threading.local()
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def start(self):
+        """Starts a writer thread per shard."""
+        for shard, path in enumerate(self.router.chat_paths):
+            thread = threading.Thread(
+                target=self._write, args=(path, self.queues[shard]), name=f"message-index-{shard}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Writes the queued messages and stops the writer threads."""
+        for messages in self.queues:
+            messages.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def add(self, author: str, level: Optional[int], content: str):
+        """Queues a message to be persisted and indexed.
+
+        The current span, if any, gets a child timing the transaction
+        writing the message.
+
+        :param author: The username of the author.
+        :param level: The level the author was on.
+        :param content: The message.
+        """
+        row = (author, level, content, time.time())
+        self.queues[self.router.chat_shard(level)].put_nowait((row, self.tracer.current.get()))
+
+    def _write(self, path: str, messages: queue.Queue):
+        """Writes queued messages of a shard in batches until stopped."""
+        connection: Optional[sqlite3.Connection] = None
+        running = True
+        while running:
+            batch = [messages.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(messages.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                running = False
+                batch = [item for item in batch if item is not None]
+            if batch:
+                started = time.time()
+                try:
+                    if connection is None:
+                        connection = self._connect(path)
+                    with connection:
+                        connection.executemany(
+                            "INSERT INTO messages (author, level, content, created_at) VALUES (?, ?, ?, ?)",
+                            [row for row, _ in batch],
+                        )
+                except sqlite3.Error:
+                    log.exception("Could not write %d messages to %s, reconnecting", len(batch), path)
+                    if connection is not None:
+                        connection.close()
+                    connection = None
+                    continue
+                for _, span in batch:
+                    self.tracer.record(span, "db.messages.insert", started, batch=len(batch))
+        if connection is not None:
+            connection.close()
+
+    def _reader(self, path: str) -> sqlite3.Connection:
+        connections = self._readers.__dict__.setdefault("connections", {})
+        if path not in connections:
+            connections[path] = self._connect(path)
+            connections[path].row_factory = sqlite3.Row
+        return connections[path]
+
+    def search(
+        self,
+        text: str,
+        *,
+        author: Optional[str] = None,
+        level: Optional[int] = None,
+        page: int = 1,
+        per_page: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """Searches the messages, best matches first.
+
+        Only the `MAX_CANDIDATES` newest matches of every shard are
+        ranked, so a common word costs the same as a rare one.
+        A search of a level only reads the level's shard, other
+        searches read every shard and merge the results by score.
+        Every shard computes bm25 from its own word and message
+        counts, so a merged order is only approximate: scores are
+        close to comparable when shards are about the same size and
+        have the same kind of messages, which spreading the levels
+        over the shards keeps true. Ties keep the newest message first.
+        Blocks on the database, so it should be run in a thread pool.
+
+        :param text: The words to search for.
+        :param author: Only search messages of this author.
+        :param level: Only search messages sent on this level.
+        :param page: The page of results, starting at 1.
+        :param per_page: The amount of results per page.
+        :return: The results, none for pages past `MAX_RESULTS`.
+        :raises SearchTimeout: The search took longer than `timeout`.
+        """
+        match = to_match_query(text)
+        if match is None or page * per_page > self.MAX_RESULTS:
+            return []
+
+        filters = ""
+        values: Dict[str, Any] = {"query": match, "limit": page * per_page, "candidates": self.MAX_CANDIDATES}
+        if author is not None:
+            filters += "AND messages.author = :author "
+            values["author"] = author
+        if level is not None:
+            filters += "AND messages.level = :level "
+            values["level"] = level
+
+        paths = self.router.chat_paths if level is None else [self.router.chat_path(level)]
+        deadline = time.monotonic() + self.timeout
+        results = []
+        for path in paths:
+            reader = self._reader(path)
+            # Called every 10000 virtual machine instructions, a non-zero result interrupts the query.
+            reader.set_progress_handler(lambda: time.monotonic() > deadline, 10_000)
+            try:
+                rows = reader.execute(SEARCH_QUERY.format(filters=filters), values).fetchall()
+            except sqlite3.OperationalError as error:
+                if time.monotonic() > deadline:
+                    raise SearchTimeout(f"{text!r} took longer than {self.timeout}s") from error
+                raise
+            finally:
+                reader.set_progress_handler(None, 0)
+            results.extend(dict(row) for row in rows)
+        results.sort(key=lambda row: (row["score"], -row["created_at"]))
+        return results[(page - 1) * per_page:page * per_page]
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import builtins
+import io
+import keyword
+import random
+import sqlite3
+import threading
+import tokenize
+import zlib
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+# fmt: off
+__all__ = (
+    'SCHEMA',
+    'SimilarityIndex',
+    'normalize',
+)
+# fmt: on
+
+# Created by the `solution_similarity` migration.
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS solution_signatures ("
+    "solution_id INTEGER PRIMARY KEY, user_id INTEGER, signature BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS solution_bands ("
+    "band INTEGER NOT NULL, key INTEGER NOT NULL, solution_id INTEGER NOT NULL, "
+    "PRIMARY KEY (band, key, solution_id)) WITHOUT ROWID",
+)
+
+BUILTINS = frozenset(dir(builtins))
+MERSENNE_PRIME = (1 << 61) - 1
+# The permutations must not change, or stored signatures stop matching.
+SEED = 9
+
+
+def normalize(code: str) -> List[str]:
+    """Turns code into tokens that survive renaming and reformatting.
+
+    Identifiers become `$`, strings `"` and numbers `0`, while keywords,
+    builtins, operators and the block structure are kept. Comments and
+    whitespace are dropped. Code that does not tokenize is cut off at
+    the error.
+
+    :param code: The code to normalize.
+    """
+    tokens = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.NAME:
+                tokens.append(
+                    token.string if keyword.iskeyword(token.string) or token.string in BUILTINS else "$"
+                )
+            elif token.type == tokenize.STRING:
+                tokens.append('"')
+            elif token.type == tokenize.NUMBER:
+                tokens.append("0")
+            elif token.type == tokenize.OP:
+                tokens.append(token.string)
+            elif token.type == tokenize.INDENT:
+                tokens.append("{")
+            elif token.type == tokenize.DEDENT:
+                tokens.append("}")
+            elif token.type == tokenize.NEWLINE:
+                tokens.append(";")
+    except (tokenize.TokenError, SyntaxError):
+        pass
+    return tokens
+
+
+class SimilarityIndex:
+    """Finds near-duplicate solutions with MinHash and locality-sensitive hashing.
+
+    A signature keeps the lowest 16 bits of every MinHash value of the
+    solution's token shingles, so two signatures agree in about the
+    Jaccard similarity of the shingle sets. Every band of signature
+    values is stored as one integer key; solutions sharing a band key
+    are the only candidates compared, so a lookup does not depend on
+    the amount of stored solutions.
+
+    :param path: The path of the SQLite database.
+    :param permutations: The amount of MinHash values per signature.
+    :param bands: The amount of bands, must divide `permutations` into
+                  bands of at most four values.
+    :param shingle_size: The amount of tokens per shingle.
+    :param threshold: The similarity from which a solution is a near-duplicate.
+    :param max_candidates: The maximum amount of candidates compared per lookup.
+    :param max_band_matches: The maximum amount of solutions read per band key,
+                             the newest ones, so a band key shared by many
+                             solutions does not make lookups slow.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        permutations: int = 64,
+        bands: int = 16,
+        shingle_size: int = 5,
+        threshold: float = 0.8,
+        max_candidates: int = 100,
+        max_band_matches: int = 1000,
+    ):
+        if permutations % bands or permutations // bands > 4:
+            raise ValueError("bands must split the permutations into bands of at most 4 values")
+        self.path = path
+        self.permutations = permutations
+        self.bands = bands
+        self.rows = permutations // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.max_band_matches = max_band_matches
+
+        generator = random.Random(SEED)
+        self.coefficients = [
+            (generator.randrange(1, MERSENNE_PRIME), generator.randrange(MERSENNE_PRIME))
+            for _ in range(permutations)
+        ]
+        self._connections = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._connections, "connection", None)
+        if connection is None:
+            connection = self._connections.connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def signature(self, code: str) -> Optional[array]:
+        """Computes the signature of a solution.
+
+        :param code: The solution.
+        :return: The signature, or None if the code has no tokens.
+        """
+        tokens = normalize(code)
+        if not tokens:
+            return None
+
+        size = min(self.shingle_size, len(tokens))
+        shingles = {
+            zlib.crc32("\0".join(tokens[start:start + size]).encode())
+            for start in range(len(tokens) - size + 1)
+        }
+        return array(
+            "H",
+            (
+                min((a * shingle + b) % MERSENNE_PRIME for shingle in shingles) & 0xFFFF
+                for a, b in self.coefficients
+            ),
+        )
+
+    def band_keys(self, signature: array) -> List[Tuple[int, int]]:
+        """Packs every band of a signature into one integer."""
+        keys = []
+        for band in range(self.bands):
+            values = signature[band * self.rows:(band + 1) * self.rows]
+            keys.append((band, int.from_bytes(values.tobytes(), "little", signed=True)))
+        return keys
+
+    def query(self, signature: array, *, exclude_user: Optional[int] = None) -> Tuple[Optional[int], float]:
+        """Finds the stored solution most similar to a signature.
+
+        Blocks on the database, so it should be run in a thread pool.
+
+        :param signature: The signature to look up.
+        :param exclude_user: Ignore the solutions of this user.
+        :return: The id of the most similar solution and the estimated
+                 similarity, or None and 0 if no solution shares a band.
+        """
+        # The user's own solutions are left out before the limits, so they cannot take up every candidate.
+        owner = ""
+        if exclude_user is not None:
+            owner = "AND owners.user_id IS NOT ? "
+        values: List[object] = []
+        for band, key in self.band_keys(signature):
+            values += [band, key]
+            if exclude_user is not None:
+                values.append(exclude_user)
+            values.append(self.max_band_matches)
+        values.append(self.max_candidates)
+        # Compound selects cannot be limited themselves, so every band is wrapped in a subquery.
+        bands = " UNION ALL ".join(
+            [
+                "SELECT * FROM (SELECT solution_bands.solution_id FROM solution_bands "
+                "JOIN solution_signatures AS owners ON owners.solution_id = solution_bands.solution_id "
+                f"WHERE band = ? AND key = ? {owner}ORDER BY solution_bands.solution_id DESC LIMIT ?)"
+            ]
+            * self.bands
+        )
+        query = (
+            "SELECT solution_signatures.solution_id, solution_signatures.signature "
+            f"FROM (SELECT solution_id, COUNT(*) AS hits FROM ({bands}) "
+            "GROUP BY solution_id ORDER BY hits DESC LIMIT ?) AS matches "
+            "JOIN solution_signatures ON solution_signatures.solution_id = matches.solution_id"
+        )
+        candidates = self._connection().execute(query, values)
+
+        best_id, best_score = None, 0.0
+        for solution_id, blob in candidates:
+            other = array("H")
+            other.frombytes(blob)
+            score = sum(a == b for a, b in zip(signature, other)) / self.permutations
+            if score > best_score:
+                best_id, best_score = solution_id, score
+        return best_id, best_score
+
+    def add_many(self, entries: Iterable[Tuple[int, Optional[int], array]]):
+        """Stores the signatures of solutions in one transaction.
+
+        :param entries: The solution id, user id and signature of every solution.
+        """
+        connection = self._connection()
+        with connection:
+            for solution_id, user_id, signature in entries:
+                connection.execute(
+                    "INSERT OR REPLACE INTO solution_signatures (solution_id, user_id, signature) "
+                    "VALUES (?, ?, ?)",
+                    (solution_id, user_id, signature.tobytes()),
+                )
+                connection.executemany(
+                    "INSERT OR IGNORE INTO solution_bands (band, key, solution_id) VALUES (?, ?, ?)",
+                    [(band, key, solution_id) for band, key in self.band_keys(signature)],
+                )
+
+    def check(self, solution_id: int, user_id: Optional[int], code: str) -> Tuple[Optional[int], float]:
+        """Looks up the near-duplicates of a new solution and stores it.
+
+        Solutions of the same user are not considered duplicates.
+        Blocks on the database, so it should be run in a thread pool.
+
+        :param solution_id: The id of the new solution.
+        :param user_id: The id of the user who submitted it.
+        :param code: The solution.
+        :return: The id of the solution it duplicates, None if it is not
+                 a near-duplicate, and the highest estimated similarity.
+        """
+        signature = self.signature(code)
+        if signature is None:
+            return None, 0.0
+
+        match, score = self.query(signature, exclude_user=user_id)
+        self.add_many([(solution_id, user_id, signature)])
+        return (match if score >= self.threshold else None), score
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import time
+from typing import Callable, Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, responses are then only gzipped
+    brotli = None
+
+# fmt: off
+__all__ = (
+    'Asset',
+    'StaticAssets',
+)
+# fmt: on
+
+REVALIDATE = "no-cache"
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Replaced by the fingerprinted URL of the named file in HTML files, e.g. `{{ url register.js }}`.
+LINK = re.compile(r"{{\s*url\s+([\w.-]+)\s*}}")
+
+
+class Asset:
+    """Represents a file loaded into memory with its encoded variants.
+
+    :param path: The path of the file.
+    :param resolve: Gets the files linked to with `{{ url <name> }}`,
+                    None to serve the file as it is.
+    :attr fingerprint: A short content hash used in fingerprinted names.
+    :attr variants: The body and strong ETag of every content encoding.
+    :attr links: The fingerprint of every linked file when it was linked.
+    """
+
+    def __init__(self, path: str, *, resolve: Optional[Callable[[str], Asset]] = None):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        self.checked = time.monotonic()
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+        with open(path, "rb") as file:
+            body = file.read()
+
+        self.links: Dict[str, str] = {}
+        if resolve is not None:
+            body = LINK.sub(lambda match: self._link(match.group(1), resolve), body.decode()).encode()
+
+        digest = hashlib.sha256(body).hexdigest()
+        self.fingerprint = digest[:12]
+
+        self.variants: Dict[str, tuple[bytes, str]] = {"identity": (body, f'"{digest}"')}
+        self.variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gz"')
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(body), f'"{digest}-br"')
+
+    def _link(self, name: str, resolve: Callable[[str], Asset]) -> str:
+        """Gets the fingerprinted URL of a linked file and remembers its fingerprint."""
+        asset = resolve(name)
+        self.links[name] = asset.fingerprint
+        return f"/static/{asset.fingerprinted_name}"
+
+    @property
+    def fingerprinted_name(self) -> str:
+        """The file name with the fingerprint before the extension."""
+        stem, extension = os.path.splitext(os.path.basename(self.path))
+        return f"{stem}.{self.fingerprint}{extension}"
+
+
+class StaticAssets:
+    """Serves the files of a directory from memory.
+
+    Files are loaded once and reloaded when their modification time
+    changes, which is checked at most every `check_interval` seconds.
+    HTML files link to other files by their fingerprinted URL and are
+    reloaded when a linked file changes, so browsers may cache linked
+    files forever.
+
+    :param directory: The directory containing the files.
+    :param check_interval: Seconds between two checks for changes of a file.
+    """
+
+    def __init__(self, directory: str, *, check_interval: float = 1.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self.assets: Dict[str, Asset] = {}
+
+    def load_all(self):
+        """Loads every file of the directory."""
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(path):
+                self.assets[name] = self._load(path)
+
+    def _load(self, path: str) -> Asset:
+        """Loads a file, linking HTML files to the files they reference."""
+        if path.endswith(".html"):
+            return Asset(path, resolve=self._resolve)
+        return Asset(path)
+
+    def _resolve(self, name: str) -> Asset:
+        """Gets a file linked to by an HTML file."""
+        asset = None if name.endswith(".html") else self.get(name)
+        if asset is None:
+            raise ValueError(f"{name} cannot be linked to, it is not a file of {self.directory} or an HTML file")
+        return asset
+
+    def get(self, name: str) -> Optional[Asset]:
+        """Gets a file, reloading it if it changed on disk.
+
+        :param name: The name of the file.
+        :return: The asset or None if the file does not exist.
+        """
+        asset = self.assets.get(name)
+        if asset is None:
+            path = os.path.join(self.directory, name)
+            if os.path.dirname(os.path.normpath(name)) or not os.path.isfile(path):
+                return None
+            asset = self.assets[name] = self._load(path)
+        elif time.monotonic() - asset.checked >= self.check_interval:
+            asset.checked = time.monotonic()
+            try:
+                if os.stat(asset.path).st_mtime_ns != asset.mtime or self._links_changed(asset):
+                    asset = self.assets[name] = self._load(asset.path)
+            except FileNotFoundError:
+                del self.assets[name]
+                return None
+        return asset
+
+    def _links_changed(self, asset: Asset) -> bool:
+        """Whether a file linked to by the asset changed since it was linked."""
+        for name, fingerprint in asset.links.items():
+            linked = self.get(name)
+            if linked is None or linked.fingerprint != fingerprint:
+                return True
+        return False
+
+    def response(self, name: str, request: Request) -> Response:
+        """Creates the response serving a file.
+
+        Fingerprinted names are cached forever, other names
+        have to be revalidated with their ETag on every use.
+
+        :param name: The plain or fingerprinted name of the file.
+        :param request: The request to answer.
+        """
+        cache_control = REVALIDATE
+        asset = self.get(name)
+        if asset is None:
+            stem, fingerprint, extension = _split_fingerprint(name)
+            asset = self.get(stem + extension)
+            if asset is None or asset.fingerprint != fingerprint:
+                return Response(status_code=404)
+            cache_control = IMMUTABLE
+
+        encoding = _negotiate(request.headers.get("accept-encoding", ""), asset)
+        body, etag = asset.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+        if _matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=asset.media_type, headers=headers)
+
+
+def _split_fingerprint(name: str) -> tuple[str, str, str]:
+    """Splits `home.<fingerprint>.html` into its stem, fingerprint and extension."""
+    rest, extension = os.path.splitext(name)
+    stem, _, fingerprint = rest.rpartition(".")
+    return stem, fingerprint, extension
+
+
+def _negotiate(accept_encoding: str, asset: Asset) -> str:
+    """Picks the smallest encoding accepted by the client."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, parameters = part.strip().partition(";")
+        if parameters.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip())
+
+    for encoding in ("br", "gzip"):
+        if encoding in asset.variants and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an `If-None-Match` header matches the ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
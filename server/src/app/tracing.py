@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from .ratelimit import TokenBucket
+
+# fmt: off
+__all__ = (
+    'Span',
+    'Tracer',
+)
+# fmt: on
+
+# Ids are 8 random bytes in hex, received ids may be up to 16 bytes long.
+SPAN_ID = re.compile(r"[0-9a-f]{1,32}")
+
+
+def valid_context(context: Any) -> bool:
+    """Whether a trace context received from another process has a valid id and parent."""
+    if not isinstance(context, dict) or not isinstance(context.get("id"), str):
+        return False
+    parent = context.get("parent")
+    if parent is not None and not isinstance(parent, str):
+        return False
+    return all(value is None or SPAN_ID.fullmatch(value) for value in (context["id"], parent))
+
+
+class Span:
+    """A timed operation belonging to a trace.
+
+    :param trace_id: The id of the trace.
+    :param parent_id: The id of the parent span, None for a root span.
+    :param name: What the span measures.
+    :param attributes: Extra information about the operation.
+    """
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: Optional[float] = None
+
+    @property
+    def context(self) -> Dict[str, str]:
+        """The trace context passed in message envelopes."""
+        return {"id": self.trace_id, "parent": self.span_id}
+
+
+class Tracer:
+    """Records spans to a local file.
+
+    Traces are started by the client, which makes the sampling
+    decision; the server only adds spans to traces it receives
+    a context for, as long as the sender's budget of traces lasts,
+    so a client sending a context with every message cannot fill
+    the span file. Spans are written as JSON lines when they end,
+    from any thread.
+
+    :param path: The path of the span file, None to disable tracing.
+    :param service: The name of the process recording the spans.
+    """
+
+    def __init__(self, path: Optional[str], *, service: str):
+        self.service = service
+        self.file = open(path, "a", encoding="utf-8") if path else None
+        self._lock = threading.Lock()
+        self.current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+            f"{service}_span", default=None
+        )
+
+    def finish(self, span: Span):
+        """Ends a span and exports it."""
+        span.end = time.time()
+        record = {
+            "trace": span.trace_id,
+            "span": span.span_id,
+            "parent": span.parent_id,
+            "name": span.name,
+            "service": self.service,
+            "start": span.start,
+            "end": span.end,
+            "attributes": span.attributes,
+        }
+        with self._lock:
+            self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.file.flush()
+
+    def record(self, parent: Optional[Span], name: str, start: float, **attributes: Any):
+        """Records a child of a span that ended just now, e.g. from another thread.
+
+        :param parent: The span, None to not record anything.
+        :param name: What the span measures.
+        :param start: When the operation started, from `time.time()`.
+        :param attributes: Extra information about the operation.
+        """
+        if parent is None or self.file is None:
+            return
+        span = Span(parent.trace_id, parent.span_id, name, attributes)
+        span.start = start
+        self.finish(span)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Records a child of the current span, if there is one.
+
+        :param name: What the span measures.
+        :param attributes: Extra information about the operation.
+        """
+        parent = self.current.get()
+        if parent is None or self.file is None:
+            yield None
+            return
+
+        span = Span(parent.trace_id, parent.span_id, name, attributes)
+        token = self.current.set(span)
+        try:
+            yield span
+        finally:
+            self.current.reset(token)
+            self.finish(span)
+
+    @contextlib.contextmanager
+    def continue_trace(
+        self, context: Any, name: str, *, bucket: Optional[TokenBucket] = None, **attributes: Any
+    ) -> Iterator[Optional[Span]]:
+        """Records a span under a trace context received from another process.
+
+        :param context: The `{"id", "parent"}` context from the envelope, if any.
+        :param name: What the span measures.
+        :param bucket: The sender's budget of traces, a token is only consumed
+                       for a valid context. Traces past it are not recorded.
+        :param attributes: Extra information about the operation.
+        """
+        if self.file is None or not valid_context(context) or (bucket is not None and not bucket.consume()):
+            yield None
+            return
+
+        span = Span(context["id"], context.get("parent"), name, attributes)
+        token = self.current.set(span)
+        try:
+            yield span
+        finally:
+            self.current.reset(token)
+            self.finish(span)
+
+    def close(self):
+        """Flushes and closes the span file."""
+        if self.file is not None:
+            self.file.close()
@@ -0,0 +1,71 @@
+"""Benchmarks the chat filter with large word lists.
+
+Usage: python benchmark_chatfilter.py [--terms N] [--messages N] [--regex]
+
+Builds word lists of growing size up to `--terms` random terms and
+times checking the same chat messages against each, showing the
+cost per message does not grow with the list. `--regex` also times
+one regex alternation of the largest list for comparison.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import string
+import time
+from typing import List
+
+from app.chatfilter import ACTIONS, Automaton, ChatFilter
+
+
+def random_word(generator: random.Random) -> str:
+    """A random lowercase word."""
+    return "".join(generator.choice(string.ascii_lowercase) for _ in range(generator.randint(3, 10)))
+
+
+def messages(generator: random.Random, amount: int) -> List[str]:
+    """Chat messages of random words, about 80 characters long."""
+    return [" ".join(random_word(generator) for _ in range(12)) for _ in range(amount)]
+
+
+def main():
+    """Times building the automaton and checking messages for every list size."""
+    parser = argparse.ArgumentParser(description="Benchmarks the chat filter.")
+    parser.add_argument("--terms", type=int, default=50_000, help="Terms in the largest word list.")
+    parser.add_argument("--messages", type=int, default=20_000, help="Messages checked per list.")
+    parser.add_argument("--regex", action="store_true", help="Also time a regex alternation.")
+    arguments = parser.parse_args()
+
+    generator = random.Random(42)
+    terms = [(random_word(generator), generator.choice(ACTIONS)) for _ in range(arguments.terms)]
+    chat = messages(generator, arguments.messages)
+
+    for size in (arguments.terms // 100, arguments.terms // 10, arguments.terms):
+        started = time.perf_counter()
+        automaton = Automaton(terms[:size])
+        built = time.perf_counter() - started
+
+        chat_filter = ChatFilter(None)
+        chat_filter.automaton = automaton
+        started = time.perf_counter()
+        flagged = sum(chat_filter.check(message).flagged for message in chat)
+        checked = time.perf_counter() - started
+        print(
+            f"{size:>7} terms: built in {built:.2f}s, "
+            f"{checked / len(chat) * 1e6:.1f}us per message, {flagged} of {len(chat)} flagged"
+        )
+
+    if arguments.regex:
+        pattern = re.compile(r"\b(?:" + "|".join(re.escape(term) for term, _ in terms) + r")\b", re.IGNORECASE)
+        sample = chat[:200]
+        started = time.perf_counter()
+        for message in sample:
+            pattern.search(message)
+        elapsed = time.perf_counter() - started
+        print(f"{len(terms):>7} terms as regex: {elapsed / len(sample) * 1e6:.1f}us per message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Checks the websocket limits keep a flood from slowing down other users.
+
+Usage: python benchmark_flood.py [--url URL] [--clients N] [--duration S] [--max-slowdown X]
+
+Connects a few normal clients that chat at a human pace, and times how
+long their messages take to reach the other clients. The run is done
+twice: first alone, then while one user sends as fast as possible and
+keeps opening more connections than allowed. Exits with an error if
+the flood slowed the normal clients' p99 down by more than
+`--max-slowdown` or if the server did not rate limit or reject the flooder.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from typing import Dict, List
+
+import aiohttp
+from replay import describe, percentile
+
+MESSAGE = 0
+POLICY_VIOLATION = 1008
+# Connections the flooder opens on top of its first, stays below aiohttp's connection pool size.
+EXTRA_CONNECTIONS = 20
+
+
+class FloodTest:
+    """Drives normal clients and a flooder against a running server.
+
+    :param url: The base URL of the server.
+    :param clients: The amount of normal clients.
+    :param interval: Seconds between two messages of a normal client.
+    """
+
+    def __init__(self, url: str, clients: int, interval: float):
+        self.url = url.rstrip("/")
+        self.clients = clients
+        self.interval = interval
+        self.run_name = uuid.uuid4().hex[:8]
+
+        self.sent: Dict[str, float] = {}
+        self.latencies: List[float] = []
+        self.flooded = 0
+        self.rejected = 0
+
+    async def login(self, session: aiohttp.ClientSession, name: str) -> str:
+        """Creates a user and gets its token."""
+        credentials = {"username": f"flood-{self.run_name}-{name}", "password": self.run_name}
+        async with session.post(f"{self.url}/register", json=credentials):
+            pass
+        async with session.get(f"{self.url}/login", json=credentials) as request:
+            return (await request.json())["token"]
+
+    async def receive(self, socket: aiohttp.ClientWebSocketResponse):
+        """Times the delivery of the normal clients' messages."""
+        async for message in socket:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            data = json.loads(message.data).get("data") or {}
+            sent_at = self.sent.pop(data.get("flood"), None)
+            if sent_at is not None:
+                self.latencies.append(time.perf_counter() - sent_at)
+
+    async def chat(self, socket: aiohttp.ClientWebSocketResponse, duration: float):
+        """Sends a tagged message every interval."""
+        stop = time.perf_counter() + duration
+        while time.perf_counter() < stop:
+            tag = uuid.uuid4().hex
+            self.sent[tag] = time.perf_counter()
+            await socket.send_json({"op": MESSAGE, "data": {"message": "hello", "author": "", "flood": tag}})
+            await asyncio.sleep(self.interval)
+
+    async def flood(self, session: aiohttp.ClientSession, token: str, duration: float):
+        """Sends messages as fast as possible and opens too many connections."""
+        socket = await session.ws_connect(f"{self.url}/ws/{token}")
+        drain = asyncio.create_task(self.drain(socket))
+        extra = []
+        stop = time.perf_counter() + duration
+        while time.perf_counter() < stop:
+            await socket.send_json({"op": MESSAGE, "data": {"message": "spam", "author": ""}})
+            self.flooded += 1
+            if self.flooded % 1000 == 0 and len(extra) < EXTRA_CONNECTIONS:
+                extra.append(await session.ws_connect(f"{self.url}/ws/{token}"))
+            await asyncio.sleep(0)
+
+        # Rejected connections are accepted, then closed with the policy code.
+        # The connections under the user's cap stay open and receive nothing.
+        closing = [asyncio.create_task(connection.receive()) for connection in extra]
+        if closing:
+            _, pending = await asyncio.wait(closing, timeout=1)
+            for task in pending:
+                task.cancel()
+        self.rejected += sum(connection.close_code == POLICY_VIOLATION for connection in extra)
+        for connection in extra:
+            await connection.close()
+        drain.cancel()
+        await socket.close()
+
+    @staticmethod
+    async def drain(socket: aiohttp.ClientWebSocketResponse):
+        """Reads everything sent to the flooder, so it does not slow down the server."""
+        async for _ in socket:
+            pass
+
+    async def run(self, duration: float, *, flood: bool) -> List[float]:
+        """Runs the normal clients, alone or with the flooder, and returns their latencies."""
+        self.sent.clear()
+        self.latencies = []
+        async with aiohttp.ClientSession() as session:
+            tokens = [await self.login(session, str(number)) for number in range(self.clients)]
+            sockets = [await session.ws_connect(f"{self.url}/ws/{token}") for token in tokens]
+            listeners = [asyncio.create_task(self.receive(socket)) for socket in sockets]
+
+            tasks = [self.chat(socket, duration) for socket in sockets]
+            if flood:
+                tasks.append(self.flood(session, await self.login(session, "flooder"), duration))
+            await asyncio.gather(*tasks)
+
+            await asyncio.sleep(1)
+            for listener in listeners:
+                listener.cancel()
+            for socket in sockets:
+                await socket.close()
+            return self.latencies
+
+    async def stats(self) -> Dict[str, int]:
+        """Gets the server's limiting counters."""
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{self.url}/stats") as request:
+                return await request.json()
+
+
+def main():
+    """Runs the normal clients without and with a flood and compares their latency."""
+    parser = argparse.ArgumentParser(description="Checks a flood does not slow down other users.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="The server to test.")
+    parser.add_argument("--clients", type=int, default=10, help="Normal clients chatting.")
+    parser.add_argument("--interval", type=float, default=0.2, help="Seconds between a normal client's messages.")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per run.")
+    parser.add_argument("--max-slowdown", type=float, default=2, help="Largest accepted p99 slowdown.")
+    arguments = parser.parse_args()
+
+    test = FloodTest(arguments.url, arguments.clients, arguments.interval)
+    before = asyncio.run(test.stats())
+    calm = asyncio.run(test.run(arguments.duration, flood=False))
+    flooded = asyncio.run(test.run(arguments.duration, flood=True))
+    after = asyncio.run(test.stats())
+
+    print(f"   calm: {describe(calm)}")
+    print(f"flooded: {describe(flooded)}")
+    limited = after.get("messages_limited", 0) - before.get("messages_limited", 0)
+    print(f"flooder: {test.flooded} messages sent, {limited} rate limited, {test.rejected} extra connections rejected")
+
+    failures = []
+    if not calm or not flooded:
+        failures.append("normal messages were not delivered")
+    elif percentile(flooded, 0.99) > percentile(calm, 0.99) * arguments.max_slowdown:
+        failures.append(f"the flood slowed down the p99 latency by more than {arguments.max_slowdown}x")
+    if not limited:
+        failures.append("the flooder was not rate limited")
+    if not test.rejected:
+        failures.append("the flooder's extra connections were not rejected")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Benchmarks chat search on a large message history.
+
+Usage: python benchmark_search.py [--messages N] [--shards N] [--directory DIR]
+
+Fills fresh chat shards with `--messages` random messages (10 million
+by default), whose words follow a Zipf distribution like real chat.
+Then it times searches for common, rare and missing words, with and
+without filters, and a `LIKE '%word%'` scan for comparison. Pass
+`--directory` to keep the shards and skip filling them next time.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Callable, List
+
+from app import migrations
+from app.database import ShardRouter
+from app.search import MessageIndex
+
+LEVELS = 16
+AUTHORS = 2000
+VOCABULARY = 20_000
+# Not in the vocabulary, the words only contain letters.
+MISSING = "missing1"
+
+
+def words(generator: random.Random) -> List[str]:
+    """The vocabulary, most common words first."""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = set()
+    while len(vocabulary) < VOCABULARY:
+        vocabulary.add("".join(generator.choice(letters) for _ in range(generator.randint(3, 9))))
+    return sorted(vocabulary)
+
+
+def fill(router: ShardRouter, messages: int, vocabulary: List[str], generator: random.Random):
+    """Writes the messages in large transactions with the writer thread's statement."""
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    connections = [sqlite3.connect(path) for path in router.chat_paths]
+    for connection in connections:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+    started = time.perf_counter()
+    batch_size = 10_000
+    for offset in range(0, messages, batch_size):
+        batches: List[list] = [[] for _ in connections]
+        for number in range(offset, min(offset + batch_size, messages)):
+            level = number % LEVELS
+            content = " ".join(generator.choices(vocabulary, cum_weights=weights, k=generator.randint(3, 15)))
+            batches[router.chat_shard(level)].append((f"user-{number % AUTHORS}", level, content, float(number)))
+        for connection, batch in zip(connections, batches):
+            with connection:
+                connection.executemany(
+                    "INSERT INTO messages (author, level, content, created_at) VALUES (?, ?, ?, ?)", batch
+                )
+        if offset and offset % 1_000_000 == 0:
+            print(f"{offset:>10} messages, {offset / (time.perf_counter() - started):.0f}/s")
+
+    elapsed = time.perf_counter() - started
+    print(f"filled {messages} messages in {elapsed:.0f}s, {messages / elapsed:.0f} messages/s")
+    for connection in connections:
+        connection.close()
+
+
+def timed(search: Callable[[], object], repeat: int) -> str:
+    """Times a search and formats the median and slowest duration."""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        search()
+        durations.append(time.perf_counter() - started)
+    return f"p50={statistics.median(durations) * 1000:9.2f}ms max={max(durations) * 1000:9.2f}ms"
+
+
+def main():
+    """Fills the shards if needed and times the searches."""
+    parser = argparse.ArgumentParser(description="Benchmarks chat search.")
+    parser.add_argument("--messages", type=int, default=10_000_000, help="Messages in the history.")
+    parser.add_argument("--shards", type=int, default=4, help="Chat shards.")
+    parser.add_argument("--directory", help="Keeps the shards in this directory instead of a temporary one.")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per search.")
+    arguments = parser.parse_args()
+
+    generator = random.Random(7)
+    vocabulary = words(generator)
+    with tempfile.TemporaryDirectory() as scratch:
+        directory = arguments.directory or scratch
+        os.makedirs(directory, exist_ok=True)
+        router = ShardRouter(directory, chat_shards=arguments.shards)
+        filled = all(os.path.exists(path) for path in router.chat_paths)
+        for engine in router.chat_engines:
+            migrations.migrate(engine, migrations.CHAT)
+        router.dispose()
+        if not filled:
+            fill(router, arguments.messages, vocabulary, generator)
+
+        # Times the queries themselves instead of stopping them at the deadline.
+        index = MessageIndex(router, timeout=600)
+        common, rare = vocabulary[0], vocabulary[-1]
+        searches = {
+            f"common word {common!r}": lambda: index.search(common),
+            f"rare word {rare!r}": lambda: index.search(rare),
+            "missing word": lambda: index.search(MISSING),
+            "two words": lambda: index.search(f"{common} {vocabulary[10]}"),
+            "common word, page 50": lambda: index.search(common, page=50),
+            "common word, one level": lambda: index.search(common, level=3),
+            "common word, one author": lambda: index.search(common, author="user-42"),
+        }
+        for name, search in searches.items():
+            print(f"{name:>32}: {timed(search, arguments.repeat)}")
+
+        # LIKE cannot use an index, so a word nobody wrote scans the whole shard.
+        connection = sqlite3.connect(router.chat_paths[0])
+        query = "SELECT id FROM messages WHERE content LIKE ? LIMIT 20"
+        scan = timed(lambda: connection.execute(query, (f"%{MISSING}%",)).fetchall(), 3)
+        print(f"{'LIKE, missing word, one shard':>32}: {scan}")
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
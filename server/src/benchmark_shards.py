@@ -0,0 +1,56 @@
+"""Benchmarks sustained chat write throughput for different amounts of shards.
+
+Usage: python benchmark_shards.py [--messages N] [--levels N] [--batch-size N] [--shards 1 2 4 8]
+
+Every run writes the same messages, spread over the levels, into fresh
+shard files in a temporary directory and reports messages per second.
+A batch size of 1 commits every message on its own, like unbatched
+writers contending for the write lock.
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+
+from app import migrations
+from app.database import ShardRouter
+from app.search import MessageIndex
+
+
+def run(shards: int, messages: int, levels: int, batch_size: int) -> float:
+    """Writes the messages into fresh shards and returns the messages per second."""
+    with tempfile.TemporaryDirectory() as directory:
+        router = ShardRouter(directory, chat_shards=shards)
+        for engine in router.chat_engines:
+            migrations.migrate(engine, migrations.CHAT)
+        router.dispose()
+
+        index = MessageIndex(router, batch_size=batch_size, flush_interval=0.01)
+        started = time.perf_counter()
+        index.start()
+        for number in range(messages):
+            index.add(f"user-{number % 50}", number % levels, f"message {number} about level {number % levels}")
+        index.stop()
+        return messages / (time.perf_counter() - started)
+
+
+def main():
+    """Runs the benchmark for every amount of shards."""
+    parser = argparse.ArgumentParser(description="Benchmarks chat write throughput per amount of shards.")
+    parser.add_argument("--messages", type=int, default=20_000, help="Messages written per run.")
+    parser.add_argument("--levels", type=int, default=16, help="Levels the messages are spread over.")
+    parser.add_argument("--batch-size", type=int, default=1, help="Messages per transaction.")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8], help="Amounts of shards.")
+    arguments = parser.parse_args()
+
+    baseline = None
+    for shards in arguments.shards:
+        throughput = run(shards, arguments.messages, arguments.levels, arguments.batch_size)
+        baseline = baseline or throughput
+        print(f"{shards:>3} shards: {throughput:10.0f} messages/s ({throughput / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Benchmarks near-duplicate lookups against a large amount of stored solutions.
+
+Usage: python benchmark_similarity.py [--solutions N] [--queries N] [--database PATH]
+
+Fills a scratch database with the signatures of programs drawn from the
+same statements, like the solutions of one level, plus edited copies of
+a few more of them, then times the lookups of those programs and checks
+their copies are found. Programs sharing statements share band keys, so
+the lookups meet the same crowded bands as on a real server.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from app.similarity import SCHEMA, SimilarityIndex
+
+# Statements of different shapes, so programs drawn from them differ after normalization.
+STATEMENTS = (
+    "values = [int(word) for word in input().split()]",
+    "total = sum(values)",
+    "best = max(values, default=None)",
+    "pairs = list(zip(values, values[1:]))",
+    "seen = set()",
+    "counts = {}",
+    "for value in values:\n    counts[value] = counts.get(value, 0) + 1",
+    "while values and values[-1] < 0:\n    values.pop()",
+    "if total % 2 == 0:\n    print(\"even\")\nelse:\n    print(\"odd\")",
+    "result = sorted(values, key=abs, reverse=True)",
+    "text = \", \".join(map(str, values))",
+    "try:\n    ratio = total / len(values)\nexcept ZeroDivisionError:\n    ratio = 0.0",
+    "matrix = [[row * column for column in range(3)] for row in range(3)]",
+    "flat = [cell for row in matrix for cell in row]",
+    "def square(number):\n    return number ** 2",
+    "squares = list(map(square, values))",
+    "with open(\"log.txt\", \"w\") as file:\n    file.write(text)",
+    "lookup = {index: value for index, value in enumerate(values)}",
+    "evens = [value for value in values if not value & 1]",
+    "assert isinstance(values, list), \"values must be a list\"",
+    "for index in range(len(values) - 1, -1, -1):\n    values[index] -= 1",
+    "class Point:\n    def __init__(self, x, y):\n        self.x, self.y = x, y",
+    "point = Point(*values[:2]) if len(values) > 1 else None",
+    "lambda_sum = (lambda a, b: a + b)(1, 2)",
+    "print(f\"{total=} {best=}\")",
+    "chars = [chr(ord(\"a\") + offset) for offset in range(26)]",
+    "import itertools\ncombos = list(itertools.combinations(values, 2))",
+    "stack = []\nfor char in text:\n    if char == \",\":\n        stack.append(char)",
+    "found = any(value > 10 for value in values) and all(values)",
+    "del counts",
+    "minimum = min(values) if values else -1",
+    "bits = bin(total)[2:].zfill(8)",
+    "reverse = values[::-1]",
+    "nested = {\"a\": {\"b\": [1, 2, {\"c\": None}]}}",
+    "for key, value in sorted(lookup.items()):\n    if value is None:\n        continue\n    break",
+    "global_count = len(seen) + len(pairs) * 2 - 1",
+    "def walk(node, depth=0):\n    yield node, depth\n"
+    "    for child in node:\n        yield from walk(child, depth + 1)",
+    "average = round(total / max(len(values), 1), 2)",
+    "unique = sorted(set(values) - seen)",
+    "print(*result, sep=\"\\n\")",
+)
+
+
+def program(number: int) -> str:
+    """A program drawn from the statements, distinct for every number."""
+    generator = random.Random(number)
+    return "\n".join(generator.sample(STATEMENTS, 15)) + "\n"
+
+
+def copy(code: str) -> str:
+    """Disguises a copy by renaming, reformatting and adding comments."""
+    return (
+        code.replace("values", "items")
+        .replace("total", "amount")
+        .replace("    ", "  ")
+        .replace(" = ", "=")
+        .replace("\n", "  # copied\n", 3)
+    )
+
+
+def main():
+    """Fills the index, times the lookups and reports the results."""
+    parser = argparse.ArgumentParser(description="Benchmarks the solution similarity index.")
+    parser.add_argument("--solutions", type=int, default=100_000, help="Stored solutions of other programs.")
+    parser.add_argument("--queries", type=int, default=200, help="Programs stored and looked up.")
+    parser.add_argument("--database", help="The scratch database, a temporary file if omitted.")
+    arguments = parser.parse_args()
+
+    path = arguments.database or os.path.join(tempfile.mkdtemp(), "similarity.db")
+    connection = sqlite3.connect(path)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    connection.commit()
+
+    index = SimilarityIndex(path)
+
+    started = time.perf_counter()
+    batch = 10_000
+    for start in range(0, arguments.solutions, batch):
+        index.add_many(
+            (solution_id, solution_id, index.signature(program(solution_id)))
+            for solution_id in range(start, min(start + batch, arguments.solutions))
+        )
+    filled = time.perf_counter() - started
+    print(f"stored {arguments.solutions} signatures in {filled:.1f}s ({os.path.getsize(path) / 2**20:.0f} MiB)")
+
+    # The looked up programs are drawn after the stored ones, so only their copies are the same program.
+    queries = range(arguments.solutions, arguments.solutions + arguments.queries)
+    copies = {}
+    for offset, number in enumerate(queries):
+        solution_id = arguments.solutions + arguments.queries + offset
+        index.add_many([(solution_id, -1, index.signature(copy(program(number))))])
+        copies[number] = solution_id
+
+    hits = index._connection().execute(
+        "SELECT MAX(count) FROM (SELECT COUNT(*) AS count FROM solution_bands GROUP BY band, key)"
+    )
+    print(f"most solutions sharing a band key: {hits.fetchone()[0]}")
+
+    latencies, found, scores = [], 0, []
+    for number in queries:
+        started = time.perf_counter()
+        signature = index.signature(program(number))
+        match, score = index.query(signature)
+        latencies.append(time.perf_counter() - started)
+        found += match == copies[number] and score >= index.threshold
+        scores.append(score)
+
+    latencies.sort()
+    print(
+        f"lookups: p50={statistics.median(latencies) * 1000:.2f}ms "
+        f"p99={latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000:.2f}ms"
+    )
+    print(f"copies found: {found}/{arguments.queries}, median similarity {statistics.median(scores):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Compares serving the views from disk with serving them from memory.
+
+Usage: python benchmark_static.py [--requests N]
+
+Calls two apps directly through ASGI, without a network in between:
+one answering with a `FileResponse` like the old handlers, and one
+answering from `StaticAssets`. Reports requests per second and bytes
+sent per response for plain, compressed and conditional requests.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Tuple
+
+from app.static import StaticAssets
+from fastapi import FastAPI, Request
+from starlette.responses import FileResponse
+
+VIEWS = "views"
+
+
+def disk_app() -> FastAPI:
+    """The old handlers, reading the view from disk on every request."""
+    app = FastAPI()
+
+    @app.get("/")
+    async def home():
+        return FileResponse(f"{VIEWS}/home.html")
+
+    return app
+
+
+def memory_app() -> FastAPI:
+    """The handlers serving the view from memory."""
+    app = FastAPI()
+    assets = StaticAssets(VIEWS)
+    assets.load_all()
+
+    @app.get("/")
+    async def home(request: Request):
+        return assets.response("home.html", request)
+
+    return app
+
+
+async def call(app: FastAPI, headers: List[Tuple[bytes, bytes]]) -> Tuple[int, Dict[bytes, bytes], int]:
+    """Sends one GET / to an app and returns the status, headers and body size."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/",
+        "raw_path": b"/",
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("127.0.0.1", 1234),
+        "server": ("127.0.0.1", 8080),
+    }
+    response: Dict[str, object] = {"body": 0}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message["headers"])
+        elif message["type"] == "http.response.body":
+            response["body"] += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
+
+
+async def measure(app: FastAPI, headers: List[Tuple[bytes, bytes]], requests: int) -> Tuple[float, int, int]:
+    """Times the requests and returns the requests per second, last status and body size."""
+    status, _, size = await call(app, headers)
+    started = time.perf_counter()
+    for _ in range(requests):
+        status, _, size = await call(app, headers)
+    return requests / (time.perf_counter() - started), status, size
+
+
+async def run(requests: int):
+    """Measures both apps for every kind of request."""
+    disk = disk_app()
+    memory = memory_app()
+    compressed = [(b"accept-encoding", b"gzip, deflate, br")]
+    disk_etag = (await call(disk, []))[1][b"etag"]
+    memory_etag = (await call(memory, compressed))[1][b"etag"]
+
+    cases = {
+        "plain": ([], []),
+        "gzip/br": (compressed, compressed),
+        "conditional": ([(b"if-none-match", disk_etag)], [*compressed, (b"if-none-match", memory_etag)]),
+    }
+    for name, (disk_headers, memory_headers) in cases.items():
+        disk_rate, disk_status, disk_size = await measure(disk, disk_headers, requests)
+        memory_rate, memory_status, memory_size = await measure(memory, memory_headers, requests)
+        print(
+            f"{name:>11}: disk {disk_rate:8.0f} req/s {disk_status} {disk_size:>5} B | "
+            f"memory {memory_rate:8.0f} req/s {memory_status} {memory_size:>5} B | "
+            f"{memory_rate / disk_rate:.1f}x"
+        )
+
+
+def main():
+    """Runs the comparison."""
+    parser = argparse.ArgumentParser(description="Compares serving the views from disk and from memory.")
+    parser.add_argument("--requests", type=int, default=20_000, help="Requests per measurement.")
+    arguments = parser.parse_args()
+    asyncio.run(run(arguments.requests))
+
+
+if __name__ == "__main__":
+    main()
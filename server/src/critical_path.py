@@ -0,0 +1,132 @@
+"""Rebuilds the critical path of a trace from span files.
+
+Usage: python critical_path.py SPAN_FILE [SPAN_FILE ...] [--trace TRACE_ID]
+
+Span files are written by the server and the client when started
+with the `CJ9_TRACE` environment variable set to a file path, the
+client only recording the fraction of traces set by `CJ9_TRACE_SAMPLE`.
+Without `--trace` the slowest traces are listed.
+Times of different machines are only comparable if their clocks agree.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def read_spans(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """Reads the spans of the span files."""
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Trace:
+    """The spans of a trace arranged as a tree.
+
+    Spans whose parent was not recorded, like the client's run span
+    of a trace that is still running, are treated as roots.
+
+    :param spans: The spans of the trace.
+    """
+
+    def __init__(self, spans: List[Dict[str, Any]]):
+        self.spans = {span["span"]: span for span in spans}
+        self.children: Dict[Optional[str], List[Dict[str, Any]]] = defaultdict(list)
+        for span in spans:
+            parent = span["parent"] if span["parent"] in self.spans else None
+            self.children[parent].append(span)
+
+        self.start = min(span["start"] for span in spans)
+        self.finishes: Dict[str, float] = {}
+
+    def finish(self, span: Dict[str, Any]) -> float:
+        """The time the span and all work it caused finished.
+
+        Work can outlive the span that started it, like a run
+        started by a message that was already parsed.
+        """
+        if span["span"] not in self.finishes:
+            self.finishes[span["span"]] = max(
+                [span["end"]] + [self.finish(child) for child in self.children[span["span"]]]
+            )
+        return self.finishes[span["span"]]
+
+    @property
+    def end(self) -> float:
+        """The time the last work of the trace finished."""
+        return max(self.finish(span) for span in self.children[None])
+
+    def critical_path(self) -> List[Dict[str, Any]]:
+        """The chain of spans that determined when the trace finished.
+
+        Starting at the root that finished last, it follows the child
+        whose work finished last at every step.
+        """
+        path = []
+        candidates = self.children[None]
+        while candidates:
+            span = max(candidates, key=self.finish)
+            path.append(span)
+            candidates = self.children[span["span"]]
+        return path
+
+    def self_time(self, span: Dict[str, Any]) -> float:
+        """The time of a span not covered by the work of its children."""
+        covered = 0.0
+        cursor = span["start"]
+        for child in sorted(self.children[span["span"]], key=lambda child: child["start"]):
+            start, end = max(child["start"], cursor), min(self.finish(child), span["end"])
+            if end > start:
+                covered += end - start
+                cursor = end
+        return span["end"] - span["start"] - covered
+
+
+def describe(span: Dict[str, Any]) -> str:
+    """Formats the service, name and attributes of a span."""
+    attributes = " ".join(f"{key}={value}" for key, value in span["attributes"].items())
+    return f"{span['service']}:{span['name']} {attributes}".rstrip()
+
+
+def main():
+    """Prints the critical path of a trace, or lists the slowest traces."""
+    parser = argparse.ArgumentParser(description="Rebuilds the critical path of a trace.")
+    parser.add_argument("files", nargs="+", help="The span files written with CJ9_TRACE.")
+    parser.add_argument("--trace", help="The trace id, the slowest traces are listed if omitted.")
+    arguments = parser.parse_args()
+
+    traces: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for span in read_spans(arguments.files):
+        traces[span["trace"]].append(span)
+
+    if arguments.trace is None:
+        built = {trace_id: Trace(spans) for trace_id, spans in traces.items()}
+        slowest = sorted(built.items(), key=lambda item: item[1].start - item[1].end)
+        for trace_id, trace in slowest[:20]:
+            root = max(trace.children[None], key=trace.finish)
+            print(f"{trace_id}  {(trace.end - trace.start) * 1000:9.2f}ms  {describe(root)}")
+        return
+
+    if arguments.trace not in traces:
+        parser.error(f"no spans of trace {arguments.trace} in the given files")
+
+    trace = Trace(traces[arguments.trace])
+    print(f"trace {arguments.trace}: {(trace.end - trace.start) * 1000:.2f}ms, {len(trace.spans)} spans")
+    print(f"{'offset':>10} {'duration':>10} {'self':>10}")
+    for depth, span in enumerate(trace.critical_path()):
+        print(
+            f"{(span['start'] - trace.start) * 1000:8.2f}ms "
+            f"{(span['end'] - span['start']) * 1000:8.2f}ms "
+            f"{trace.self_time(span) * 1000:8.2f}ms "
+            f"{'  ' * depth}{describe(span)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,102 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import secrets
+import sqlite3
 import sys
 import uuid
-from typing import Any, Dict
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set
 
 import aiohttp
 import databases
 import pydantic
-from app import models
-from app.database import SQLALCHEMY_DATABASE_URL, engine
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from starlette.responses import FileResponse
+from app import collab, migrations, models
+from app.benchmark import Benchmark
+from app.capture import TrafficCapture, current_cause
+from app.chatfilter import ChatFilter
+from app.database import (
+    SOLUTIONS_DATABASE_PATH, SOLUTIONS_DATABASE_URL, SQLALCHEMY_DATABASE_URL,
+    SQLITE_DATABASE_PATH, engine, router, solutions_engine
+)
+from app.executor import PUBLIC_PISTON_URL, Executor
+from app.provisioning import provision_users
+from app.ratelimit import TokenBucket
+from app.search import MessageIndex, SearchTimeout
+from app.similarity import SimilarityIndex
+from app.static import StaticAssets
+from app.tracing import Tracer
+from fastapi import (
+    BackgroundTasks, FastAPI, Request, WebSocket, WebSocketDisconnect, status
+)
+from starlette.concurrency import run_in_threadpool
 
 debug = sys.argv[1] == "debug"
 app = FastAPI(debug=debug)
 database = databases.Database(SQLALCHEMY_DATABASE_URL)
-models.Base.metadata.create_all(bind=engine)
+solutions_database = databases.Database(SOLUTIONS_DATABASE_URL)
+assets = StaticAssets("views")
+similarity_index = SimilarityIndex(
+    SOLUTIONS_DATABASE_PATH, threshold=float(os.environ.get("CJ9_DUPLICATE_THRESHOLD", 0.8))
+)
+tracer = Tracer(os.environ.get("CJ9_TRACE"), service="server")
+message_index = MessageIndex(router, tracer=tracer, timeout=float(os.environ.get("CJ9_SEARCH_TIMEOUT", 1)))
+# Searches allowed per second and in a burst per user.
+search_rate = float(os.environ.get("CJ9_SEARCH_RATE", 1))
+search_burst = float(os.environ.get("CJ9_SEARCH_BURST", 5))
+search_buckets: Dict[int, TokenBucket] = {}
+chat_filter = ChatFilter(os.environ.get("CJ9_CHAT_FILTER"))
+executor = Executor(
+    # Output only streams from a self-hosted Piston, the public one sends it once runs finished.
+    os.environ.get("CJ9_PISTON_URL", PUBLIC_PISTON_URL),
+    max_concurrent=int(os.environ.get("CJ9_MAX_RUNS", 4)),
+    # The public Piston instance allows runs of at most 3 seconds.
+    timeout=float(os.environ.get("CJ9_RUN_TIMEOUT", 3)),
+    tracer=tracer,
+)
+admin_token = os.environ.get("CJ9_ADMIN_TOKEN")
+benchmark = Benchmark(
+    executor,
+    max_spread=float(os.environ.get("CJ9_BENCHMARK_MAX_SPREAD", 0.2)),
+    max_concurrent=int(os.environ.get("CJ9_MAX_BENCHMARKS", 1)),
+)
 
 
 @app.on_event("startup")
 async def connect():
-    """Starts the database connection"""
+    """Migrates and starts the database connections and loads the views"""
+    migrations.migrate(engine, migrations.MAIN)
+    migrations.migrate(solutions_engine, migrations.SOLUTIONS)
+    for chat_engine in router.chat_engines:
+        migrations.migrate(chat_engine, migrations.CHAT)
+    migrations.import_unsharded(SQLITE_DATABASE_PATH, solutions_engine, router)
     await database.connect()
+    await solutions_database.connect()
+    assets.load_all()
+    message_index.start()
+    if chat_filter.path is not None:
+        chat_filter.load()
+        asyncio.create_task(chat_filter.watch())
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    """Shuts down the database connection"""
+    """Shuts down the database connections"""
     await database.disconnect()
+    await solutions_database.disconnect()
+    router.dispose()
+    await executor.close()
+    message_index.stop()
+    tracer.close()
+    if manager.capture is not None:
+        manager.capture.close()
+
+
+def is_admin(token: str) -> bool:
+    """Checks a token against the admin token, if one is set."""
+    # compare_digest only takes ASCII strings, anyone can send other characters.
+    return admin_token is not None and secrets.compare_digest(token.encode(), admin_token.encode())
 
 
 class LoginModel(pydantic.BaseModel):
@@ -37,6 +106,45 @@ class LoginModel(pydantic.BaseModel):
     password: str
 
 
+class CompletedLevelModel(pydantic.BaseModel):
+    """A level completed by a user"""
+
+    level: int
+    completed_at: float
+
+
+class BestRunModel(pydantic.BaseModel):
+    """The fastest successful run of a level by a user"""
+
+    level: int
+    duration: float
+
+
+class ProgressModel(pydantic.BaseModel):
+    """A batch of progress uploaded by a client"""
+
+    token: str
+    completed: List[CompletedLevelModel] = []
+    best_runs: List[BestRunModel] = []
+
+
+class SolutionModel(pydantic.BaseModel):
+    """A solution submitted by a user"""
+
+    token: str
+    solution: str
+    documentation: Optional[str] = None
+    tests: Optional[str] = None
+
+
+class BulkUsersModel(pydantic.BaseModel):
+    """A batch of accounts created by an administrator"""
+
+    admin_token: str
+    users: List[LoginModel]
+    chunk_size: int = 500
+
+
 class WebsocketConnection:
     """Represents a websocket connection.
 
@@ -47,26 +155,88 @@ class WebsocketConnection:
     ----------
     MESSAGE
         A user has sent a message.
+    EDIT
+        A user has edited the shared code input of their level.
+    SNAPSHOT
+        A user has opened a level and requests its shared code input.
+    RUN
+        A user wants to run code.
+    OUTPUT
+        A chunk of output of a running user's code.
+    EXIT
+        The user's code has finished running.
+    CANCEL
+        A user wants to stop their code running.
+    DIRECT_MESSAGE
+        A user has sent a message to one other user.
+    RESYNC
+        The server dropped a user's edits, the user has to
+        request the shared code input of their level again.
     """
 
     MESSAGE = 0
-
-    def __init__(self, ws: WebSocket, username: str):
+    EDIT = 1
+    SNAPSHOT = 2
+    RUN = 3
+    OUTPUT = 4
+    EXIT = 5
+    CANCEL = 6
+    DIRECT_MESSAGE = 7
+    RESYNC = 8
+
+    def __init__(
+        self,
+        ws: WebSocket,
+        username: str,
+        *,
+        bucket: TokenBucket,
+        edit_bucket: TokenBucket,
+        trace_bucket: TokenBucket,
+    ):
         self.ws = ws
         self.username = username
         self.id = uuid.uuid4()
+        self.level: Optional[int] = None
+        self.resyncing = False
+        self.bucket = bucket
+        self.edit_bucket = edit_bucket
+        self.trace_bucket = trace_bucket
+        self.run: Optional[asyncio.Task] = None
 
     @classmethod
-    async def from_websocket(cls, websocket: WebSocket, username: str) -> WebsocketConnection:
+    async def from_websocket(
+        cls,
+        websocket: WebSocket,
+        username: str,
+        *,
+        bucket: TokenBucket,
+        edit_bucket: TokenBucket,
+        trace_bucket: TokenBucket,
+    ) -> WebsocketConnection:
         """
         Creates a `WebsocketConnection` from a websocket connection.
 
         :param ws: The websocket connection to use.
+        :param bucket: The token bucket limiting inbound messages.
+        :param edit_bucket: The token bucket limiting inbound edits.
+        :param trace_bucket: The token bucket limiting the traces continued.
         """
         await websocket.accept()
-        self = cls(websocket, username)
+        self = cls(websocket, username, bucket=bucket, edit_bucket=edit_bucket, trace_bucket=trace_bucket)
         return self
 
+    async def send(self, message: Dict[Any, Any]):
+        """Sends a message through the websocket connection.
+
+        :param message: The message to send.
+        """
+        span = tracer.current.get()
+        if span is not None:
+            message = {**message, "trace": span.context}
+        if manager.capture is not None:
+            manager.capture.outbound(self.id, message)
+        await self.ws.send_json(message)
+
     async def parse(self, data: Dict[Any, Any]):
         """
         Parses a message from the websocket connection.
@@ -74,14 +244,160 @@ class WebsocketConnection:
         :param message: Message from the websocket.
         """
         op = data.get("op")
+        payload = data.get("data")
+        if not isinstance(payload, dict):
+            manager.counters["messages_invalid"] += 1
+            return
 
         if op == self.MESSAGE:
+            if isinstance(payload.get("message"), str):
+                level = payload.get("level")
+                level = level if isinstance(level, int) else None
+                payload["message"] = self.filter_message(payload["message"], level)
+                if payload["message"] is None:
+                    return
+                message_index.add(self.username, level, payload["message"])
+            data.pop("trace", None)
             await manager.broadcast(data, ignore=self.id)
+        elif op == self.EDIT:
+            await manager.edit(self, payload)
+        elif op == self.SNAPSHOT:
+            await manager.join(self, payload.get("level"))
+        elif op == self.RUN:
+            self.start_run(payload)
+        elif op == self.CANCEL:
+            self.cancel_run()
+        elif op == self.DIRECT_MESSAGE:
+            await self.direct_message(payload)
+
+    async def direct_message(self, data: Dict[str, Any]):
+        """Delivers a message to every connection of its recipient.
+
+        The sender's other connections get a copy, so the
+        conversation shows up on all of their devices.
+
+        :param data: The recipient and the message.
+        """
+        recipient, message = data.get("to"), data.get("message")
+        if not isinstance(recipient, str) or not isinstance(message, str) or not message:
+            return
+        message = self.filter_message(message, self.level)
+        if message is None:
+            return
+
+        payload = {
+            "op": self.DIRECT_MESSAGE,
+            "data": {"author": self.username, "to": recipient, "message": message},
+        }
+        if not await manager.send_to_user(recipient, payload):
+            await self.send(
+                {"op": self.DIRECT_MESSAGE, "data": {"to": recipient, "error": f"{recipient} is not online."}}
+            )
+            return
+        if recipient != self.username:
+            await manager.send_to_user(self.username, payload, ignore=self.id)
+
+    def filter_message(self, text: str, level: Optional[int]) -> Optional[str]:
+        """Checks a chat message against the chat filter's word list.
+
+        Flagged messages are kept for review.
+
+        :param text: The message.
+        :param level: The level the author is on.
+        :return: The message to deliver, with masked terms replaced,
+                 or None if the message is dropped.
+        """
+        with tracer.span("server.filter"):
+            result = chat_filter.check(text)
+        if not result.flagged:
+            return text
+
+        chat_filter.record(self.username, level, text, result)
+        manager.counters["messages_flagged"] += 1
+        if result.dropped:
+            manager.counters["messages_dropped"] += 1
+            return None
+        return result.text
+
+    def start_run(self, data: Dict[str, Any]):
+        """Runs code in the background, stopping the previous run.
+
+        :param data: The code and the id the client gave the run.
+        """
+        if not isinstance(data.get("code"), str):
+            return
+
+        self.cancel_run()
+        self.run = asyncio.create_task(self.execute(data.get("run"), data["code"]))
+
+    def cancel_run(self):
+        """Stops the running code, if any."""
+        if self.run is not None:
+            self.run.cancel()
+            self.run = None
+
+    async def execute(self, run_id: Any, code: str):
+        """Runs code, streaming its output and exit code to the client.
+
+        A client that disconnected cancels the run, which kills the
+        code on Piston, instead of failing the task.
+
+        :param run_id: The id the client gave the run.
+        :param code: The code to run.
+        """
+        task = asyncio.current_task()
+
+        async def send_output(output: str):
+            if not await manager.deliver(self, {"op": self.OUTPUT, "data": {"run": run_id, "output": output}}):
+                task.cancel()
+
+        with tracer.span("server.execute"):
+            result = await executor.run(code, send_output)
+            await manager.deliver(
+                self,
+                {
+                    "op": self.EXIT,
+                    "data": {
+                        "run": run_id,
+                        "code": result.code,
+                        "truncated": result.truncated,
+                        "timed_out": result.timed_out,
+                        "error": result.error,
+                    },
+                },
+            )
 
     async def listen(self):
-        """Listens for messages from the websocket connection."""
-        message = await self.ws.receive_json()
-        await self.parse(message)
+        """Listens for messages from the websocket connection.
+
+        Frames that are not JSON objects are counted and ignored.
+        Edits have their own budget, so chatting does not throttle
+        them, and a throttled edit resynchronises the connection.
+        """
+        try:
+            message = await self.ws.receive_json()
+        except (KeyError, TypeError, ValueError):
+            # Binary frames have no text and invalid JSON does not decode.
+            message = None
+        if not isinstance(message, dict):
+            manager.counters["messages_invalid"] += 1
+            return
+
+        if manager.capture is not None:
+            current_cause.set(manager.capture.inbound(self.id, message))
+
+        with tracer.continue_trace(
+            message.get("trace"), "server.parse", bucket=self.trace_bucket, op=message.get("op")
+        ) as span:
+            edit = message.get("op") == self.EDIT
+            if not (self.edit_bucket if edit else self.bucket).consume():
+                manager.counters["messages_limited"] += 1
+                if span is not None:
+                    span.attributes["limited"] = True
+                if edit:
+                    await manager.resync(self, "throttled")
+                return
+            await self.parse(message)
 
 
 class ConnectionManager:
@@ -89,18 +405,85 @@ class ConnectionManager:
 
     Handles all inbound websocket connection and disconnect
     messages.
+
+    :param message_rate: Inbound messages allowed per second per connection.
+    :param message_burst: Inbound messages allowed in a burst per connection.
+    :param edit_rate: Inbound edits allowed per second per connection.
+    :param edit_burst: Inbound edits allowed in a burst per connection.
+    :param trace_rate: Traces continued per second per connection.
+    :param trace_burst: Traces continued in a burst per connection.
+    :param max_user_connections: Concurrent connections allowed per user.
+    :param max_connections: Concurrent connections allowed in total.
+    :param levels: The ids of the levels a room can be opened for.
+    :attr user_connections: The ids of the connections of every connected user.
+    :attr counters: Counts of the messages and connections rejected
+                    by the limits.
+    :attr capture: Records the websocket traffic when enabled.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        *,
+        message_rate: float = 20,
+        message_burst: float = 60,
+        edit_rate: float = 64,
+        edit_burst: float = 128,
+        trace_rate: float = 1,
+        trace_burst: float = 10,
+        max_user_connections: int = 5,
+        max_connections: int = 1000,
+        levels: Iterable[int] = range(1, 4),
+    ):
         self.active_connections: Dict[str, WebsocketConnection] = {}
-
-    async def connect(self, websocket: WebSocket, username: str):
+        self.rooms: Dict[int, collab.Room] = {}
+        self.levels = frozenset(levels)
+
+        self.message_rate = message_rate
+        self.message_burst = message_burst
+        self.edit_rate = edit_rate
+        self.edit_burst = edit_burst
+        self.trace_rate = trace_rate
+        self.trace_burst = trace_burst
+        self.max_user_connections = max_user_connections
+        self.max_connections = max_connections
+
+        self.user_connections: Dict[str, Set[uuid.UUID]] = {}
+        self.counters: Counter[str] = Counter()
+        self.capture: Optional[TrafficCapture] = None
+
+    async def connect(self, websocket: WebSocket, username: str) -> Optional[WebsocketConnection]:
         """Connects to the websocket connection.
 
+        Closes the websocket instead if the user or the server
+        already has too many connections.
+
         :param websocket: The websocket to connect to.
+        :return: The connection or None if it was rejected.
         """
-        connection = await WebsocketConnection.from_websocket(websocket, username)
+        close_code = None
+        if len(self.active_connections) >= self.max_connections:
+            self.counters["connections_rejected_global"] += 1
+            close_code = status.WS_1013_TRY_AGAIN_LATER
+        elif len(self.user_connections.get(username, ())) >= self.max_user_connections:
+            self.counters["connections_rejected_user"] += 1
+            close_code = status.WS_1008_POLICY_VIOLATION
+        if close_code is not None:
+            # Closing before the handshake fails it with a 403, so the client never sees the code.
+            await websocket.accept()
+            await websocket.close(code=close_code)
+            return None
+
+        connection = await WebsocketConnection.from_websocket(
+            websocket,
+            username,
+            bucket=TokenBucket(self.message_rate, self.message_burst),
+            edit_bucket=TokenBucket(self.edit_rate, self.edit_burst),
+            trace_bucket=TokenBucket(self.trace_rate, self.trace_burst),
+        )
         self.active_connections[connection.id] = connection
+        self.user_connections.setdefault(username, set()).add(connection.id)
+        if self.capture is not None:
+            self.capture.connect(connection.id, username)
         return connection
 
     def disconnect(self, connection: WebsocketConnection):
@@ -108,26 +491,250 @@ class ConnectionManager:
 
         :param connection: The websocket to disconnect from.
         """
+        self.leave(connection)
+        connection.cancel_run()
         del self.active_connections[connection.id]
+        if self.capture is not None:
+            self.capture.disconnect(connection.id)
+
+        ids = self.user_connections[connection.username]
+        ids.discard(connection.id)
+        if not ids:
+            del self.user_connections[connection.username]
+
+    async def send_to_user(
+        self, username: str, message: Dict[Any, Any], *, ignore: Optional[uuid.UUID] = None
+    ) -> int:
+        """Sends a message to every connection of a user.
+
+        :param username: The user to send the message to.
+        :param message: The message to send.
+        :param ignore: A connection of the user to skip.
+        :return: The amount of connections the message was sent to.
+        """
+        sent = 0
+        for id in list(self.user_connections.get(username, ())):
+            if id == ignore or id not in self.active_connections:
+                continue
+            sent += await self.deliver(self.active_connections[id], message)
+        return sent
 
-    async def broadcast(self, message: Dict[Any, Any], *, ignore: str):
-        """Broadcasts a message to every connected websocket connection
+    async def join(self, connection: WebsocketConnection, level: int):
+        """Moves a connection into the room of a level.
 
-        :param message: Message to broadcast.
+        Replies with a snapshot of the room's code input.
+        Unknown levels are ignored, so clients cannot create rooms.
+
+        :param connection: The connection opening the level.
+        :param level: The level opened.
+        """
+        if not isinstance(level, int) or level not in self.levels:
+            return
+
+        if level != connection.level:
+            self.leave(connection)
+            room = self.rooms.setdefault(level, collab.Room())
+            room.members.add(connection.id)
+            connection.level = level
+        connection.resyncing = False
+
+        await connection.send(
+            {
+                "op": WebsocketConnection.SNAPSHOT,
+                "data": {"level": level, "document": self.rooms[level].snapshot()},
+            }
+        )
+
+    def leave(self, connection: WebsocketConnection):
+        """Removes a connection from its level room.
+
+        The room is removed with its last member, the next
+        connection opening the level seeds it again.
+
+        :param connection: The connection leaving.
         """
-        for id, connection in self.active_connections.items():
-            if id == ignore:
+        if connection.level is None:
+            return
+
+        room = self.rooms[connection.level]
+        room.members.discard(connection.id)
+        if not room.members:
+            del self.rooms[connection.level]
+        connection.level = None
+        connection.resyncing = False
+
+    async def resync(self, connection: WebsocketConnection, reason: str):
+        """Tells a connection its edits were dropped.
+
+        Its edits are ignored until it requests a new snapshot,
+        as they were made on top of the edits that were dropped.
+        The connection stays in the room, so a room is not lost
+        with its only member.
+
+        :param connection: The connection whose edits were dropped.
+        :param reason: Why the edits were dropped.
+        """
+        if connection.level is None or connection.resyncing:
+            return
+
+        connection.resyncing = True
+        self.counters["edits_resynced"] += 1
+        await connection.send(
+            {"op": WebsocketConnection.RESYNC, "data": {"level": connection.level, "reason": reason}}
+        )
+
+    async def edit(self, connection: WebsocketConnection, data: Dict[str, Any]):
+        """Applies edits to a room and relays them to its other members.
+
+        A connection whose edits are rejected is resynchronised.
+
+        :param connection: The connection that made the edits.
+        :param data: The level, the batch of edit operations
+                     and whether they seed the room.
+        """
+        level = data.get("level")
+        if (
+            level is None
+            or level != connection.level
+            or connection.resyncing
+            or not isinstance(data.get("ops"), list)
+        ):
+            return
+
+        room = self.rooms[level]
+        with tracer.span("server.apply", ops=len(data["ops"])):
+            ops, rejected = room.apply(data["ops"], seed=data.get("seed") is True)
+        if rejected:
+            await self.resync(connection, "rejected")
+        if not ops:
+            return
+
+        message = {"op": WebsocketConnection.EDIT, "data": {"level": level, "ops": ops}}
+        for id in list(room.members):
+            if id == connection.id or id not in self.active_connections:
                 continue
-            await connection.ws.send_json(message)
+            await self.deliver(self.active_connections[id], message)
+
+    async def deliver(self, connection: WebsocketConnection, message: Dict[Any, Any]) -> bool:
+        """Sends a message to a connection that may have disconnected.
+
+        A recipient that just disconnected must not fail the sender's
+        message or run, its own listener removes it.
 
+        :param connection: The recipient.
+        :param message: The message to send.
+        :return: Whether the message was sent.
+        """
+        try:
+            await connection.send(message)
+        except Exception:
+            self.counters["messages_undelivered"] += 1
+            return False
+        return True
+
+    async def broadcast(self, message: Dict[Any, Any], *, ignore: str):
+        """Broadcasts a message to every connected websocket connection
 
-manager = ConnectionManager()
+        :param message: Message to broadcast.
+        """
+        with tracer.span("server.broadcast", recipients=len(self.active_connections) - 1):
+            # Connections may leave while a send is awaited.
+            for id, connection in list(self.active_connections.items()):
+                if id == ignore:
+                    continue
+                await self.deliver(connection, message)
+
+
+manager = ConnectionManager(
+    message_rate=float(os.environ.get("CJ9_MESSAGE_RATE", 20)),
+    message_burst=float(os.environ.get("CJ9_MESSAGE_BURST", 60)),
+    # Clients send at most one batch of edits per 16 ms frame.
+    edit_rate=float(os.environ.get("CJ9_EDIT_RATE", 64)),
+    edit_burst=float(os.environ.get("CJ9_EDIT_BURST", 128)),
+    trace_rate=float(os.environ.get("CJ9_TRACE_RATE", 1)),
+    trace_burst=float(os.environ.get("CJ9_TRACE_BURST", 10)),
+    max_user_connections=int(os.environ.get("CJ9_MAX_USER_CONNECTIONS", 5)),
+    max_connections=int(os.environ.get("CJ9_MAX_CONNECTIONS", 1000)),
+    levels=range(1, int(os.environ.get("CJ9_LEVELS", 3)) + 1),
+)
+if os.environ.get("CJ9_CAPTURE"):
+    manager.capture = TrafficCapture(os.environ["CJ9_CAPTURE"])
 
 
 @app.get("/")
-async def home():
+async def home(request: Request):
     """Renders the home page."""
-    return FileResponse("views/home.html")
+    return assets.response("home.html", request)
+
+
+@app.get("/static/{name}")
+async def static(name: str, request: Request):
+    """Serves a view by its plain or fingerprinted name.
+
+    :param name: The name of the view.
+    """
+    return assets.response(name, request)
+
+
+@app.get("/stats")
+async def stats():
+    """Gets the connection counts and the rate limiting counters."""
+    return {
+        "connections": len(manager.active_connections),
+        "users": len(manager.user_connections),
+        **manager.counters,
+    }
+
+
+@app.get("/messages/flagged")
+async def flagged_messages(token: str):
+    """Lists the recently flagged chat messages for review.
+
+    :param token: The admin token set by the `CJ9_ADMIN_TOKEN` environment variable.
+    """
+    if not is_admin(token):
+        return {"error": "Please enter a valid admin token."}
+    return {"messages": list(chat_filter.flagged)}
+
+
+@app.get("/messages/search")
+async def search_messages(
+    token: str,
+    q: str,
+    author: Optional[str] = None,
+    level: Optional[int] = None,
+    page: int = 1,
+    per_page: int = 20,
+):
+    """Searches the chat history, best matches first.
+
+    Every user may search `CJ9_SEARCH_RATE` times per second.
+
+    :param token: The token of the user searching.
+    :param q: The words to search for.
+    :param author: Only search messages of this author.
+    :param level: Only search messages sent on this level.
+    :param page: The page of results, starting at 1, at most the page of the
+                 `MessageIndex.MAX_RESULTS`th result.
+    :param per_page: The amount of results per page, at most 100.
+    """
+    user = await database.fetch_one(
+        "SELECT id FROM users WHERE token=:token", values={"token": token}
+    )
+    if user is None:
+        return {"error": "Please enter a valid token."}
+    if not search_buckets.setdefault(user["id"], TokenBucket(search_rate, search_burst)).consume():
+        return {"error": "Too many searches, please wait a moment."}
+
+    per_page = min(max(per_page, 1), 100)
+    page = min(max(page, 1), MessageIndex.MAX_RESULTS // per_page)
+    try:
+        results = await run_in_threadpool(
+            message_index.search, q, author=author, level=level, page=page, per_page=per_page
+        )
+    except SearchTimeout:
+        return {"error": "The search took too long, please search for more specific words."}
+    return {"page": page, "per_page": per_page, "results": results}
 
 
 @app.get("/user")
@@ -145,6 +752,123 @@ async def get_user(token: str):
     return response
 
 
+@app.get("/progress")
+async def get_progress(token: str):
+    """Gets the completed levels and best runs of a user.
+
+    :param token: The token of the user.
+    """
+    user = await database.fetch_one(
+        "SELECT id FROM users WHERE token=:token", values={"token": token}
+    )
+    if user is None:
+        return {"error": "Please enter a valid token."}
+
+    rows = await database.fetch_all(
+        "SELECT level, completed_at, best_time FROM progress WHERE user_id=:user_id",
+        values={"user_id": user["id"]},
+    )
+    return {
+        "completed": [
+            {"level": row["level"], "completed_at": row["completed_at"]}
+            for row in rows
+            if row["completed_at"] is not None
+        ],
+        "best_runs": [
+            {"level": row["level"], "duration": row["best_time"]}
+            for row in rows
+            if row["best_time"] is not None
+        ],
+    }
+
+
+@app.post("/progress")
+async def upload_progress(body: ProgressModel):
+    """Merges a batch of progress uploaded by a client.
+
+    Uploading the same batch twice does not change anything, the
+    earliest completion and the fastest run of a level are kept.
+
+    :param body: The body received from the request.
+    """
+    user = await database.fetch_one(
+        "SELECT id FROM users WHERE token=:token", values={"token": body.token}
+    )
+    if user is None:
+        return {"error": "Please enter a valid token."}
+
+    async with database.transaction():
+        if body.completed:
+            await database.execute_many(
+                "INSERT INTO progress (user_id, level, completed_at) VALUES (:user_id, :level, :completed_at) "
+                "ON CONFLICT (user_id, level) DO UPDATE SET "
+                "completed_at=MIN(COALESCE(completed_at, excluded.completed_at), excluded.completed_at)",
+                values=[{"user_id": user["id"], **row.dict()} for row in body.completed],
+            )
+        if body.best_runs:
+            await database.execute_many(
+                "INSERT INTO progress (user_id, level, best_time) VALUES (:user_id, :level, :duration) "
+                "ON CONFLICT (user_id, level) DO UPDATE SET "
+                "best_time=MIN(COALESCE(best_time, excluded.best_time), excluded.best_time)",
+                values=[{"user_id": user["id"], **row.dict()} for row in body.best_runs],
+            )
+    return {"completed": len(body.completed), "best_runs": len(body.best_runs)}
+
+
+async def benchmark_solution(solution_id: int, code: str):
+    """Benchmarks a solution and stores its time and memory if they are stable.
+
+    :param solution_id: The id of the solution.
+    :param code: The solution.
+    """
+    result = await benchmark.run(code)
+    if result is None:
+        return
+
+    await solutions_database.execute(
+        "UPDATE solutions SET time=:time, memory=:memory WHERE id=:id",
+        values={"time": result.time, "memory": result.memory, "id": solution_id},
+    )
+
+
+async def check_duplicate(solution_id: int, user_id: int, code: str):
+    """Stores how similar a solution is to the closest solution of another user.
+
+    :param solution_id: The id of the solution.
+    :param user_id: The id of the user who submitted it.
+    :param code: The solution.
+    """
+    duplicate_of, score = await run_in_threadpool(similarity_index.check, solution_id, user_id, code)
+    await solutions_database.execute(
+        "UPDATE solutions SET similarity=:similarity, duplicate_of=:duplicate_of WHERE id=:id",
+        values={"similarity": score, "duplicate_of": duplicate_of, "id": solution_id},
+    )
+
+
+@app.post("/solutions")
+async def submit_solution(body: SolutionModel, background_tasks: BackgroundTasks):
+    """Stores a solution, then checks it for copies and benchmarks it in the background.
+
+    :param body: The body received from the request.
+    """
+    user = await database.fetch_one(
+        "SELECT id FROM users WHERE token=:token", values={"token": body.token}
+    )
+    if user is None:
+        return {"error": "Please enter a valid token."}
+
+    query = models.Solution.__table__.insert().values(
+        solution=body.solution,
+        documentation=body.documentation,
+        tests=body.tests,
+        user_id=user["id"],
+    )
+    solution_id = await solutions_database.execute(query)
+    background_tasks.add_task(check_duplicate, solution_id, user["id"], body.solution)
+    background_tasks.add_task(benchmark_solution, solution_id, body.solution)
+    return {"id": solution_id}
+
+
 @app.get("/login")
 async def login(body: LoginModel):
     """Retrieves user data from username and password.
@@ -161,9 +885,9 @@ async def login(body: LoginModel):
 
 
 @app.get("/register")
-async def register_details():
+async def register_details(request: Request):
     """Register an account."""
-    return FileResponse("views/register.html")
+    return assets.response("register.html", request)
 
 
 @app.post("/register")
@@ -177,8 +901,31 @@ async def create_account(body: LoginModel):
     )
     try:
         await database.execute(query)
-    except Exception:
-        return
+    except sqlite3.IntegrityError:
+        return {"error": "This username is already taken."}
+
+
+@app.post("/users/bulk")
+async def create_accounts(body: BulkUsersModel):
+    """Creates many accounts at once, like a whole class.
+
+    Only available when the `CJ9_ADMIN_TOKEN` environment variable
+    is set. The accounts are inserted in chunked transactions on a
+    worker thread, so the websocket connections are not blocked.
+
+    :param body: The admin token and the accounts to create.
+    :return: The result and issued token of every account, in order.
+    """
+    if not is_admin(body.admin_token):
+        return {"error": "Please enter a valid admin token."}
+
+    results = await run_in_threadpool(
+        provision_users,
+        engine,
+        [(user.username, user.password) for user in body.users],
+        chunk_size=body.chunk_size,
+    )
+    return {"results": [result.dict() for result in results]}
 
 
 @app.websocket("/ws/{token}")
@@ -191,8 +938,14 @@ async def websocket_connect(websocket: WebSocket, token: str):
                 return
 
     connection = await manager.connect(websocket, response["username"])
+    if connection is None:
+        return
+
     try:
         while True:
             await connection.listen()
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Also frees the connection's slot when handling a message failed.
         manager.disconnect(connection)
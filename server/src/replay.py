@@ -0,0 +1,216 @@
+"""Replays a websocket traffic capture against a running server.
+
+Usage: python replay.py CAPTURE [--speed N] [--url URL]
+
+`--speed 1` replays in real time, `--speed 10` ten times faster and
+`--speed 0` as fast as possible. Captures are recorded by starting the
+server with the `CJ9_CAPTURE` environment variable set to a file path.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+import aiohttp
+from app.capture import CONNECT, DISCONNECT, INBOUND, OUTBOUND, read_capture
+
+MESSAGE, SNAPSHOT, RUN, EXIT = 0, 2, 3, 5
+
+
+def capture_latencies(records: List[List[Any]]) -> Dict[int, List[float]]:
+    """Gets the latency of every answered inbound frame in a capture, per op.
+
+    The latency of a frame is the time until the first outbound frame
+    it caused, or until the run finished for `RUN` frames.
+    """
+    inbound: Dict[int, tuple[float, Any]] = {}
+    latencies: Dict[int, List[float]] = defaultdict(list)
+    for at, seq, _, kind, cause, payload in records:
+        if kind == INBOUND and isinstance(payload, dict):
+            inbound[seq] = (at, payload.get("op"))
+        elif kind == OUTBOUND and cause in inbound:
+            sent_at, op = inbound[cause]
+            if op == RUN and payload.get("op") != EXIT:
+                continue
+            latencies[op].append(at - sent_at)
+            del inbound[cause]
+    return latencies
+
+
+def throughput(records: List[List[Any]], kind: str) -> float:
+    """Frames of a kind per second over the duration of the records."""
+    times = [record[0] for record in records if record[3] == kind]
+    if len(times) < 2 or times[-1] == times[0]:
+        return 0.0
+    return len(times) / (times[-1] - times[0])
+
+
+class Replayer:
+    """Drives a server with the inbound frames of a capture.
+
+    Every captured connection is replayed by a new user with its
+    own websocket. Chat messages are tagged so their delivery to
+    other connections can be timed.
+
+    :param url: The base URL of the server.
+    :param speed: The replay speed, 0 to replay as fast as possible.
+    """
+
+    def __init__(self, url: str, speed: float):
+        self.url = url.rstrip("/")
+        self.speed = speed
+        self.run_name = uuid.uuid4().hex[:8]
+
+        self.sockets: Dict[int, aiohttp.ClientWebSocketResponse] = {}
+        self.sent: Dict[Any, tuple[float, int]] = {}
+        self.snapshots: Dict[int, Deque[float]] = defaultdict(deque)
+        self.latencies: Dict[int, List[float]] = defaultdict(list)
+        self.received = 0
+        self.duration = 0.0
+
+    async def login(self, session: aiohttp.ClientSession, number: int) -> str:
+        """Creates the user replaying a connection and gets its token."""
+        credentials = {"username": f"replay-{self.run_name}-{number}", "password": self.run_name}
+        async with session.post(f"{self.url}/register", json=credentials):
+            pass
+        async with session.get(f"{self.url}/login", json=credentials) as request:
+            return (await request.json())["token"]
+
+    async def receive(self, number: int, socket: aiohttp.ClientWebSocketResponse):
+        """Times the answers received on a replayed connection."""
+        async for message in socket:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            now = time.perf_counter()
+            self.received += 1
+
+            payload = json.loads(message.data)
+            op, data = payload.get("op"), payload.get("data") or {}
+            if op == MESSAGE:
+                key = ("message", data.get("replay"))
+            elif op == EXIT:
+                key = ("run", data.get("run"))
+            elif op == SNAPSHOT and self.snapshots[number]:
+                self.latencies[SNAPSHOT].append(now - self.snapshots[number].popleft())
+                continue
+            else:
+                continue
+
+            if key in self.sent:
+                sent_at, sent_op = self.sent.pop(key)
+                self.latencies[sent_op].append(now - sent_at)
+
+    def tag(self, number: int, seq: int, payload: Any) -> Any:
+        """Tags a frame so its answer can be recognised."""
+        if not isinstance(payload, dict):
+            return payload
+        op, data = payload.get("op"), payload.get("data")
+        now = time.perf_counter()
+
+        if op == MESSAGE and isinstance(data, dict):
+            self.sent[("message", seq)] = (now, op)
+            return {**payload, "data": {**data, "replay": seq}}
+        if op == RUN and isinstance(data, dict):
+            self.sent[("run", data.get("run"))] = (now, op)
+        elif op == SNAPSHOT:
+            self.snapshots[number].append(now)
+        return payload
+
+    async def replay(self, records: List[List[Any]]):
+        """Replays the records, keeping their relative timing."""
+        numbers = {record[2] for record in records if record[3] in (CONNECT, INBOUND)}
+        async with aiohttp.ClientSession() as session:
+            tokens = {number: await self.login(session, number) for number in numbers}
+            listeners = []
+
+            started = time.perf_counter()
+            first = records[0][0] if records else 0
+            for at, seq, number, kind, _, payload in records:
+                if kind == OUTBOUND:
+                    continue
+                if self.speed:
+                    delay = (at - first) / self.speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                socket = self.sockets.get(number)
+                if kind in (CONNECT, INBOUND) and socket is None:
+                    socket = self.sockets[number] = await session.ws_connect(
+                        f"{self.url}/ws/{tokens[number]}"
+                    )
+                    listeners.append(asyncio.create_task(self.receive(number, socket)))
+
+                if kind == INBOUND:
+                    await socket.send_json(self.tag(number, seq, payload))
+                elif kind == DISCONNECT and socket is not None:
+                    await socket.close()
+                    del self.sockets[number]
+            self.duration = time.perf_counter() - started
+
+            await asyncio.sleep(1)
+            for socket in self.sockets.values():
+                await socket.close()
+            for listener in listeners:
+                listener.cancel()
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Gets a percentile of the values, None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def describe(values: List[float]) -> str:
+    """Formats the count, median and tail of latencies in milliseconds."""
+    if not values:
+        return "no samples"
+    return (
+        f"n={len(values)} p50={statistics.median(values) * 1000:.2f}ms "
+        f"p95={percentile(values, 0.95) * 1000:.2f}ms p99={percentile(values, 0.99) * 1000:.2f}ms"
+    )
+
+
+def main():
+    """Replays a capture and reports how it compares to the original."""
+    parser = argparse.ArgumentParser(description="Replays a websocket traffic capture.")
+    parser.add_argument("capture", help="The capture file recorded with CJ9_CAPTURE.")
+    parser.add_argument("--speed", type=float, default=1, help="Replay speed, 0 for as fast as possible.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="The server to replay against.")
+    arguments = parser.parse_args()
+
+    records = list(read_capture(arguments.capture))
+    replayer = Replayer(arguments.url, arguments.speed)
+    asyncio.run(replayer.replay(records))
+
+    original = capture_latencies(records)
+    names = {MESSAGE: "message", SNAPSHOT: "snapshot", RUN: "run"}
+    for op, name in names.items():
+        print(f"{name:>8} capture: {describe(original.get(op, []))}")
+        print(f"{name:>8}  replay: {describe(replayer.latencies.get(op, []))}")
+
+    sent = sum(1 for record in records if record[3] == INBOUND)
+    duration = max(replayer.duration, 1e-9)
+    print(
+        f"inbound  capture: {throughput(records, INBOUND):.1f}/s  "
+        f"replay: {sent / duration:.1f}/s"
+    )
+    print(
+        f"outbound capture: {throughput(records, OUTBOUND):.1f}/s  "
+        f"replay: {replayer.received / duration:.1f}/s"
+    )
+    unanswered = len(replayer.sent) + sum(map(len, replayer.snapshots.values()))
+    if unanswered:
+        print(f"{unanswered} replayed frames were never answered (rate limited or dropped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def main(monkeypatch):
+    """Imports the server without starting it."""
+    # The server reads its mode from the command line when imported.
+    monkeypatch.setattr(sys, "argv", ["main.py", "test"])
+    import main
+
+    return main
+
+
+class FakeWebSocket:
+    """Records what the server sends to a websocket.
+
+    :param inbox: The messages the client sends, in order.
+    """
+
+    def __init__(self, inbox=()):
+        self.inbox = list(inbox)
+        self.sent = []
+        self.accepted = False
+        self.close_code = None
+
+    async def accept(self):
+        """Accepts the handshake."""
+        self.accepted = True
+
+    async def close(self, code):
+        """Closes the websocket with a code."""
+        self.close_code = code
+
+    async def send_json(self, message):
+        """Records a sent message."""
+        self.sent.append(message)
+
+    async def receive_json(self):
+        """Receives the next message of the inbox."""
+        return self.inbox.pop(0)
+
+
+@pytest.fixture
+def websocket():
+    """Creates fake websockets."""
+    return FakeWebSocket
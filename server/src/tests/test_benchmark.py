@@ -0,0 +1,84 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+from app.benchmark import Benchmark
+from app.executor import Executor
+
+
+class LocalExecutor(Executor):
+    """Runs the jobs in a local directory instead of on Piston."""
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+
+    async def execute(self, files, *, stdin="", timeout=None):
+        """Runs the first of the files, failing the test if Piston would have stopped it."""
+        for file in files:
+            (self.directory / file["name"]).write_text(file["content"])
+        process = subprocess.run(
+            [sys.executable, files[0]["name"]],
+            input=stdin,
+            capture_output=True,
+            text=True,
+            cwd=self.directory,
+            timeout=timeout or self.timeout,
+        )
+        return {"code": process.returncode, "stdout": process.stdout}
+
+
+class CannedBenchmark(Benchmark):
+    """Returns the given CPU times instead of running workers."""
+
+    def __init__(self, cpu, empty_cpu, **kwargs):
+        super().__init__(Executor(), workers=1, **kwargs)
+        self.result = {"cpu": cpu, "empty_cpu": empty_cpu, "maxrss": [0] * len(cpu), "empty_maxrss": [0] * len(cpu)}
+
+    async def _measure(self, code):
+        return self.result
+
+
+@pytest.fixture
+def measure(tmp_path):
+    """Runs the harness of a benchmark locally and returns its measurements."""
+
+    def measure(code, **kwargs):
+        benchmark = Benchmark(LocalExecutor(tmp_path, timeout=2), **kwargs)
+        return asyncio.run(benchmark._measure(code))
+
+    return measure
+
+
+def test_harness_stops_endless_solutions(measure):
+    """A solution running past the budget is killed before Piston stops the job."""
+    assert measure("while True: pass") is None
+
+
+def test_harness_fits_the_runs_into_the_budget(measure):
+    """A slow solution gets fewer runs instead of running out of time."""
+    result = measure("import time; time.sleep(0.2)", warmup=2, repeat=7, min_repeat=3)
+    assert 3 <= len(result["cpu"]) < 7
+
+
+def test_run_subtracts_the_preceding_empty_run():
+    """Drifting times of both programs do not count as spread."""
+    empty_cpu = [0.02, 0.03, 0.04, 0.05, 0.06]
+    benchmark = CannedBenchmark([time + 0.1 for time in empty_cpu], empty_cpu, max_spread=0.05)
+    result = asyncio.run(benchmark.run(""))
+    assert result.time == pytest.approx(0.1)
+    assert result.time_spread == pytest.approx(0.0)
+
+
+def test_run_rejects_times_within_the_noise():
+    """A solution not measurably slower than an empty program is not ranked."""
+    empty_cpu = [0.02, 0.03, 0.04, 0.05, 0.06]
+    benchmark = CannedBenchmark([time + 0.01 for time in empty_cpu], empty_cpu, max_spread=1)
+    assert asyncio.run(benchmark.run("")) is None
+
+
+def test_harness_pairs_every_run(measure):
+    """The harness reports every timed run of both programs."""
+    result = measure("sum(range(1000))", warmup=1, repeat=4)
+    assert len(result["cpu"]) == len(result["empty_cpu"]) == 4
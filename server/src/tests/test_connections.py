@@ -0,0 +1,112 @@
+import asyncio
+
+from fastapi import status
+
+
+def test_caps_connections_per_user(main, websocket):
+    """A user's connection past the per-user cap is closed with 1008."""
+    manager = main.ConnectionManager(max_user_connections=2, max_connections=10)
+    sockets = [websocket() for _ in range(3)]
+    connections = [asyncio.run(manager.connect(socket, "alice")) for socket in sockets]
+
+    assert connections[2] is None
+    assert sockets[2].close_code == status.WS_1008_POLICY_VIOLATION
+    assert manager.counters["connections_rejected_user"] == 1
+    assert asyncio.run(manager.connect(websocket(), "bob")) is not None
+
+
+def test_caps_connections_in_total(main, websocket):
+    """A connection past the global cap is closed with 1013."""
+    manager = main.ConnectionManager(max_user_connections=5, max_connections=2)
+    asyncio.run(manager.connect(websocket(), "alice"))
+    asyncio.run(manager.connect(websocket(), "bob"))
+    socket = websocket()
+
+    assert asyncio.run(manager.connect(socket, "carol")) is None
+    assert socket.close_code == status.WS_1013_TRY_AGAIN_LATER
+    assert manager.counters["connections_rejected_global"] == 1
+
+
+def test_disconnect_frees_the_slot(main, websocket):
+    """A user can connect again once one of their connections left."""
+    manager = main.ConnectionManager(max_user_connections=1)
+    connection = asyncio.run(manager.connect(websocket(), "alice"))
+    manager.disconnect(connection)
+
+    assert "alice" not in manager.user_connections
+    assert asyncio.run(manager.connect(websocket(), "alice")) is not None
+
+
+def test_throttled_edit_resyncs_once(main, websocket, monkeypatch):
+    """An edit past the edit budget resyncs the sender, once."""
+    manager = main.ConnectionManager(message_rate=0, message_burst=10, edit_rate=0, edit_burst=1)
+    monkeypatch.setattr(main, "manager", manager)
+    edit = {"op": main.WebsocketConnection.EDIT, "data": {"level": 1, "ops": []}}
+    socket = websocket([{"op": main.WebsocketConnection.SNAPSHOT, "data": {"level": 1}}, edit, edit, edit])
+    connection = asyncio.run(manager.connect(socket, "alice"))
+
+    for _ in range(4):
+        asyncio.run(connection.listen())
+
+    resyncs = [message for message in socket.sent if message["op"] == main.WebsocketConnection.RESYNC]
+    assert resyncs == [{"op": main.WebsocketConnection.RESYNC, "data": {"level": 1, "reason": "throttled"}}]
+    assert connection.resyncing
+    assert manager.counters["messages_limited"] == 2
+
+
+def test_chat_does_not_use_the_edit_budget(main, websocket, monkeypatch):
+    """Chat messages past their budget leave the edits alone."""
+    manager = main.ConnectionManager(message_rate=0, message_burst=1, edit_rate=0, edit_burst=1)
+    monkeypatch.setattr(main, "manager", manager)
+    socket = websocket(
+        [
+            {"op": main.WebsocketConnection.SNAPSHOT, "data": {"level": 1}},
+            {"op": main.WebsocketConnection.SNAPSHOT, "data": {"level": 1}},
+            {"op": main.WebsocketConnection.EDIT, "data": {"level": 1, "ops": [["i", [[5, 1]], "a"]]}},
+        ]
+    )
+    connection = asyncio.run(manager.connect(socket, "alice"))
+
+    for _ in range(3):
+        asyncio.run(connection.listen())
+
+    assert manager.counters["messages_limited"] == 1
+    assert not connection.resyncing
+    assert manager.rooms[1].document == {((5, 1),): "a"}
+
+
+def test_is_admin_rejects_non_ascii_tokens(main, monkeypatch):
+    """Tokens are compared as bytes, so any text can be checked."""
+    monkeypatch.setattr(main, "admin_token", "secret")
+    assert main.is_admin("secret")
+    assert not main.is_admin("sécret")
+
+
+def test_run_is_cancelled_when_the_client_left(main, websocket, monkeypatch):
+    """A run whose output cannot be sent is cancelled instead of failing."""
+    manager = main.ConnectionManager()
+    monkeypatch.setattr(main, "manager", manager)
+    outputs = []
+
+    async def run(code, on_output):
+        for _ in range(3):
+            outputs.append(code)
+            await on_output(code)
+            await asyncio.sleep(0)
+
+    async def closed(message):
+        raise RuntimeError("Cannot call send once a close message has been sent.")
+
+    async def execute():
+        connection = await manager.connect(websocket(), "alice")
+        connection.ws.send_json = closed
+        connection.start_run({"run": 1, "code": "print()"})
+        await asyncio.gather(connection.run, return_exceptions=True)
+        return connection.run
+
+    monkeypatch.setattr(main.executor, "run", run)
+    task = asyncio.run(execute())
+
+    assert task.cancelled()
+    assert outputs == ["print()"]
+    assert manager.counters["messages_undelivered"] == 1
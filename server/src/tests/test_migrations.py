@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+from app import migrations, models
+from app.database import ShardRouter
+from sqlalchemy import create_engine, inspect
+
+
+@pytest.fixture(params=list(migrations.MIGRATIONS))
+def schema(request):
+    """Every schema of the database files."""
+    return request.param
+
+
+@pytest.fixture
+def engine(schema):
+    """A scratch database migrated to the latest version of the schema."""
+    engine = create_engine("sqlite://")
+    migrations.migrate(engine, schema)
+    return engine
+
+
+def test_hot_queries_use_indexes(engine, schema):
+    """No hot query is planned as a full table scan."""
+    migrations.check_query_plans(engine, schema)
+
+
+def test_migrations_match_the_models(engine):
+    """Every table of the models that a schema has ends up with all of its columns."""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    for table in models.Base.metadata.sorted_tables:
+        if table.name in tables:
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            assert columns == {column.name for column in table.columns}, table.name
+
+
+def test_unsharded_messages_are_imported_once(tmp_path):
+    """Changing the amount of shards does not copy the main database's messages again."""
+    main = str(tmp_path / "main.db")
+    migrations.migrate(create_engine(f"sqlite:///{main}"), migrations.MAIN)
+    with sqlite3.connect(main) as connection:
+        connection.executemany(
+            "INSERT INTO messages (author, level, content, created_at) VALUES ('alice', ?, 'hello', 0)",
+            [(level,) for level in range(4)],
+        )
+    solutions = create_engine(f"sqlite:///{tmp_path / 'solutions.db'}")
+    migrations.migrate(solutions, migrations.SOLUTIONS)
+
+    counts = []
+    for shards in (2, 4):
+        router = ShardRouter(str(tmp_path), chat_shards=shards)
+        for engine in router.chat_engines:
+            migrations.migrate(engine, migrations.CHAT)
+        migrations.import_unsharded(main, solutions, router)
+        router.dispose()
+        count = "SELECT COUNT(*) FROM messages"
+        counts.append([sqlite3.connect(path).execute(count).fetchone()[0] for path in router.chat_paths])
+
+    assert counts == [[2, 2], [2, 2, 0, 0]]
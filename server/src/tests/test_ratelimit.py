@@ -0,0 +1,42 @@
+import pytest
+from app import ratelimit
+from app.ratelimit import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the monotonic clock of the token bucket."""
+    now = [0.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_allows_a_burst_of_capacity(clock):
+    """A full bucket allows `capacity` actions at once."""
+    bucket = TokenBucket(1, 3)
+    assert [bucket.consume() for _ in range(4)] == [True, True, True, False]
+
+
+def test_refills_at_rate(clock):
+    """An empty bucket gets `rate` tokens back per second."""
+    bucket = TokenBucket(2, 2)
+    assert bucket.consume() and bucket.consume()
+    assert not bucket.consume()
+
+    clock[0] += 0.5
+    assert bucket.consume()
+    assert not bucket.consume()
+
+
+def test_does_not_refill_past_capacity(clock):
+    """Idle time does not allow a burst larger than `capacity`."""
+    bucket = TokenBucket(10, 2)
+    clock[0] += 60
+    assert [bucket.consume() for _ in range(3)] == [True, True, False]
+
+
+def test_failed_consume_keeps_tokens(clock):
+    """Asking for more tokens than there are takes none."""
+    bucket = TokenBucket(1, 2)
+    assert not bucket.consume(3)
+    assert bucket.consume(2)
@@ -0,0 +1,35 @@
+import sqlite3
+
+import pytest
+from app import migrations
+from app.database import ShardRouter
+from app.search import MessageIndex, SearchTimeout
+from sqlalchemy import create_engine
+
+
+@pytest.fixture
+def router(tmp_path):
+    """A single migrated chat shard with 2000 messages, the newest have the highest number."""
+    router = ShardRouter(str(tmp_path), chat_shards=1)
+    migrations.migrate(create_engine(f"sqlite:///{router.chat_paths[0]}"), migrations.CHAT)
+    with sqlite3.connect(router.chat_paths[0]) as connection:
+        connection.executemany(
+            "INSERT INTO messages (author, level, content, created_at) VALUES (?, ?, ?, ?)",
+            [("user", None, f"hello {number}", number) for number in range(2000)],
+        )
+    return router
+
+
+def test_search_ranks_the_newest_candidates(router):
+    """Only the newest matches are ranked."""
+    index = MessageIndex(router)
+    index.MAX_CANDIDATES = 10
+    results = index.search("hello", per_page=50)
+    assert sorted(row["created_at"] for row in results) == list(range(1990, 2000))
+
+
+def test_search_stops_at_the_deadline(router):
+    """A search past its deadline is interrupted, the next one runs again."""
+    with pytest.raises(SearchTimeout):
+        MessageIndex(router, timeout=-1).search("hello")
+    assert len(MessageIndex(router).search("hello")) == 20
@@ -0,0 +1,45 @@
+import sqlite3
+
+import pytest
+from app.similarity import SCHEMA, SimilarityIndex
+
+SOLUTION = """\
+def solve(numbers, target):
+    seen = {}
+    for index, number in enumerate(numbers):
+        if target - number in seen:
+            return seen[target - number], index
+        seen[number] = index
+"""
+
+
+@pytest.fixture
+def index(tmp_path):
+    """An empty similarity index reading at most 5 solutions per band key."""
+    path = str(tmp_path / "solutions.db")
+    with sqlite3.connect(path) as connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+    return SimilarityIndex(path, max_band_matches=5)
+
+
+def test_finds_renamed_copies(index):
+    """A copy with other names and formatting is a near-duplicate."""
+    index.check(1, 1, SOLUTION)
+    match, score = index.check(2, 2, SOLUTION.replace("numbers", "values").replace("    ", "  "))
+    assert match == 1
+    assert score == pytest.approx(1.0)
+
+
+def test_ignores_own_solutions(index):
+    """Resubmitting a solution does not make it a duplicate of itself."""
+    index.check(1, 1, SOLUTION)
+    assert index.check(2, 1, SOLUTION) == (None, 0.0)
+
+
+def test_reads_the_newest_solutions_of_crowded_bands(index):
+    """Band keys shared by many solutions only yield their newest ones."""
+    for solution_id in range(1, 21):
+        index.check(solution_id, solution_id, SOLUTION)
+    match, _ = index.query(index.signature(SOLUTION), exclude_user=0)
+    assert match in range(16, 21)
@@ -0,0 +1,17 @@
+from app.ratelimit import TokenBucket
+from app.tracing import Tracer
+
+
+def test_continued_traces_are_limited_per_sender(tmp_path):
+    """Only the sender's budget of traces is recorded, invalid contexts do not use it."""
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(str(path), service="server")
+    bucket = TokenBucket(0, 2)
+
+    for context in [{"id": "not hex"}, {"id": "a1"}, {"id": "b2"}, {"id": "c3"}]:
+        with tracer.continue_trace(context, "server.parse", bucket=bucket):
+            pass
+    tracer.close()
+
+    assert [line.count('"trace":"') for line in path.read_text().splitlines()] == [1, 1]
+    assert '"trace":"c3"' not in path.read_text()
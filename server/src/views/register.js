@@ -0,0 +1,18 @@
+const form = document.getElementById("frm");
+
+const elementsList = form.getElementsByTagName('input');
+const elementsArray = [...elementsList];
+
+form.onsubmit = async(e) => {
+    e.preventDefault();
+
+
+    await fetch("http://127.0.0.1:8080/register", {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+            Accept: "application/json"
+        },
+        body: JSON.stringify(Object.assign({}, ...elementsArray.map((i) => ({[i.id]: i.value}))))
+    });
+}